@@ -0,0 +1,266 @@
+"""
+Společné pomůcky benchmarků: syntetický katalog služeb a náhrady síťových služeb.
+
+Benchmarky běží bez sítě a bez OpenAI klíče:
+- synthetic_catalog(): katalog služeb se slovníkem podobným skutečným názvům a popisům,
+- write_synthetic_details(): details JSON ve tvaru datové sady „Detailní popisy služeb veřejné správy“,
+- install_fake_openai(): místo modulu openai podstrčí lokální embeddingy (s volitelnou latencí),
+- install_fake_sources(): místo SPARQL endpointu a details JSON podstrčí store lokální zdroje s latencí,
+- FakeResponsesServer: lokální HTTP náhrada Responses API (latence, chyba 500, zaseknuté volání),
+- open_store(): naimportuje government_services_store zvolené kapitoly a přepne se do dočasné
+  pracovní složky (po skončení se smaže), aby benchmark nepřepsal data kapitoly.
+"""
+
+import atexit
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# Slova, ze kterých se skládají názvy, popisy a klíčová slova syntetických služeb
+WORDS = (
+    "řízení", "žádost", "příspěvek", "dávka", "občanský", "průkaz", "stavební", "povolení", "nemocenské",
+    "pojištění", "dítě", "škola", "odklad", "byt", "nájem", "živnost", "daň", "řidičský", "cestovní", "pas",
+)
+
+EMBEDDING_DIMENSION = 64
+
+
+def synthetic_catalog(count: int, seed: int = 1, description_words: int = 45) -> List[Dict[str, Any]]:
+    """Vrátí `count` služeb ve tvaru JSON cache (stejná pole jako service_to_dict())."""
+    rng = random.Random(seed)
+    vocabulary = [f"{rng.choice(WORDS)} {rng.choice(WORDS)}" for _ in range(2000)]
+    return [
+        {
+            "uri": f"https://rpp-opendata.egon.gov.cz/odrpp/zdroj/služba/S{i}",
+            "id": f"S{i}",
+            "name": " ".join(rng.choice(WORDS) for _ in range(6)),
+            "description": " ".join(rng.choice(WORDS) for _ in range(description_words)),
+            "keywords": [rng.choice(vocabulary) for _ in range(4)],
+            "step_count": 2,
+            "digital_step_count": 1,
+            "channel_types": ["DATOVA_SCHRANKA"],
+        }
+        for i in range(count)
+    ]
+
+
+def write_synthetic_details(path: Path, count: int, seed: int = 1) -> None:
+    """Zapíše details JSON s `count` položkami (16 HTML polí v cs a en, klíčová slova) proudově po položkách.
+
+    Store z každé položky používá jen část polí (DETAILS_FIELDS), zbytek odpovídá polím, která zahazuje.
+    """
+    rng = random.Random(seed)
+    text_fields = (
+        "popis", "jaký-má-služba-benefit", "kde-a-jak-službu-řešit-el", "kdy-službu-řešit", "týká-se-vás-to-pokud",
+        "způsob-vyřízení-el", "kde-a-jak-službu-řešit-os", "co-máte-připravit", "jaké-jsou-poplatky",
+        "na-koho-se-obrátit", "podle-jakého-předpisu", "časté-dotazy", "jak-se-bránit", "sankce", "lhůty",
+        "další-informace",
+    )
+
+    def html(words: int) -> str:
+        return (f"<p>{' '.join(rng.choice(WORDS) for _ in range(words))}</p>\n"
+                f"<ul><li>{' '.join(rng.choice(WORDS) for _ in range(words // 3))}</li></ul>")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"@context": "https://ofn.gov.cz/rpp/2024/context.jsonld", "typ": "Seznam", "položky": [\n')
+        for i in range(count):
+            item: Dict[str, Any] = {
+                "id": f"https://rpp-opendata.egon.gov.cz/odrpp/zdroj/služba/S{i}",
+                "typ": "Služba",
+                "název": {"cs": f"Služba {i}", "en": f"Service {i}"},
+            }
+            for field in text_fields:
+                item[field] = {"cs": html(25), "en": html(25)}
+            item["klíčová-slova"] = [{"cs": rng.choice(WORDS), "en": "keyword"} for _ in range(6)]
+            f.write(("" if i == 0 else ",\n") + json.dumps(item, ensure_ascii=False, indent=2))
+        f.write("\n]}\n")
+
+
+def fake_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    """Deterministický normalizovaný vektor ze slov textu (stejná slova → podobné vektory)."""
+    vector = [0.0] * dimension
+    for word in text.lower().split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dimension] += 1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class FakeEmbeddings:
+    """Náhrada `openai.embeddings`: počítá volání a volitelně čeká `latency` sekund na dávku."""
+
+    def __init__(self, latency: float = 0.0, dimension: int = EMBEDDING_DIMENSION):
+        self.latency = latency
+        self.dimension = dimension
+        self.calls = 0
+
+    def create(self, input: List[str], model: str) -> Any:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        data = [types.SimpleNamespace(embedding=fake_embedding(text, self.dimension)) for text in input]
+        return types.SimpleNamespace(data=data)
+
+
+def install_fake_sources(store_module: types.ModuleType, catalog: List[Dict[str, Any]], fetch_seconds: float = 2.0,
+                         attributes_seconds: float = 1.5, details_seconds: float = 1.0) -> None:
+    """Nahradí zdroje prvního načtení v GovernmentServicesStore lokálními daty se zpožděním.
+
+    Katalog „přichází po síti“ postupně (fetch_seconds rozložené po blocích 1 000 služeb), atributy
+    úkonů a projekce details JSON jsou k dispozici až po attributes_seconds / details_seconds.
+    """
+    store_class = store_module.GovernmentServicesStore
+    chunks = max(1, len(catalog) // 1000)
+
+    def iter_services():
+        for i, item in enumerate(catalog):
+            if i % 1000 == 0:
+                time.sleep(fetch_seconds / chunks)
+            yield store_module.GovernmentService(uri=item["uri"], id="", name=item["name"],
+                                                 description=item["description"], keywords=[])
+
+    def fetch_attributes():
+        time.sleep(attributes_seconds)
+        return {item["id"]: (2, 1, ["DATOVA_SCHRANKA"]) for item in catalog}
+
+    def read_details():
+        time.sleep(details_seconds)
+        return {item["id"]: {"popis": {"cs": "Podrobný popis služby. " * 20}, "klíčová-slova": [{"cs": k} for k in item["keywords"]]}
+                for item in catalog}
+
+    store_class._iter_services_from_external_store = staticmethod(iter_services)
+    store_class._fetch_services_attributes = staticmethod(fetch_attributes)
+    store_class._read_details_index = staticmethod(read_details)
+
+
+def install_fake_openai(embedding_latency: float = 0.0, dimension: int = EMBEDDING_DIMENSION) -> types.ModuleType:
+    """Podstrčí store místo modulu openai lokální náhradu (store ho používá přes _lazy_import("openai"))."""
+    module = types.ModuleType("openai")
+    module.api_key = None
+    module.embeddings = FakeEmbeddings(embedding_latency, dimension)
+    sys.modules["openai"] = module
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    return module
+
+
+class FakeResponsesServer:
+    """
+    Lokální náhrada Responses API (POST /v1/responses) pro posuzování relevance služeb po jedné.
+
+    Každé volání čeká `latency` sekund a odpoví TRUE pro sudé a FALSE pro liché číslo v názvu služby
+    („Služba 12“) z poslední zprávy. Služby z `fail_once` dostanou na první pokus chybu 500 (SDK volání
+    zopakuje), služby z `hang` čekají `hang_seconds` (volání vyprší). Počítá volání a nejvyšší souběh.
+
+    Používání:
+        with FakeResponsesServer(latency=0.3) as server:
+            ...AsyncOpenAI / OpenAI mají base_url nastavenou na server.base_url...
+            server.requests, server.peak_concurrency
+    """
+
+    def __init__(self, latency: float = 0.3, fail_once: Iterable[int] = (), hang: Iterable[int] = (),
+                 hang_seconds: float = 5.0):
+        self.latency = latency
+        self.fail_once = set(fail_once)
+        self.hang = set(hang)
+        self.hang_seconds = hang_seconds
+        self.requests = 0
+        self.peak_concurrency = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def __enter__(self) -> "FakeResponsesServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, body: Dict[str, Any]) -> tuple:
+        """Vrátí (HTTP status, tělo odpovědi) pro jedno volání responses.create."""
+        with self._lock:
+            self.requests += 1
+            self._active += 1
+            self.peak_concurrency = max(self.peak_concurrency, self._active)
+            request_number = self.requests
+        try:
+            match = re.search(r"Služba (\d+)", body["input"][-1]["content"])
+            number = int(match.group(1)) if match else 0
+            with self._lock:
+                failing = number in self.fail_once
+                self.fail_once.discard(number)
+            if failing:
+                return 500, {"error": {"message": "injected failure", "type": "server_error"}}
+            time.sleep(self.hang_seconds if number in self.hang else self.latency)
+            text = "TRUE" if number % 2 == 0 else "FALSE"
+            return 200, {
+                "id": f"resp_{request_number}", "object": "response", "created_at": 0, "model": body.get("model", ""),
+                "status": "completed", "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+                "output": [{"type": "message", "id": f"msg_{request_number}", "status": "completed", "role": "assistant",
+                            "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+                "usage": {"input_tokens": 400, "output_tokens": 1, "total_tokens": 401,
+                          "input_tokens_details": {"cached_tokens": 256}, "output_tokens_details": {"reasoning_tokens": 0}},
+            }
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                status, payload = server._respond(body)
+                data = json.dumps(payload).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):  # klient po vypršení spojení zavřel
+                    pass
+
+        return Handler
+
+
+def open_store(chapter: str) -> types.ModuleType:
+    """Naimportuje government_services_store dané kapitoly a přejde do prázdné dočasné složky.
+
+    Store pracuje s relativními cestami (data/...), takže se cache a Chroma benchmarku vytvoří v dočasné složce.
+    """
+    sys.path.insert(0, str(REPO_DIR / chapter))
+    new_workdir()
+    import government_services_store
+    return government_services_store
+
+
+def new_workdir() -> Path:
+    """Přejde do nové prázdné dočasné složky s podsložkou data/ (po skončení benchmarku se smaže)."""
+    workdir = tempfile.mkdtemp(prefix="gs-benchmark-")
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    os.chdir(workdir)
+    os.makedirs("data")
+    return Path(workdir)
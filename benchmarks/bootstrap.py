@@ -0,0 +1,120 @@
+"""
+Benchmark startu store: paměť načteného katalogu na službu, doba startu a studené první načtení.
+
+Výchozí režim do JSON cache v dočasné složce zapíše syntetický katalog (100 000 služeb) a změří:
+1) "JSON cache" – první start z JSON cache (při něm se zapíše i binární snapshot),
+2) "snapshot" – každý další start, kdy se služby čtou ze snapshotu přes mmap.
+U obou vypíše, kolik bajtů na službu po načtení zůstane v paměti (tracemalloc), špičku paměti a čas.
+
+Režim --cold měří první načtení bez cache (5 000 služeb): SPARQL, details JSON a embedding API
+nahrazují lokální zdroje se zpožděním (viz _fakes.install_fake_sources()). Porovná postupné načtení
+po fázích (stažení → doplnění → embeddingy → zápis) s proudovou pipeline v load_services().
+Čas se měří bez tracemalloc, špička paměti v samostatném běhu s ním.
+
+Spuštění z kořene repozitáře (síť ani OpenAI klíč nejsou potřeba):
+    python benchmarks/bootstrap.py [--services N] [--chapter kapitola-12]
+    python benchmarks/bootstrap.py --cold [--services N] [--embedding-latency 0.4]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import time
+import tracemalloc
+from typing import Tuple
+
+from _fakes import install_fake_openai, install_fake_sources, new_workdir, open_store, synthetic_catalog
+
+
+def measure_load(store_module, label: str, count: int) -> None:
+    """Načte katalog novou instancí store a vypíše paměť na službu, špičku paměti a čas."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    store = store_module.GovernmentServicesStore()
+    with contextlib.redirect_stdout(io.StringIO()):  # Debug výpisy store by měření jen zdržovaly
+        store.load_services()
+        store.get_services_by_keywords(["x"])  # sestaví i index klíčových slov, ten patří k paměti katalogu
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} {current / count:8.0f} B/služba  špička {peak / 2**20:6.0f} MiB  {elapsed:6.2f} s"
+          f"  (snapshot: {'ano' if store._snapshot is not None else 'ne'})")
+    if hasattr(store, "close"):  # kapitoly 7 a 8 close() nemají
+        store.close()
+
+
+def load_in_phases(store) -> None:
+    """První načtení po fázích: celý katalog, pak detaily a atributy, pak všechny embeddingy, nakonec cache."""
+    services = list(store._iter_services_from_external_store())
+    details = store._get_details_index()
+    attributes = store._fetch_services_attributes()
+    for service in services:
+        if service.id in details:
+            store._apply_service_details(service, details[service.id])
+        store._apply_service_attributes(service, attributes)
+        store.add_service(service)
+    store._compute_services_embeddings()
+    store._store_services_to_local_cache()
+
+
+def cold_load(store_module, phased: bool) -> Tuple[float, int]:
+    """Provede první načtení do prázdné složky; vrátí dobu načtení a počet embeddingů v Chroma."""
+    workdir = new_workdir()
+    store_module.CHROMA_PATH = workdir / "data" / "chromadb"  # Chroma sdílí klienta podle cesty
+    gc.collect()
+    started = time.perf_counter()
+    store = store_module.GovernmentServicesStore()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if phased:
+            load_in_phases(store)
+        else:
+            store.load_services()
+    elapsed = time.perf_counter() - started
+    embedded = store.get_services_embedding_statistics()["total_embeddings"]
+    if hasattr(store, "close"):
+        store.close()
+    return elapsed, embedded
+
+
+def measure_cold(store_module, label: str, count: int, phased: bool) -> None:
+    """Změří první načtení: čas v běhu bez tracemalloc, špičku paměti v dalším běhu s ním."""
+    elapsed, embedded = cold_load(store_module, phased)
+    tracemalloc.start()
+    cold_load(store_module, phased)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed:6.2f} s  špička {peak / 2**20:5.0f} MiB  ({embedded} embeddingů z {count})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cold", action="store_true", help="měřit první načtení bez cache")
+    parser.add_argument("--services", type=int, help="počet syntetických služeb (výchozí 100 000, s --cold 5 000)")
+    parser.add_argument("--embedding-latency", type=float, default=0.4, help="zpoždění (s) jednoho volání embedding API")
+    parser.add_argument("--chapter", default="kapitola-12", help="kapitola, jejíž store se měří")
+    args = parser.parse_args()
+
+    store_module = open_store(args.chapter)
+    if args.cold:
+        count = args.services or 5_000
+        catalog = synthetic_catalog(count, description_words=150)
+        install_fake_openai(embedding_latency=args.embedding_latency)
+        install_fake_sources(store_module, catalog)
+        print(f"{args.chapter}: první načtení {count} služeb")
+        measure_cold(store_module, "po fázích", count, phased=True)
+        measure_cold(store_module, "pipeline", count, phased=False)
+        return
+
+    count = args.services or 100_000
+    store_module.write_cache(store_module.SERVICES_CACHE, synthetic_catalog(count))
+    gc.collect()
+
+    print(f"{args.chapter}: {count} služeb")
+    measure_load(store_module, "JSON cache", count)
+    measure_load(store_module, "snapshot", count)
+
+
+if __name__ == "__main__":
+    main()
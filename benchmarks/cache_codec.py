@@ -0,0 +1,87 @@
+"""
+Benchmark kodeků souborových cache (CACHE_CODEC): json, orjson a orjson-gzip.
+
+Pro každý druh cache, kterou store zapisuje (seznam služeb, projekce details JSON, kroky služeb,
+embeddingy dotazů), zapíše a přečte syntetická data přes write_cache() / read_cache() a vypíše
+medián doby zápisu a čtení (z 5 běhů), velikost souboru a špičku paměti při čtení (tracemalloc).
+
+Spuštění z kořene repozitáře:
+    python benchmarks/cache_codec.py [--services 35000] [--chapter kapitola-12]
+"""
+
+import argparse
+import base64
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from array import array
+from pathlib import Path
+from typing import Any, Dict
+
+from _fakes import open_store, synthetic_catalog, write_synthetic_details
+
+CODECS = ("json", "orjson", "orjson-gzip")
+
+
+def synthetic_datasets(store_module, services: int) -> Dict[str, Any]:
+    """Připraví data ve tvaru jednotlivých cache store."""
+    details_path = Path("data/details-sample.json")
+    write_synthetic_details(details_path, 3300)
+    items = store_module._iter_json_array_items(details_path, "položky")
+    details = dict(filter(None, map(store_module._project_details_item, items)))
+    details_path.unlink()
+
+    rng = random.Random(0)
+    catalog = synthetic_catalog(services)
+    return {
+        f"služby {services // 10}": catalog[:services // 10],
+        f"služby {services}": catalog,
+        "detaily 3300": {"source": {"size": 0}, "items": details},
+        "kroky 1500": {f"S{i}": [f"Podání žádosti {j}: popis kroku služby " * 3 for j in range(3)] for i in range(1500)},
+        "embeddingy 500": [
+            [f"text-embedding-3-small\ndotaz {i}",
+             base64.b64encode(array("f", [rng.uniform(-0.1, 0.1) for _ in range(1536)]).tobytes()).decode()]
+            for i in range(500)
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--services", type=int, default=35_000, help="počet služeb ve větší cache seznamu služeb")
+    parser.add_argument("--chapter", default="kapitola-12", help="kapitola, jejíž store se měří")
+    args = parser.parse_args()
+
+    store_module = open_store(args.chapter)
+    storage_module = __import__("government_services_storage")  # CACHE_CODEC čtou funkce cache odsud
+    datasets = synthetic_datasets(store_module, args.services)
+
+    print(f"{'cache':<15} {'kodek':<12} {'zápis':>9} {'čtení':>9} {'soubor':>9} {'špička čtení':>13}")
+    for name, data in datasets.items():
+        path = Path("data") / f"{name.replace(' ', '_')}.json"
+        for codec in CODECS:
+            storage_module.CACHE_CODEC = codec
+            store_times, load_times = [], []
+            for _ in range(5):
+                started = time.perf_counter()
+                written = store_module.write_cache(path, data)
+                store_times.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                store_module.read_cache(path)
+                load_times.append(time.perf_counter() - started)
+            tracemalloc.start()
+            loaded = store_module.read_cache(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if loaded != data:
+                raise SystemExit(f"{name} / {codec}: přečtená data se liší od zapsaných.")
+            print(f"{name:<15} {codec:<12} {statistics.median(store_times) * 1000:6.1f} ms "
+                  f"{statistics.median(load_times) * 1000:6.1f} ms {os.path.getsize(written) / 1e6:6.2f} MB "
+                  f"{peak / 2**20:9.1f} MiB")
+            written.unlink()
+
+
+if __name__ == "__main__":
+    main()
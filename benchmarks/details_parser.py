@@ -0,0 +1,73 @@
+"""
+Benchmark čtení details JSON: načtení celého souboru přes json.load vs. proudové čtení po položkách.
+
+Vygeneruje syntetický details JSON (výchozí 33 000 položek, ~400 MB, tedy zhruba desetinásobek skutečné
+datové sady) a pro každý způsob čtení vypíše čas, špičku paměti a paměť, která zůstane v projekci (tracemalloc):
+1) json.load celého souboru a projekce položek (původní načtení),
+2) proudové čtení po položkách (_iter_json_array_items()) a projekce, jak je čte store při prvním startu,
+3) projekce uložená v DETAILS_CACHE, ze které store čte při dalších startech.
+Obě první varianty musí vrátit stejnou projekci.
+
+Spuštění z kořene repozitáře:
+    python benchmarks/details_parser.py [--items 33000] [--chapter kapitola-12]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from _fakes import open_store, write_synthetic_details
+
+
+def measure(label: str, read: Callable[[], Dict[str, dict]]) -> Dict[str, dict]:
+    """Zavolá `read`, vypíše čas, špičku paměti a paměť držené projekce a projekci vrátí."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        details_index = read()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {elapsed:6.2f} s  špička {peak / 2**20:6.0f} MiB  projekce {current / 2**20:5.0f} MiB")
+    return details_index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=33_000, help="počet položek details JSON")
+    parser.add_argument("--chapter", default="kapitola-12", help="kapitola, jejíž store se měří")
+    args = parser.parse_args()
+
+    store_module = open_store(args.chapter)
+    details_path = store_module.DETAILS_PATH
+    write_synthetic_details(details_path, args.items)
+    print(f"{args.chapter}: {args.items} položek, {details_path.stat().st_size / 1e6:.0f} MB")
+
+    def read_whole() -> Dict[str, dict]:
+        with open(details_path, encoding="utf-8") as f:
+            items = json.load(f)["položky"]
+        return dict(filter(None, map(store_module._project_details_item, items)))
+
+    def read_streamed() -> Dict[str, dict]:
+        items = store_module._iter_json_array_items(details_path, "položky")
+        return dict(filter(None, map(store_module._project_details_item, items)))
+
+    whole = measure("json.load", read_whole)
+    streamed = measure("proudově po položkách", read_streamed)
+    if whole != streamed:
+        raise SystemExit("Projekce z json.load a z proudového čtení se liší.")
+    whole = streamed = None
+
+    store_module.GovernmentServicesStore._read_details_index()  # první čtení zapíše DETAILS_CACHE
+    measure("projekce z DETAILS_CACHE", store_module.GovernmentServicesStore._read_details_index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark dotazů do Chroma: plný index vs. CHROMA_LEAN_INDEX a výchozí `include` vs. jen ID se vzdálenostmi.
+
+Pro oba režimy indexu postaví store nad syntetickým katalogem (výchozí 3 500 služeb, popisy ~1,5 kB,
+vektory 1536 hodnot jako u text-embedding-3-small) kolekci v Chroma a změří:
+1) velikost složky Chroma na disku,
+2) dobu a alokace dotazu s výchozím `include` (dokumenty + metadata + vzdálenosti) a s include=["distances"],
+   které používá search_services(),
+3) výpis všech ID v kolekci: get() vs. get(include=[]), které používá _embed_services_into().
+
+Spuštění z kořene repozitáře (síť ani OpenAI klíč nejsou potřeba):
+    python benchmarks/lean_query.py [--services 3500] [--queries 200] [--chapter kapitola-12]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+import tracemalloc
+
+from _fakes import fake_embedding, install_fake_openai, new_workdir, open_store, synthetic_catalog
+
+DIMENSION = 1536
+
+
+def directory_size(path: str) -> int:
+    """Součet velikostí souborů ve složce (včetně podsložek)."""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def measure_query(collection, include, queries: int) -> None:
+    """Vypíše průměrnou dobu dotazu (10 výsledků) a špičku alokací jednoho dotazu."""
+    vectors = [fake_embedding(f"řízení žádost dávka {i}", DIMENSION) for i in range(queries)]
+    for vector in vectors[:3]:  # zahřátí (načtení HNSW indexu z disku)
+        collection.query(query_embeddings=[vector], n_results=10, include=include)
+    started = time.perf_counter()
+    for vector in vectors:
+        collection.query(query_embeddings=[vector], n_results=10, include=include)
+    elapsed = (time.perf_counter() - started) / queries
+    tracemalloc.start()
+    collection.query(query_embeddings=[vectors[0]], n_results=10, include=include)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  include={include}: {elapsed * 1000:.2f} ms/dotaz, alokace {peak / 1024:.0f} KiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--services", type=int, default=3500, help="počet syntetických služeb")
+    parser.add_argument("--queries", type=int, default=200, help="počet měřených dotazů")
+    parser.add_argument("--chapter", default="kapitola-12", help="kapitola, jejíž store se měří")
+    args = parser.parse_args()
+
+    store_module = open_store(args.chapter)
+    install_fake_openai(dimension=DIMENSION)
+    catalog = synthetic_catalog(args.services, description_words=200)
+
+    for lean in (False, True):
+        workdir = new_workdir()
+        store_module.CHROMA_LEAN_INDEX = lean
+        # Chroma sdílí klienta podle cesty – každý režim proto dostane vlastní absolutní cestu
+        store_module.CHROMA_PATH = workdir / "data" / "chromadb"
+        store_module.write_cache(store_module.SERVICES_CACHE, catalog)
+        store = store_module.GovernmentServicesStore()
+        with contextlib.redirect_stdout(io.StringIO()):  # Debug výpisy store
+            store.load_services()
+            store._compute_services_embeddings()
+        collection = store._collection
+
+        print(f"{'CHROMA_LEAN_INDEX=1' if lean else 'plný index'}: Chroma na disku "
+              f"{directory_size(str(store_module.CHROMA_PATH)) / 1e6:.0f} MB")
+        measure_query(collection, ["metadatas", "documents", "distances"], args.queries)
+        measure_query(collection, ["distances"], args.queries)
+        started = time.perf_counter()
+        collection.get()
+        full_get = time.perf_counter() - started
+        started = time.perf_counter()
+        collection.get(include=[])
+        ids_get = time.perf_counter() - started
+        print(f"  výpis všech ID: get() {full_get * 1000:.0f} ms, get(include=[]) {ids_get * 1000:.0f} ms")
+        if hasattr(store, "close"):  # kapitoly 7 a 8 close() nemají
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark posuzování relevance služeb po jedné (POSUZOVAT_PO_JEDNE) v main.py kapitol 9 a 10.
+
+Volá filtruj_relevantni_sluzby() z main.py proti lokální náhradě Responses API (FakeResponsesServer
+s latencí volání, výchozí 40 kandidátů po 300 ms) a porovná:
+1) postupné posouzení (SOUBEZNA_POSOUZENI = 1, tedy jedno volání po druhém),
+2) souběžné posouzení s limitem SOUBEZNA_POSOUZENI (výchozí 8),
+3) totéž s poruchami: jedno volání skončí chybou 500 (SDK ho zopakuje) a jedno se zasekne
+   (vyprší po TIMEOUT_POSOUZENI = 1 s i po opakování a služba se vynechá).
+U každého běhu vypíše čas, počet volání, nejvyšší souběh na serveru a zda verdikty odpovídají kandidátům.
+
+Store se při posuzování nepoužívá, main.py proto dostane místo něj nečinnou náhradu; cache verdiktů
+kapitoly 10 je vypnutá (RELEVANCE_CACHE_TTL=0), aby každý běh volal model.
+
+Spuštění z kořene repozitáře (síť ani OpenAI klíč nejsou potřeba):
+    python benchmarks/relevance.py [--services 40] [--latency 0.3] [--limit 8] [--chapter kapitola-10]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import time
+import types
+from typing import Dict
+
+from _fakes import REPO_DIR, FakeResponsesServer, open_store
+
+
+class IdleStore:
+    """Náhrada GovernmentServicesStore pro načtení main.py: nic nenačítá a nic nevrací."""
+
+    def load_services(self) -> None:
+        pass
+
+    def warm_up(self, background: bool = True) -> None:
+        pass
+
+    def get_services_embedding_statistics(self) -> Dict[str, int]:
+        return {"total_services": 0, "total_embeddings": 0, "coverage_percentage": 0}
+
+
+def load_main(chapter: str) -> types.ModuleType:
+    """Naimportuje main.py kapitoly s nečinným store (hlavní smyčka se nespustí, __name__ není "__main__")."""
+    store_module = open_store(chapter)
+    store_module.GovernmentServicesStore = IdleStore
+    spec = importlib.util.spec_from_file_location("relevance_main", REPO_DIR / chapter / "main.py")
+    main_module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(main_module)
+    main_module.POSUZOVAT_PO_JEDNE = True
+    return main_module
+
+
+def measure(main_module, label: str, services: int, server: FakeResponsesServer, **settings) -> None:
+    """Posoudí `services` kandidátů s danými konstantami main.py a vypíše výsledek běhu."""
+    for name, value in settings.items():
+        setattr(main_module, name, value)
+    candidates = {
+        f"S{i}": types.SimpleNamespace(id=f"S{i}", name=f"Služba {i}", description="Podrobný popis služby. " * 20)
+        for i in range(services)
+    }
+    expected = [f"S{i}" for i in range(0, services, 2) if i not in server.hang]
+    server.requests = server.peak_concurrency = 0
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as output:  # výpisy verdiktů a spotřeby tokenů
+        relevant = main_module.filtruj_relevantni_sluzby(candidates, "Jsem OSVČ a jsem nemocný. Můžete mi pomoct?")
+    elapsed = time.perf_counter() - started
+    failed = output.getvalue().count("posouzení selhalo")
+    print(f"{label:<32} {elapsed:6.2f} s  volání na serveru {server.requests:3d}  souběh {server.peak_concurrency:2d}"
+          f"  selhalo {failed}  verdikty {'v pořádku' if list(relevant) == expected else 'NESOUHLASÍ'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--services", type=int, default=40, help="počet posuzovaných kandidátů")
+    parser.add_argument("--latency", type=float, default=0.3, help="zpoždění (s) jednoho volání Responses API")
+    parser.add_argument("--limit", type=int, default=8, help="SOUBEZNA_POSOUZENI pro souběžné běhy")
+    parser.add_argument("--chapter", default="kapitola-10", choices=("kapitola-09", "kapitola-10"),
+                        help="kapitola, jejíž main.py se měří")
+    args = parser.parse_args()
+
+    os.environ["RELEVANCE_CACHE_TTL"] = "0"
+    with FakeResponsesServer(latency=args.latency) as server:
+        os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        main_module = load_main(args.chapter)
+        print(f"{args.chapter}: {args.services} kandidátů, {args.latency * 1000:.0f} ms na volání")
+        measure(main_module, "postupně", args.services, server, SOUBEZNA_POSOUZENI=1)
+        measure(main_module, f"souběžně (limit {args.limit})", args.services, server, SOUBEZNA_POSOUZENI=args.limit)
+        server.fail_once, server.hang = {3}, {7}
+        measure(main_module, f"souběžně s poruchami (limit {args.limit})", args.services, server,
+                TIMEOUT_POSOUZENI=1.0, OPAKOVANI_POSOUZENI=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,346 @@
 """
-Government Services Store - jednoduché in-memory úložiště pro specifikace služeb veřejné správy.
+Government Services Store - úložiště služeb veřejné správy pro RAG: katalog, vyhledávání a kontext pro LLM.
 
-Co se v souboru naučíte:
-1) Jak načíst data služeb (SPARQL → volitelně uložit/číst z lokální cache).
-2) Jak doplnit podrobnosti z lokálního JSON souboru (čištění HTML, klíčová slova).
-3) Jak spočítat vektorové reprezentace (embeddings) pro sémantické vyhledávání.
-4) Jak pracovat s vektorovým indexem (Chroma) a dotazem „najdi podobné služby“.
+Co v souboru najdete:
+1) Jak načíst katalog služeb (lokální cache → SPARQL endpoint) a doplnit ho z details JSON (čištění HTML, klíčová slova).
+2) Jak spočítat embeddingy a vyhledávat v Chroma – sémanticky, případně předfiltrovaně klíčovými slovy a atributy služeb.
+3) Jak k nalezeným službám získat detaily a kroky (úkony) a složit z nich XML kontext <sluzby> v rozpočtu tokenů.
+4) Jak store připravit na pozadí (warm_up()), aby šlo obsluhovat uživatele už během načítání.
+
+Jak se služby ukládají na disk (datový model GovernmentService, souborové cache, binární snapshot), řeší
+úložná vrstva společná pro kapitoly 7–12 v shared/government_services_storage.py. Tamtéž je i první (studené)
+načtení katalogu jako pipeline s žurnálem a správa vektorových indexů po embedding modelech.
+GovernmentServicesStore z ní dědí; pro pochopení RAGu ji číst nemusíte.
+
+Těžké závislosti (openai, chromadb, dotenv, tokenizers) se importují až při prvním použití, takže samotný
+import modulu a načtení služeb z lokální cache jsou rychlé. Kam čas při startu padl, ukáže
+get_startup_report() (podrobný rozpis importů pak `python -X importtime main.py`).
 """
 
-from typing import List, Dict, Optional, Tuple, Any
-from dataclasses import dataclass
+import time
+
+_MODULE_IMPORT_STARTED = time.perf_counter()
+
+from typing import List, Dict, Optional, Tuple, Any, Iterable, Iterator, Set, Callable, Union
+from dataclasses import dataclass, replace
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as _wait_futures
+import base64
+import csv
+import html
+import importlib
+import io
 import re
-from urllib.parse import urlparse
-from rdflib import Graph
+import sys
+import threading
+import types
+import urllib.request
+from urllib.parse import urlencode
+from xml.sax.saxutils import escape as _xml_escape
 import json
 import os
 from pathlib import Path
-import openai
-import chromadb
-from dotenv import load_dotenv
+
+# Úložná vrstva (datový model služby, souborové cache, snapshot) je společná pro kapitoly 7–12 ve složce shared/
+_SHARED_DIR = str(Path(__file__).resolve().parent.parent / "shared")
+if _SHARED_DIR not in sys.path:
+    sys.path.insert(0, _SHARED_DIR)
+
+from government_services_storage import (
+    BOOTSTRAP_JOURNAL, CHROMA_PATH, EMBEDDING_BATCH_SIZE, EMBEDDINGS_MODEL, SERVICES_CACHE, SERVICES_SNAPSHOT,
+    SERVICE_URI_PREFIX, GovernmentService, GovernmentServicesStorage, cache_file, cache_is_valid, catalog_version,
+    extract_id_from_uri, intern_strings, read_cache, service_to_dict, write_cache, write_json_atomic,
+)
 
 # Konfigurace důležitých voleb na jednom místě:
-# - EMBEDDINGS_MODEL: název embedding modelu pro výpočet vektorů
-# - CHROMA_PATH: složka s lokálním úložištěm Chroma (vektorová DB)
-# - SERVICES_CACHE: JSON cache se seznamem služeb (rychlé načtení na lekci)
 # - DETAILS_PATH: JSON s detailními informacemi o službách (popisy, klíčová slova)
-EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
-CHROMA_PATH = Path("data/chromadb")
-SERVICES_CACHE = Path("data/government_services_data.json")
+# - DETAILS_FIELDS: pole položek details JSON, která store používá (ostatní se při čtení zahazují)
+# - DETAILS_READ_CHUNK_SIZE: po jak velkých blocích se details JSON čte (v paměti je blok + jedna položka)
+# - SEARCH_CACHE_SIZE: kolik posledních výsledků vyhledávání držet v paměti (0 = cache vypnuta)
+# - CHROMA_LEAN_INDEX: neukládat do Chroma texty dokumentů ani popisy (služby se stejně dohledávají z paměti)
+# - DETAILS_CACHE: projekce details JSON s texty očištěnými od HTML (přepočítá se, když se zdrojový soubor změní)
+# - STEPS_CACHE: kroky služeb stažené ze SPARQL (zahodí se při novém stažení katalogu)
+# - QUERY_EMBEDDINGS_CACHE(_SIZE): embeddingy posledních vyhledávacích dotazů napříč spuštěními (0 = vypnuto)
+# - CONTEXT_CACHE_SIZE: kolik posledních sestavených kontextů <sluzby> pro LLM držet v paměti (0 = vypnuto)
+# - CONTEXT_FETCH_WORKERS: pro kolik služeb se při sestavení kontextu načítají detaily a kroky souběžně
+# - CONTEXT_FETCH_TIMEOUT: jak dlouho (s) nejvýše čekat na detail a kroky jedné služby při sestavení kontextu
+# - SPARQL_TIMEOUT: časový limit (s) dotazů na SPARQL endpoint (u velkých výsledků jde o čekání na další data, ne o celé stahování)
+# - ATTRIBUTES_BACKFILL_STATE: záznam o neúspěšném doplnění atributů úkonů do starší cache (čas posledního pokusu)
+# - ATTRIBUTES_RETRY_SECONDS: za jak dlouho (s) po neúspěchu zkusit atributy úkonů doplnit znovu
+# - DETAIL_FORMAT: výchozí formát detailu služby z get_service_detail_by_id() ("text" nebo "xml", viz DETAIL_RENDERERS)
+# - TOKENIZER: tokenizer pro počítání tokenů kontextu (cesta k tokenizer.json nebo název na Hugging Face Hub – ten se stáhne;
+#   prázdné = TOKENIZER_FILE, pokud existuje, jinak odhad podle počtu znaků)
+# - CONTEXT_TOKEN_BUDGET: kolik tokenů smí mít kontext <sluzby> z pack_services_context()
+# - CONTEXT_FIELD_TOKENS: na kolik tokenů se při překročení rozpočtu zkracují dlouhá pole služby
+# - STARTUP_REPORT: při prvním vyhledávání vypsat přehled doby startu (viz get_startup_report())
+# - STARTUP_BUDGET_SECONDS: časový rozpočet od importu modulu po první vyhledávání (0 = bez kontroly)
+# Soubory cache služeb a snapshotu, formát cache (CACHE_CODEC), embedding model (EMBEDDINGS_MODEL), složku Chroma
+# a nastavení prvního načtení (BOOTSTRAP_DIR, PIPELINE_QUEUE_SIZE…) určuje shared/government_services_storage.py.
 DETAILS_PATH = Path("data/detailni-popis-sluzby-vs.json")
+DETAILS_FIELDS = (
+    "popis",
+    "jaký-má-služba-benefit",
+    "kde-a-jak-službu-řešit-el",
+    "kdy-službu-řešit",
+    "týká-se-vás-to-pokud",
+    "způsob-vyřízení-el",
+    "klíčová-slova",
+)
+DETAILS_READ_CHUNK_SIZE = 1 << 20
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+CHROMA_LEAN_INDEX = os.getenv("CHROMA_LEAN_INDEX", "0") == "1"
+DETAILS_CACHE = Path("data/details_projection.json")
+STEPS_CACHE = Path("data/service_steps.json")
+QUERY_EMBEDDINGS_CACHE = Path("data/query_embeddings.json")
+QUERY_EMBEDDINGS_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDINGS_CACHE_SIZE", "500"))
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "64"))
+CONTEXT_FETCH_WORKERS = int(os.getenv("CONTEXT_FETCH_WORKERS", "8"))
+CONTEXT_FETCH_TIMEOUT = float(os.getenv("CONTEXT_FETCH_TIMEOUT", "15"))
+SPARQL_TIMEOUT = float(os.getenv("SPARQL_TIMEOUT", "30"))
+ATTRIBUTES_BACKFILL_STATE = Path("data/attributes_backfill.json")
+ATTRIBUTES_RETRY_SECONDS = float(os.getenv("ATTRIBUTES_RETRY_SECONDS", "86400"))
+DETAIL_FORMAT = os.getenv("DETAIL_FORMAT", "xml")
+TOKENIZER = os.getenv("TOKENIZER", "")
+TOKENIZER_FILE = Path("data/tokenizer.json")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_FIELD_TOKENS = int(os.getenv("CONTEXT_FIELD_TOKENS", "120"))
+STARTUP_REPORT = os.getenv("STARTUP_REPORT", "0") == "1"
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "0"))
 
+# Doby importu těžkých závislostí načtených přes _lazy_import() (v sekundách; 0.0 = už je načetl někdo jiný)
+_IMPORT_TIMES: Dict[str, float] = {}
 
-@dataclass
-class GovernmentService:
-    """Reprezentuje jednu službu veřejné správy."""
-    uri: str
-    id: str
-    name: str
-    description: str
-    keywords: List[str] = None
+# Části store, které warm_up() připravuje na pozadí (v tomto pořadí):
+# catalog = seznam služeb, keywords = index klíčových slov, search = vektorový index (Chroma)
+# + cache embeddingů dotazů, details = projekce details JSON + cache kroků služeb
+WARMUP_CAPABILITIES = ("catalog", "keywords", "search", "details")
 
-    def __post_init__(self):
-        """Po vytvoření objektu:
-        - normalizuje pole `keywords` na prázdný seznam,
-        - pokud chybí `id`, odvodí jej z `uri` (fragment nebo poslední segment cesty).
-        """
-        if self.keywords is None:
-            self.keywords = []
+# Pole služby v kontextu <sluzby> od nejdůležitějšího (kroky = <kroky>, ostatní = pole ServiceDetail);
+# pack_services_context() je při překročení rozpočtu tokenů zkracuje a vynechává od konce
+CONTEXT_FIELD_PRIORITY = ("popis", "jak_resit", "kroky", "resit_pokud", "kdy_resit", "zpusob_vyrizeni", "benefit")
+
+# Načtený tokenizer (None = ještě jsme ho nezkoušeli načíst, False = není k dispozici, počítá se odhadem)
+_tokenizer: Any = None
+_tokenizer_source = ""
+_TOKENIZER_LOCK = threading.Lock()
+
+# Převod HTML na text: jeden předkompilovaný výraz najde značky, komentáře, entity a zalomení řádků
+# ve zdroji (v HTML nic neznamenají); text mezi nimi zpracovává regex engine bez volání Pythonu.
+# Blokové značky oddělí text novým řádkem, zbylé bílé znaky se pak sloučí.
+_HTML_TOKEN_RE = re.compile(
+    r"<!--.*?-->|<(?P<closing>/?)(?P<tag>[a-zA-Z][a-zA-Z0-9]*)\b[^>]*>|(?P<entity>&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);)|\n\s*",
+    re.DOTALL
+)
+_HTML_BLOCK_TAGS = frozenset((
+    "address", "article", "blockquote", "br", "dd", "div", "dl", "dt", "footer", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "ol", "p", "pre", "section", "table", "tbody", "td", "th", "thead", "tr", "ul"
+))
+_HTML_SPACES_RE = re.compile(r"(?: [^\S\n]|[^\S\n ])[^\S\n]*")  # běhy bílých znaků kromě samotné mezery
+_HTML_LINE_BREAKS_RE = re.compile(r" ?\n[\n ]*")
+
+# Verze projekce details JSON uložené v DETAILS_CACHE (zvýšit při změně toho, co se do ní ukládá)
+_DETAILS_PROJECTION_VERSION = 2
+
+# Kanál, přes který musí jít úkon vyřídit, aby se počítal mezi „digitální kroky“ služby
+DIGITAL_CHANNEL = "DATOVA_SCHRANKA"
+
+
+# Utility functions for processing text
+def _html_token_to_text(match: "re.Match[str]") -> str:
+    """Nahradí jeden nález _HTML_TOKEN_RE: blokovou značku novým řádkem, entitu znakem, zbytek mezerou či ničím."""
+    tag = match.group("tag")
+    if tag is not None:
+        tag = tag.lower()
+        if tag not in _HTML_BLOCK_TAGS:
+            return ""
+        return "\n- " if tag == "li" and not match.group("closing") else "\n"
+    entity = match.group("entity")
+    if entity is not None:
+        return html.unescape(entity)  # &nbsp; → \xa0, sloučí se s ostatními mezerami
+    return "" if match.group(0).startswith("<!--") else " "
+
+
+def _html_to_text(text: str) -> str:
+    """
+    Převede HTML na prostý text: odstraní značky a komentáře, dekóduje entity (včetně &nbsp;),
+    bloky (odstavce, položky seznamů, <br>…) oddělí novým řádkem, položky seznamů uvede
+    pomlčkou a ostatní bílé znaky sloučí do jedné mezery.
+    """
+    if not text:
+        return text
+    text = _HTML_TOKEN_RE.sub(_html_token_to_text, text)
+    text = _HTML_SPACES_RE.sub(" ", text)
+    return _HTML_LINE_BREAKS_RE.sub("\n", text).strip()
+
+
+def _normalize_keyword(keyword: str) -> str:
+    """Normalizuje klíčové slovo pro porovnávání (malá písmena, bez okrajových mezer)."""
+    return keyword.strip().lower() if keyword else ""
 
-        if not self.id and self.uri:
-            self.id = _extract_id_from_uri(self.uri)
 
-        if not self.id:
-            raise ValueError("Service ID could not be determined from URI")
+def normalize_query(query: str) -> str:
+    """Normalizuje text dotazu pro klíč cache (sjednocené mezery, malá písmena)."""
+    return " ".join(query.split()).lower()
 
 
-# Utility functions for processing URIs and text
-def _extract_id_from_uri(uri: str) -> str:
-    """Vrátí ID extrahované z URI (nejdříve fragment, jinak poslední segment cesty).
-    
-    Funguje jak s absolutními URI, tak s relativními cestami jako 'detailní-popis-služby-vs/S6192'.
+def _distance_to_similarity(distance: float, space: str) -> float:
+    """Převede vzdálenost z Chroma na kosinovou podobnost.
+
+    Embeddingy OpenAI jsou normalizované na jednotkovou délku, takže pro výchozí prostor "l2"
+    (Chroma vrací druhou mocninu vzdálenosti) platí d = 2 - 2·cos; pro "cosine" a "ip" d = 1 - cos.
+    """
+    if space == "l2":
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+
+def _lazy_import(name: str) -> Any:
+    """Naimportuje modul až při prvním použití a zapíše dobu importu do přehledu startu."""
+    module = sys.modules.get(name)
+    if module is not None:
+        _IMPORT_TIMES.setdefault(name, 0.0)
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    _IMPORT_TIMES.setdefault(name, time.perf_counter() - started)
+    return module
+
+
+def _query_sparql_endpoint(endpoint: str, sparql_str: str, timeout: Optional[float] = None) -> List[types.SimpleNamespace]:
+    """Pošle SELECT dotaz přímo na SPARQL endpoint (HTTP, výsledky v JSON) a vrátí řádky výsledku.
+
+    Dotazy nesdílejí žádný stav, takže se dají volat z více vláken najednou a s časovým
+    limitem. Řádek má atribut pro každou proměnnou (None = nevázaná).
+    """
+    request = urllib.request.Request(
+        endpoint,
+        data=urlencode({"query": sparql_str}).encode("utf-8"),
+        headers={"Accept": "application/sparql-results+json", "Content-Type": "application/x-www-form-urlencoded"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        payload = json.load(response)
+    variables = payload["head"]["vars"]
+    return [
+        types.SimpleNamespace(**{var: binding[var]["value"] if var in binding else None for var in variables})
+        for binding in payload["results"]["bindings"]
+    ]
+
+
+def _iter_sparql_endpoint(endpoint: str, sparql_str: str, timeout: Optional[float] = None) -> Iterator[types.SimpleNamespace]:
+    """Pošle SELECT dotaz na SPARQL endpoint a vrací řádky výsledku postupně, jak přicházejí po síti.
+
+    Výsledek se čte jako CSV, takže v paměti je vždy jen rozečtený řádek, ne celá (i velmi
+    velká) odpověď. Hodnoty jsou řetězce, nevázaná proměnná je prázdný řetězec.
+    """
+    request = urllib.request.Request(
+        endpoint,
+        data=urlencode({"query": sparql_str}).encode("utf-8"),
+        headers={"Accept": "text/csv", "Content-Type": "application/x-www-form-urlencoded"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        reader = csv.reader(io.TextIOWrapper(response, encoding="utf-8", newline=""))
+        variables = next(reader, [])
+        for values in reader:
+            yield types.SimpleNamespace(**dict(zip(variables, values)))
+
+
+def _iter_json_array_items(path: Path, array_key: str, chunk_size: int = DETAILS_READ_CHUNK_SIZE) -> Iterator[Any]:
+    """Postupně čte JSON soubor a vrací jednotlivé prvky pole pod klíčem `array_key`.
+
+    Soubor může být i přímo pole. V paměti je vždy jen rozečtený blok souboru a právě
+    dekódovaný prvek; hodnoty ostatních klíčů objektu na nejvyšší úrovni se přeskočí.
     """
-    if not uri:
-        return ""
-    
-    parsed = urlparse(uri)
-    if parsed.fragment:
-        return parsed.fragment
-    
-    # Pro absolutní URI použij parsed.path, pro relativní URI použij celý string
-    path_to_parse = parsed.path if parsed.scheme or parsed.netloc else uri
-    
-    if path_to_parse:
-        parts = [p for p in path_to_parse.split("/") if p]
-        if parts:
-            return parts[-1]
-    return ""
-
-
-def _strip_html(text: str) -> str:
-    """Odstraní HTML značky z textu (detaily služeb bývají formátované HTML)."""
-    return re.sub(r"<[^>]+>", "", text) if text else text
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer, pos = "", 0
+
+        def fill() -> bool:
+            """Přečte další blok souboru; vrací False na konci souboru."""
+            nonlocal buffer, pos
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return False
+            buffer, pos = buffer[pos:] + chunk, 0
+            return True
+
+        def peek() -> str:
+            """Přeskočí bílé znaky a vrátí následující znak ("" na konci souboru)."""
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not fill():
+                    return ""
+
+        def expect(char: str) -> None:
+            nonlocal pos
+            if peek() != char:
+                raise json.JSONDecodeError(f"Expecting '{char}'", buffer, pos)
+            pos += 1
+
+        def decode() -> Any:
+            """Dekóduje jednu hodnotu; nevejde-li se do bufferu, dočte další blok a zkusí to znovu."""
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if fill():
+                        continue
+                    raise
+                # Číslo na konci bufferu mohlo být blokem uříznuté (např. "-0." z "-0.5")
+                if not isinstance(value, (dict, list, str)) and not buffer[end:].lstrip("0123456789.eE+-") and fill():
+                    continue
+                pos = end
+                return value
+
+        first = peek()
+        if first == "{":
+            expect("{")
+            while peek() not in ("}", ""):
+                key = decode()
+                expect(":")
+                if key == array_key and peek() == "[":
+                    break
+                decode()  # hodnotu jiného klíče přeskočíme
+                if peek() == ",":
+                    expect(",")
+            else:
+                return
+        elif first != "[":
+            return
+
+        expect("[")
+        while peek() != "]":
+            yield decode()
+            if peek() != "]":
+                expect(",")
+
+
+def _project_details_item(item: Any) -> Optional[Tuple[str, dict]]:
+    """Z položky details JSON ponechá jen ID a pole z DETAILS_FIELDS (u textů jen českou variantu)."""
+    if not isinstance(item, dict):
+        return None
+    # Extract service ID from either "id" or "iri" field using consistent logic
+    raw_id = item.get("id", "") or item.get("iri", "")
+    service_id = extract_id_from_uri(raw_id) if raw_id else ""
+    if not service_id:
+        return None
+
+    # Texty se z HTML čistí už tady, jednou za položku – do DETAILS_CACHE se ukládají hotové
+    projection: Dict[str, Any] = {}
+    for field in DETAILS_FIELDS:
+        value = item.get(field)
+        if field == "klíčová-slova":
+            if isinstance(value, list):
+                projection[field] = [{"cs": _html_to_text(kw["cs"])} for kw in value if _get_cs(kw)]
+        elif _get_cs(value):
+            projection[field] = {"cs": _html_to_text(value["cs"])}
+    return service_id, projection
 
 
 def _get_cs(obj) -> Optional[str]:
@@ -89,261 +349,1196 @@ def _get_cs(obj) -> Optional[str]:
 
 
 def _safe_get_cs_from_item(item: dict, key: str) -> str:
-    """Bezpečně extrahuje českou hodnotu z položky a odstraní HTML značky."""
+    """Bezpečně extrahuje českou hodnotu z položky projekce (text už je očištěný od HTML)."""
     val = _get_cs(item.get(key))
-    return _strip_html(val) if val else "Není k dispozici"
+    return val if val else "Není k dispozici"
+
+
+@dataclass(slots=True)
+class ServiceDetail:
+    """Detail služby z details JSON (texty jsou už očištěné od HTML; None = údaj chybí)."""
+    id: str
+    popis: Optional[str] = None
+    benefit: Optional[str] = None
+    jak_resit: Optional[str] = None
+    kdy_resit: Optional[str] = None
+    resit_pokud: Optional[str] = None
+    zpusob_vyrizeni: Optional[str] = None
+
+    @classmethod
+    def from_item(cls, service_id: str, item: dict) -> "ServiceDetail":
+        """Vytvoří detail z položky projekce details JSON."""
+        return cls(
+            id=service_id,
+            popis=_get_cs(item.get("popis")),
+            benefit=_get_cs(item.get("jaký-má-služba-benefit")),
+            jak_resit=_get_cs(item.get("kde-a-jak-službu-řešit-el")),
+            kdy_resit=_get_cs(item.get("kdy-službu-řešit")),
+            resit_pokud=_get_cs(item.get("týká-se-vás-to-pokud")),
+            zpusob_vyrizeni=_get_cs(item.get("způsob-vyřízení-el")),
+        )
+
+
+def _detail_value(value: Optional[str]) -> str:
+    return value if value else "Není k dispozici"
+
+
+def _render_detail_text(detail: ServiceDetail) -> str:
+    """Detail jako prostý text ("Popis: ...")."""
+    return (
+        f"Popis: {_detail_value(detail.popis)}\n"
+        f"Kde a jak službu řešit elektronicky: {_detail_value(detail.jak_resit)}\n"
+        f"Kdy službu řešit: {_detail_value(detail.kdy_resit)}\n"
+        f"Týká se uživatele pokud: {_detail_value(detail.resit_pokud)}\n"
+        f"Způsob vyřízení: {_detail_value(detail.zpusob_vyrizeni)}"
+    )
+
+
+def _render_detail_xml(detail: ServiceDetail) -> str:
+    """Detail jako XML fragment (<popis>...</popis><benefit>...), texty jsou escapované."""
+    return (
+        f"<popis>{_xml_escape(_detail_value(detail.popis))}</popis>"
+        f"<benefit>{_xml_escape(_detail_value(detail.benefit))}</benefit>\n"
+        f"<jak-resit>{_xml_escape(_detail_value(detail.jak_resit))}</jak-resit>\n"
+        f"<kdy-resit>{_xml_escape(_detail_value(detail.kdy_resit))}</kdy-resit>\n"
+        f"<resit-pokud>{_xml_escape(_detail_value(detail.resit_pokud))}</resit-pokud>\n"
+        f"<zpusob-vyrizeni>{_xml_escape(_detail_value(detail.zpusob_vyrizeni))}</zpusob-vyrizeni>"
+    )
+
+
+# Registr formátů detailu služby: název formátu → funkce ServiceDetail → str. Vlastní formát
+# stačí přidat do slovníku; výstupy se pamatují podle názvu formátu, proto je nepřepisujte za běhu.
+DETAIL_RENDERERS: Dict[str, Callable[[ServiceDetail], str]] = {
+    "text": _render_detail_text,
+    "xml": _render_detail_xml,
+}
+
+# Pole ServiceDetail, která jednotlivé formáty vypisují; pack_services_context() zkracuje jen ta.
+# Formát, který tu chybí, se bere jako vypisující všechna pole.
+DETAIL_RENDERER_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "text": ("popis", "jak_resit", "kdy_resit", "resit_pokud", "zpusob_vyrizeni"),
+    "xml": ("popis", "benefit", "jak_resit", "kdy_resit", "resit_pokud", "zpusob_vyrizeni"),
+}
+
+
+def _get_tokenizer() -> Any:
+    """
+    Vrátí tokenizer podle TOKENIZER, jinak z lokálního TOKENIZER_FILE, nebo False (počítá se odhadem).
+
+    Bez nastavení se nic nestahuje: stažení z Hugging Face Hub nemá časový limit a bez sítě by
+    zdrželo první sestavení kontextu.
+    """
+    global _tokenizer, _tokenizer_source
+    with _TOKENIZER_LOCK:
+        if _tokenizer is None:
+            _tokenizer = False
+            source = TOKENIZER or (str(TOKENIZER_FILE) if TOKENIZER_FILE.is_file() else "")
+            if source:
+                try:
+                    tokenizers = _lazy_import("tokenizers")
+                    if os.path.isfile(source):
+                        _tokenizer = tokenizers.Tokenizer.from_file(source)
+                    else:
+                        _tokenizer = tokenizers.Tokenizer.from_pretrained(source)
+                    _tokenizer_source = source
+                except Exception as e:
+                    print(f"Warning [count_tokens]: Tokenizer '{source}' not available, token counts are estimated: {e}")
+        return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """
+    Vrátí počet tokenů textu podle tokenizeru z _get_tokenizer() (stejné kódování jako modely OpenAI, počítá se lokálně).
+
+    Bez tokenizeru (není nastavený, chybí balíček nebo ho nejde načíst) vrací odhad: zhruba 3 znaky českého
+    textu na token, raději víc tokenů než méně, aby se rozpočet nepřekročil.
+    """
+    if not text:
+        return 0
+    tokenizer = _get_tokenizer()
+    if tokenizer:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return -(-len(text) // 3)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Zkrátí text na nejvýše max_tokens tokenů (na hranici slova) a doplní výpustku."""
+    tokenizer = _get_tokenizer()
+    if tokenizer:
+        offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+        if len(offsets) <= max_tokens:
+            return text
+        end = offsets[max_tokens - 1][1] if max_tokens > 0 else 0
+    else:
+        if len(text) <= max_tokens * 3:
+            return text
+        end = max_tokens * 3
+    cut = text.rfind(" ", 0, end + 1)
+    return (text[:cut if cut > 0 else end]).rstrip() + "…"
+
+
+def _render_service_context(service_id: str, name: str, detail: Optional[str], steps: List[str], detail_format: str) -> str:
+    """Fragment <sluzba> kontextu <sluzby> z již vyrenderovaného detailu a seznamu kroků."""
+    parts = ["  <sluzba>\n", f"    <id>{_xml_escape(service_id)}</id>\n", f"    <nazev>{_xml_escape(name)}</nazev>\n"]
+    if detail:
+        # XML renderer escapuje sám, výstup ostatních formátů je prostý text
+        parts.append(f"    <detail>{detail if detail_format == 'xml' else _xml_escape(detail)}</detail>\n")
+    if steps:
+        parts.append("    <kroky>\n")
+        parts.extend(f"      <krok>{_xml_escape(step)}</krok>\n" for step in steps)
+        parts.append("    </kroky>\n")
+    parts.append("  </sluzba>\n")
+    return "".join(parts)
 
 
-class GovernmentServicesStore:
+class GovernmentServicesStore(GovernmentServicesStorage):
     """
     Veřejné API třídy:
       - load_services(): načte služby (z cache, případně ze SPARQL) a doplní detaily
       - search_services_by_keywords(): jednoduché fulltextové vyhledávání
+      - get_top_keywords(), get_services_by_keywords(): procházení služeb podle klíčových slov
+      - search_services(..., digital_only=True, channel=..., where=...): vyhledávání předfiltrované atributy služeb
+      - search_services_scored(): totéž vyhledávání, ke službám vrací i kosinovou podobnost s dotazem
+      - embed_queries(): embeddingy více vyhledávacích dotazů najednou (např. pro porovnání dotazů mezi sebou)
       - search_services_semantically(): sémantické vyhledávání na embeddings + Chroma
       - get_service_by_id(), get_all_services(), get_services_count()
       - get_service_detail_by_id(), get_service_howto_by_id(): získání rozšířených informací
       - get_service_steps_by_id(): získání kroků (úkonů) služby z SPARQL
+      - build_services_context(), pack_services_context(): kontext <sluzby> pro LLM (pack = v rozpočtu tokenů)
       - get_embedding_statistics(): metriky vektorového indexu
+      - get_search_cache_statistics(): úspěšnost cache výsledků vyhledávání
+      - migrate_embeddings_model(), get_index_migration_status(): přechod na jiný embedding model bez výpadku
 
     Interní kroky:
-      - _load_from_local(), _store_to_local(): práce s cache JSON
-      - _load_from_external_store(): SPARQL dotaz na otevřená data ČR
-      - _load_auxiliary_details(): sloučení detailů (popisy/klíčová slova)
+      - _load_services_from_local_cache(), _store_services_to_local_cache(): práce s cache (JSON + binární snapshot
+        přes mmap; formáty a práci se snapshotem zajišťuje GovernmentServicesStorage ze shared/)
+      - _iter_services_from_external_store(): SPARQL dotaz na otevřená data ČR (výsledek se čte proudově)
+      - _apply_service_details(): sloučení detailů (popisy/klíčová slova)
       - _initialize_semantic_search(): příprava OpenAI klienta a Chroma
       - _compute_embeddings(): výpočet embeddingů pro všechny služby
+      - _build_keyword_index(): invertovaný index klíčové slovo → ID služeb
+      - _bootstrap_services(): první načtení po etapách (stažení → doplnění → embeddingy) s žurnálem
+        (pipeline i správa indexů po modelech jsou v GovernmentServicesStorage ze shared/)
+      - _load_services_attributes(): hromadné načtení atributů úkonů (počet kroků, kanály; starší cache je doplní na pozadí)
+      - _sync_index_metadata(): propsání atributů do metadat v Chroma
     """
 
     def __init__(self):
         """Vytvoří prázdné úložiště a připraví stav pro semantické vyhledávání."""
+        super().__init__()  # stav úložné vrstvy (snapshot, verze katalogu, migrace indexu)
         self._services: Dict[str, GovernmentService] = {}
         self._services_list: List[GovernmentService] = []  # synchronizovaná kopie hodnot pro jednoduché procházení
 
+        # Invertovaný index klíčových slov: normalizované klíčové slovo → ID služeb
+        self._keyword_index: Dict[str, Set[str]] = {}
+        self._keyword_labels: Dict[str, str] = {}  # normalizované klíčové slovo → původní podoba pro výpis
+        self._keyword_index_built = True  # po otevření snapshotu se index sestaví až při prvním použití
+
+        # Projekce details JSON (ID služby → potřebná pole), načtená nejvýše jednou za běh
+        self._details_index: Optional[Dict[str, dict]] = None
+        self._details_lock = threading.Lock()  # chrání i _detail_fragments (detaily se načítají i z vláken prefetch)
+        self._detail_fragments: Dict[Tuple[str, str], str] = {}  # (ID služby, formát) → vykreslený detail
+
+        # Souborové cache odvozených dat (načtené líně při prvním použití)
+        self._steps_cache: Optional[Dict[str, List[str]]] = None
+        self._steps_lock = threading.Lock()
+        self._query_embeddings: Optional["OrderedDict[str, str]"] = None  # "model\ndotaz" → float32 vektor v base64
+        self._query_embeddings_lock = threading.Lock()
+
         # Komponenty pro sémantické vyhledávání (lazy inicializace)
         self._openai_client = None
         self._chroma_client = None
         self._collection = None
+        self._active_model: Optional[str] = None  # embedding model, kterým je spočítána aktivní kolekce
+        self._index_lock = threading.Lock()  # chrání dvojici (kolekce, model) při přepnutí indexu
         self._embeddings_computed = False
+        self._index_metadata_checked = False  # zda už víme, že metadata v Chroma obsahují atributy služeb
+        self._attributes_thread: Optional[threading.Thread] = None  # doplnění atributů úkonů starší cache na pozadí
+
+        # LRU cache hotových výsledků vyhledávání (klíč obsahuje generaci indexu,
+        # která se zvýší při každém zápisu do Chroma, takže staré výsledky nikdy nevrátíme)
+        self._index_generation = 0
+        self._search_cache: "OrderedDict[tuple, List[Tuple[str, float]]]" = OrderedDict()  # klíč → [(ID služby, podobnost)]
+        self._search_cache_lock = threading.Lock()
+        self._search_cache_hits = 0
+        self._search_cache_misses = 0
+
+        # Kontext <sluzby> pro LLM: fragmenty jednotlivých služeb (ID, formát detailu) a LRU hotových
+        # dokumentů (klíč = ID služeb v daném pořadí + formát detailu)
+        self._context_fragments: Dict[Tuple[str, str], str] = {}
+        self._contexts: "OrderedDict[tuple, str]" = OrderedDict()
+        self._context_lock = threading.Lock()
+
+        # Doby jednotlivých fází startu (load_services, _initialize_search, první vyhledávání)
+        self._startup_times: Dict[str, float] = {}
+
+        # Zahřátí na pozadí (viz warm_up()): hotové části a chyby, změny se oznamují přes podmínku
+        self._warmup_thread: Optional[threading.Thread] = None
+        self._warmup_running = False
+        self._warmup_completed: Set[str] = set()
+        self._warmup_errors: Dict[str, str] = {}
+        self._warmup_condition = threading.Condition()
 
     def add_service(self, service: GovernmentService) -> None:
         """Přidá jednu službu do úložiště a zaktualizuje interní seznam."""
-        self._services[service.id] = service
-        self._services_list = list(self._services.values())
+        self._materialize_services()
+        if service.id in self._services:
+            self._services[service.id] = service
+            self._services_list = list(self._services.values())
+        else:
+            self._services[service.id] = service
+            self._services_list.append(service)
+        if self._keyword_index_built:
+            self._index_service_keywords(service.id, service.keywords)
 
     def clear_services(self) -> None:
-        """Vyprázdní úložiště (slovník i seznam)."""
-        self._services.clear()
-        self._services_list.clear()
+        """Vyprázdní úložiště (slovník, seznam i index klíčových slov)."""
+        self._close_snapshot()
+        self._services = {}
+        self._services_list = []
+        self._catalog_version = None
+        with self._steps_lock:
+            self._steps_cache = None  # po změně katalogu se cache kroků znovu načte a ověří
+        with self._context_lock:
+            self._context_fragments.clear()
+            self._contexts.clear()
+        self._keyword_index.clear()
+        self._keyword_labels.clear()
+        self._keyword_index_built = True
+        self._bump_index_generation()
+
+    def _all_services_have_attributes(self) -> bool:
+        """True, pokud mají všechny služby načtené atributy úkonů (u snapshotu stačí příznak v hlavičce)."""
+        if self._snapshot is not None and self._snapshot.attributes_complete:
+            return True
+        return all(s.attributes_loaded for s in self._services_list)
 
     def load_services(self) -> None:
         """Načítání služeb s „fallback“ strategií."""
+        started = time.perf_counter()
+        try:
+            self._load_services()
+        finally:
+            self._startup_times.setdefault("load_services", time.perf_counter() - started)
+
+    def _load_services(self) -> None:
         if len(self._services) > 0:
             self.clear_services()
 
-        if SERVICES_CACHE.exists():
+        if SERVICES_SNAPSHOT.exists() or cache_file(SERVICES_CACHE) is not None:
             try:
                 self._load_services_from_local_cache()
             except Exception as local_error:
                 print(f"Warning [load_services]: Failed to load from local file: {local_error}")
                 self.clear_services()
+                # Místo studeného načtení (SPARQL + embeddingy) zkusíme katalog obnovit z vektorového indexu
+                if not BOOTSTRAP_JOURNAL.exists() and self._restore_services_from_index():
+                    self._store_services_to_local_cache()
+
+            # Starší cache atributy úkonů neobsahuje – doplníme je na pozadí, start na SPARQL nečeká
+            if self._services_list and not self._all_services_have_attributes():
+                self._start_attributes_backfill()
+
+            # Cache už je uložená, ale embeddingy minule nedoběhly – dopočítáme jen chybějící dávky
+            if self._services_list and BOOTSTRAP_JOURNAL.exists():
+                self._resume_bootstrap_embeddings()
 
         if len(self._services) == 0:
             try:
-                self._load_services_from_external_store()
-                self._load_services_with_details()
-                try:
-                    print("Debug [load_services]: Computing embeddings for semantic search...")
-                    self._compute_services_embeddings()
-                except Exception as embedding_error:
-                    print(f"Warning [load_services]: Failed to compute embeddings: {embedding_error}")
-                    print("Warning [load_services]: Semantic search will not be available until embeddings are computed manually.")
-                self._store_services_to_local_cache()
+                self._bootstrap_services()
             except Exception as e:
                 raise RuntimeError(f"Warning [load_services]: Failed to load services from both local and external sources: {e}")
 
+        self._compact_services()
+
     def _load_services_from_local_cache(self) -> None:
-        """Načte služby z lokální cache (JSON)."""
+        """
+        Načte služby z lokální cache: přednostně z binárního snapshotu, jinak z JSON.
+        Poškozenou nebo zastaralou kopii opraví z té druhé, takže stačí, když je platná jedna z nich.
+        """
+        if self._open_services_snapshot():
+            if not cache_is_valid(SERVICES_CACHE, self._catalog_version):
+                print("Debug [_load_services_from_local_cache]: JSON cache is missing or damaged, rewriting it from the snapshot.")
+                self._store_services_to_local_cache()
+            return
         try:
-            with open(SERVICES_CACHE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            for item in data:
+            for item in read_cache(SERVICES_CACHE):
                 service = GovernmentService(**item)
                 self.add_service(service)
         except Exception as e:
             raise RuntimeError(f"Warning [_load_services_from_local_cache]: Failed to load services from local file: {e}")
+        self._catalog_version = catalog_version(self._services_list)
+        if cache_is_valid(SERVICES_CACHE, self._catalog_version):
+            self._write_services_snapshot()
+        else:
+            self._store_services_to_local_cache()  # starší JSON bez hlavičky rovnou převedeme
 
-    def _load_services_from_external_store(self) -> None:
-        """Načte služby ze SPARQL endpointu a uloží je do paměti."""
+    @staticmethod
+    def _iter_services_from_external_store() -> Iterator[GovernmentService]:
+        """Postupně vrací služby ze SPARQL endpointu (bez ukládání do paměti úložiště)."""
         sparql_endpoint = "https://rpp-opendata.egon.gov.cz/odrpp/sparql/"
-        g = Graph()
-        sparql_str = f"""
+        sparql_str = """
         PREFIX rppl: <https://slovník.gov.cz/legislativní/sbírka/111/2009/pojem/>
         PREFIX rppa: <https://slovník.gov.cz/agendový/104/pojem/>
         SELECT ?uri ?name ?description
-        WHERE {{
-            SERVICE <{sparql_endpoint}> {{
+        WHERE {
             ?uri a rppl:služba-veřejné-správy ;
                 rppa:má-název-služby ?name ;
                 rppa:má-popis-služby ?description .
-            }}
-        }}
+        }
+        """
+        for row in _iter_sparql_endpoint(sparql_endpoint, sparql_str, timeout=SPARQL_TIMEOUT):
+            yield GovernmentService(uri=row.uri, id="", name=row.name, description=row.description, keywords=[])
+
+    def _start_attributes_backfill(self) -> None:
+        """Spustí doplnění atributů úkonů na pozadí; po nedávném neúspěchu (viz ATTRIBUTES_RETRY_SECONDS) ho vynechá."""
+        if self._attributes_backfill_failed_recently():
+            print("Debug [_start_attributes_backfill]: Skipping service attributes, the last attempt to load them failed recently.")
+            return
+        self._attributes_thread = threading.Thread(target=self._backfill_services_attributes, name="services-attributes", daemon=True)
+        self._attributes_thread.start()
+
+    def _backfill_services_attributes(self) -> None:
+        """Doplní atributy úkonů službám ze starší cache a uloží je do JSON cache.
+
+        Snapshot se tu nepřepisuje (souběžně z něj čtou jiná vlákna) – novější JSON cache
+        do něj převede příští start.
+        """
+        try:
+            self._load_services_attributes()
+            write_cache(SERVICES_CACHE, [service_to_dict(s) for s in self._decoded_services()], catalog=self._catalog_version)
+        except Exception as e:
+            print(f"Warning [_backfill_services_attributes]: Failed to load service attributes: {e}")
+
+    @staticmethod
+    def _attributes_backfill_failed_recently() -> bool:
+        """True, pokud poslední pokus o načtení atributů úkonů selhal před méně než ATTRIBUTES_RETRY_SECONDS."""
+        try:
+            failed_at = json.loads(ATTRIBUTES_BACKFILL_STATE.read_text(encoding="utf-8"))["failed_at"]
+        except Exception:
+            return False
+        return time.time() - failed_at < ATTRIBUTES_RETRY_SECONDS
+
+    def _load_services_attributes(self) -> None:
+        """Načte atributy úkonů pro všechny služby a propíše je do služeb i do metadat v Chroma.
+
+        Neúspěšný pokus zaznamená do ATTRIBUTES_BACKFILL_STATE, aby ho další starty hned neopakovaly.
+        """
+        services = self._decoded_services()  # běží i na pozadí, snapshot se mezitím může zavřít
+        try:
+            attributes = self._fetch_services_attributes()
+        except Exception:
+            write_json_atomic(ATTRIBUTES_BACKFILL_STATE, {"failed_at": time.time()})
+            raise
+        ATTRIBUTES_BACKFILL_STATE.unlink(missing_ok=True)
+        for service in services:
+            self._apply_service_attributes(service, attributes)
+        print(f"Debug [_load_services_attributes]: Loaded attributes for {len(attributes)} services with steps.")
+
+        if self._collection is not None:
+            self._sync_index_metadata()
+
+    @staticmethod
+    def _fetch_services_attributes() -> Dict[str, Tuple[int, int, List[str]]]:
         """
-        results = g.query(sparql_str)
-        for row in results:
-            uri = str(row.uri)
-            name = str(row.name) if row.name else ""
-            description = str(row.description) if row.description else ""
-            service = GovernmentService(uri=uri, id="", name=name, description=description, keywords=[])
-            self.add_service(service)
+        Jedním SPARQL dotazem načte pro všechny služby atributy jejich úkonů.
 
-    def _load_services_with_details(self) -> None:
-        """Rozšíří data o popisy a klíčová slova z lokálního JSON souboru."""
+        Returns:
+            Slovník ID služby → (počet úkonů, počet digitálních úkonů přes datovou schránku, typy kanálů).
+        """
+        sparql_endpoint = "https://rpp-opendata.egon.gov.cz/odrpp/sparql/"
+        sparql_str = """
+        PREFIX rppl: <https://slovník.gov.cz/legislativní/sbírka/111/2009/pojem/>
+        PREFIX rppa: <https://slovník.gov.cz/agendový/104/pojem/>
+        SELECT ?uri ?step ?digital ?channelType
+        WHERE {
+            ?uri a rppl:služba-veřejné-správy ;
+                rppa:skládá-se-z-úkonu ?step .
+            OPTIONAL { ?step rppa:je-digitální ?digital . }
+            OPTIONAL { ?step rppa:je-realizován-kanálem/rppa:má-typ-obslužného-kanálu ?channelType . }
+        }
+        """
+        steps: Dict[str, Set[str]] = {}
+        digital_steps: Dict[str, Set[str]] = {}
+        channels: Dict[str, Set[str]] = {}
+        # Dotaz běží souběžně se stahováním katalogu (jiné HTTP spojení, žádný sdílený zámek)
+        for row in _iter_sparql_endpoint(sparql_endpoint, sparql_str, timeout=SPARQL_TIMEOUT):
+            service_id = extract_id_from_uri(row.uri)
+            step = row.step
+            steps.setdefault(service_id, set()).add(step)
+            channel = extract_id_from_uri(row.channelType) if row.channelType else ""
+            if channel:
+                channels.setdefault(service_id, set()).add(channel)
+            if row.digital in ("true", "1") and channel == DIGITAL_CHANNEL:
+                digital_steps.setdefault(service_id, set()).add(step)
+
+        return {
+            service_id: (len(service_steps), len(digital_steps.get(service_id, ())), sorted(channels.get(service_id, ())))
+            for service_id, service_steps in steps.items()
+        }
+
+    @staticmethod
+    def _apply_service_attributes(service: GovernmentService, attributes: Dict[str, Tuple[int, int, List[str]]]) -> None:
+        """Nastaví službě atributy úkonů (služba bez úkonů dostane nulové hodnoty)."""
+        step_count, digital_step_count, channel_types = attributes.get(service.id, (0, 0, []))
+        service.step_count, service.digital_step_count, service.channel_types = step_count, digital_step_count, intern_strings(channel_types)
+
+    def _get_details_index(self) -> Dict[str, dict]:
+        """Vrátí projekci details JSON; soubor se při prvním použití přečte a dál se drží v paměti."""
+        with self._details_lock:
+            if self._details_index is None:
+                self._details_index = self._read_details_index()
+            return self._details_index
+
+    @staticmethod
+    def _read_details_index() -> Dict[str, dict]:
+        """Proudově přečte lokální JSON s detaily a vrátí slovník ID služby → projekce položky."""
         if not DETAILS_PATH.exists():
-            print(f"Warning [_load_services_with_details]: Auxiliary details file not found at {DETAILS_PATH}")
+            print(f"Warning [_read_details_index]: Auxiliary details file not found at {DETAILS_PATH}")
+            return {}
+
+        # Projekce uložená minule platí, dokud se zdrojový soubor nezmění
+        stat = DETAILS_PATH.stat()
+        source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "fields": list(DETAILS_FIELDS), "version": _DETAILS_PROJECTION_VERSION}
+        try:
+            cached = read_cache(DETAILS_CACHE)
+            if cached.get("source") == source:
+                return cached["items"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Warning [_read_details_index]: Ignoring unreadable details cache: {e}")
+
+        details_index: Dict[str, dict] = {}
+        # Items are usually under the "položky" key; a bare top-level array works too
+        for item in _iter_json_array_items(DETAILS_PATH, "položky"):
+            projected = _project_details_item(item)
+            if projected is not None:
+                details_index[projected[0]] = projected[1]
+
+        try:
+            write_cache(DETAILS_CACHE, {"source": source, "items": details_index})
+        except Exception as e:
+            print(f"Warning [_read_details_index]: Failed to store details cache: {e}")
+        return details_index
+
+    @staticmethod
+    def _apply_service_details(service: GovernmentService, item: dict) -> None:
+        """Doplní do služby popis, benefit a klíčová slova z jedné položky detailů."""
+        if 'popis' in item:
+            clean_text = _safe_get_cs_from_item(item, 'popis')
+            if clean_text != "Není k dispozici":
+                service.description += " " + clean_text
+        if 'jaký-má-služba-benefit' in item:
+            clean_text = _safe_get_cs_from_item(item, 'jaký-má-služba-benefit')
+            if clean_text != "Není k dispozici":
+                service.description += " " + clean_text
+        if 'klíčová-slova' in item and item['klíčová-slova'] is not None:
+            # Extract Czech keywords from the list of keyword objects
+            for keyword_obj in item['klíčová-slova']:
+                if isinstance(keyword_obj, dict) and 'cs' in keyword_obj and keyword_obj['cs']:
+                    service.keywords.append(sys.intern(keyword_obj['cs']))
+
+    def _bump_index_generation(self) -> None:
+        """Zvýší generaci indexu a tím zneplatní všechny dříve uložené výsledky vyhledávání."""
+        with self._search_cache_lock:
+            self._index_generation += 1
+            self._search_cache.clear()
+
+    def _index_service_keywords(self, service_id: str, keywords: List[str]) -> None:
+        """Zařadí klíčová slova jedné služby do invertovaného indexu."""
+        for keyword in keywords:
+            normalized = _normalize_keyword(keyword)
+            if not normalized:
+                continue
+            self._keyword_index.setdefault(normalized, set()).add(service_id)
+            self._keyword_labels.setdefault(normalized, keyword.strip())
+
+    def _build_keyword_index(self) -> None:
+        """Přepočítá invertovaný index klíčových slov ze všech načtených služeb."""
+        self._keyword_index.clear()
+        self._keyword_labels.clear()
+        if self._snapshot is not None:
+            # Čteme rovnou sloupce snapshotu, objekty služeb se kvůli indexu nevytvářejí
+            for row in range(self._snapshot.count):
+                self._index_service_keywords(self._snapshot.field("id", row), self._snapshot.field("keywords", row))
+        else:
+            for service in self._services_list:
+                self._index_service_keywords(service.id, service.keywords)
+        self._keyword_index_built = True
+        print(f"Debug [_build_keyword_index]: Indexed {len(self._keyword_index)} distinct keywords.")
+
+    def get_top_keywords(self, n: int = 20) -> List[Tuple[str, int]]:
+        """Vrátí `n` nejčastějších klíčových slov jako dvojice (klíčové slovo, počet služeb)."""
+        self._await_capability("catalog", "keywords")
+        if not self._keyword_index_built:
+            self._build_keyword_index()
+        counts = sorted(self._keyword_index.items(), key=lambda kv: (-len(kv[1]), kv[0]))
+        return [(self._keyword_labels[kw], len(ids)) for kw, ids in counts[:n]]
+
+    def _get_service_ids_by_keywords(self, keywords: Iterable[str], match_all: bool = False) -> Set[str]:
+        """Vrátí množinu ID služeb s danými klíčovými slovy (průnik pro AND, sjednocení pro OR)."""
+        self._await_capability("catalog", "keywords")
+        if not self._keyword_index_built:
+            self._build_keyword_index()
+        id_sets = [self._keyword_index.get(_normalize_keyword(kw), set()) for kw in keywords]
+        if not id_sets:
+            return set()
+        if match_all:
+            return set.intersection(*id_sets)
+        return set.union(*id_sets)
+
+    def get_services_by_keywords(self, keywords: List[str], match_all: bool = False) -> List[GovernmentService]:
+        """
+        Vrátí služby označené danými klíčovými slovy (bez volání sítě či embeddingů).
+
+        Args:
+            keywords: Seznam klíčových slov (porovnává se bez ohledu na velikost písmen).
+            match_all: True = služba musí mít všechna klíčová slova (AND), False = alespoň jedno (OR).
+
+        Returns:
+            Seznam služeb seřazený podle ID.
+        """
+        ids = self._get_service_ids_by_keywords(keywords, match_all)
+        return [self._services[i] for i in sorted(ids) if i in self._services]
+
+    @staticmethod
+    def _service_metadata(service: GovernmentService) -> Dict[str, Any]:
+        """Sestaví metadata služby pro Chroma včetně atributů použitelných ve `where` filtrech.
+
+        Chroma neumí seznamy v metadatech, proto je každý typ kanálu samostatný příznak `channel_<TYP>`.
+        V režimu CHROMA_LEAN_INDEX se vynechává popis – vyhledávání jej z Chroma nikdy nečte.
+        """
+        metadata: Dict[str, Any] = {"name": service.name}
+        if not CHROMA_LEAN_INDEX:
+            metadata["description"] = service.description
+        if service.attributes_loaded:
+            metadata["step_count"] = service.step_count
+            metadata["digital_step_count"] = service.digital_step_count
+            metadata["has_digital_steps"] = service.has_digital_steps
+            for channel in service.channel_types:
+                metadata[f"channel_{channel}"] = True
+        return metadata
+
+    def _sync_index_metadata(self) -> None:
+        """Propíše aktuální atributy služeb do metadat již uložených embeddingů (bez jejich přepočtu)."""
+        existing_ids = set(self._collection.get(include=[])['ids'])
+        services = [s for s in self._services_list if s.id in existing_ids and s.attributes_loaded]
+        batch_size = 500
+        for i in range(0, len(services), batch_size):
+            batch = services[i:i+batch_size]
+            self._collection.update(
+                ids=[s.id for s in batch],
+                metadatas=[self._service_metadata(s) for s in batch]
+            )
+            self._bump_index_generation()
+        self._index_metadata_checked = True
+        print(f"Debug [_sync_index_metadata]: Updated metadata for {len(services)} indexed services.")
+
+    def _ensure_index_metadata(self) -> None:
+        """Ověří (jednou za běh), že metadata v Chroma obsahují atributy služeb; jinak je doplní."""
+        if self._attributes_thread is not None:
+            self._attributes_thread.join()  # filtry potřebují atributy, jejich doplnění už běží na pozadí
+        if self._index_metadata_checked:
             return
-        with open(DETAILS_PATH, "r", encoding="utf-8") as f:
-            details_data = json.load(f)
-
-        # Check if data has the expected structure with "položky" key
-        items = details_data.get("položky", details_data) if isinstance(details_data, dict) else details_data
-        
-        for item in items:
-            # Handle both "iri" and "id" fields, prefer "id" if available
-            if isinstance(item, dict):
-                # Extract service ID from either "id" or "iri" field using consistent logic
-                raw_id = item.get("id", "") or item.get("iri", "")
-                service_id = _extract_id_from_uri(raw_id) if raw_id else ""
-            else:
-                continue  # Skip non-dictionary items
-            if service_id in self._services:
-                service = self._services[service_id]
-                if 'popis' in item:
-                    clean_text = _safe_get_cs_from_item(item, 'popis')
-                    if clean_text != "Není k dispozici":
-                        service.description += " " + clean_text
-                if 'jaký-má-služba-benefit' in item:
-                    clean_text = _safe_get_cs_from_item(item, 'jaký-má-služba-benefit')
-                    if clean_text != "Není k dispozici":
-                        service.description += " " + clean_text
-                if 'klíčová-slova' in item and item['klíčová-slova'] is not None:
-                    # Extract Czech keywords from the list of keyword objects
-                    for keyword_obj in item['klíčová-slova']:
-                        if isinstance(keyword_obj, dict) and 'cs' in keyword_obj and keyword_obj['cs']:
-                            service.keywords.append(keyword_obj['cs'])
+        sample = self._collection.get(limit=1, include=["metadatas"])
+        if sample['ids'] and "has_digital_steps" not in (sample['metadatas'][0] or {}):
+            if not self._all_services_have_attributes():
+                if self._attributes_backfill_failed_recently():
+                    print("Warning [_ensure_index_metadata]: Service attributes are not available (the last attempt to load them failed), attribute filters may match no services.")
+                    self._index_metadata_checked = True
+                    return
+                self._load_services_attributes()  # synchronizuje metadata sám
+                return
+            self._sync_index_metadata()
+        self._index_metadata_checked = True
 
     def _compute_services_embeddings(self) -> None:
-        """Spočítá embeddingy pro všechny služby, které je ještě nemají uložené v Chroma."""
+        """Spočítá embeddingy pro všechny služby, které je ještě nemají uložené v aktivní kolekci Chroma."""
         if not self._services_list:
             print("Warning [_compute_services_embeddings]: No services to compute embeddings for.")
             return
 
         self._initialize_search()
+        collection, model = self._get_active_index()
+        self._embed_services_into(collection, model)
+        self._embeddings_computed = True
+
+    def _embed_services_into(self, collection, model: str, progress: Optional[Dict[str, Any]] = None) -> None:
+        """Doplní do dané kolekce embeddingy služeb, které v ní ještě chybí (po dávkách).
+
+        Dávky se zapisují přes `upsert`, takže opakované spuštění po přerušení je idempotentní.
+        """
         existing_ids = set()
         try:
-            existing_data = self._collection.get()
+            existing_data = collection.get(include=[])  # stačí ID, bez dokumentů a metadat
             existing_ids = set(existing_data['ids']) if existing_data['ids'] else set()
         except Exception:
             pass
 
-        new_services = [s for s in self._services_list if s.id not in existing_ids]
-        batch_size = 500
+        services = self._decoded_services()  # migrace běží na pozadí, snapshot se mezitím může zavřít
+        new_services = [s for s in services if s.id not in existing_ids]
+        if progress is not None:
+            progress["total"] = len(services)
+            progress["embedded"] = len(existing_ids)
+        batch_size = EMBEDDING_BATCH_SIZE
         for i in range(0, len(new_services), batch_size):
             batch = new_services[i:i+batch_size]
-            service_texts = []
-            for s in batch:
-                text = f"{s.name}. {s.description}"
-                if s.keywords:
-                    for kw in s.keywords:
-                        text += f" {kw}"
-                service_texts.append(text)
+            service_texts = [self._service_embedding_text(s) for s in batch]
             embeddings_response = self._openai_client.embeddings.create(
                 input=service_texts,
-                model=EMBEDDINGS_MODEL
+                model=model
             )
             embeddings = [e.embedding for e in embeddings_response.data]
-            self._collection.add(
-                ids=[s.id for s in batch],
-                embeddings=embeddings,
-                metadatas=[{"name": s.name, "description": s.description} for s in batch],
-                documents=service_texts
-            )
-            print(f"Debug [_compute_services_embeddings]: Computed embeddings for services {i} - {i + batch_size - 1}.")
-        self._embeddings_computed = True
+            self._upsert_embeddings(collection, batch, embeddings, service_texts)
+            if collection is self._collection:
+                self._bump_index_generation()
+            if progress is not None:
+                progress["embedded"] += len(batch)
+            if collection is self._collection and BOOTSTRAP_JOURNAL.exists():
+                self._update_bootstrap_journal(embedded=len(existing_ids) + i + len(batch))
+            print(f"Debug [_embed_services_into]: Computed embeddings ({model}) for services {i} - {i + batch_size - 1}.")
+
+    def _upsert_embeddings(self, collection, services: List[GovernmentService], embeddings: List[List[float]],
+                           texts: List[str]) -> None:
+        """Zapíše do kolekce embeddingy služeb s metadaty (v režimu CHROMA_LEAN_INDEX bez textů dokumentů)."""
+        collection.upsert(
+            ids=[s.id for s in services],
+            embeddings=embeddings,
+            metadatas=[self._service_metadata(s) for s in services],
+            documents=None if CHROMA_LEAN_INDEX else texts
+        )
+
+    @staticmethod
+    def _service_embedding_text(service: GovernmentService) -> str:
+        """Sestaví text služby, ze kterého se počítá embedding (název, popis, klíčová slova)."""
+        text = f"{service.name}. {service.description}"
+        if service.keywords:
+            for kw in service.keywords:
+                text += f" {kw}"
+        return text
 
     def _initialize_search(self) -> None:
-        """Připraví OpenAI klienta a ChromaDB pro sémantické vyhledávání."""
-        load_dotenv()
+        """Připraví OpenAI klienta a ChromaDB pro sémantické vyhledávání.
+
+        Aktivní kolekci určuje ukazatel v ACTIVE_INDEX_PATH. Pokud byl index spočítán jiným
+        modelem, než je nastaven v EMBEDDINGS_MODEL, vyhledává se dál ze starého indexu
+        a nový se staví na pozadí (viz migrate_embeddings_model()).
+        """
+        _lazy_import("dotenv").load_dotenv()
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise RuntimeError("Warning [_initialize_search]: OPENAI_API_KEY environment variable is not set")
 
-        self._openai_client = openai
+        started = time.perf_counter()
+        self._openai_client = _lazy_import("openai")
         self._openai_client.api_key = api_key
 
-        self._chroma_client = chromadb.PersistentClient(path=str(CHROMA_PATH))
-        self._collection = self._chroma_client.get_or_create_collection("government_services")
+        self._chroma_client = _lazy_import("chromadb").PersistentClient(path=str(CHROMA_PATH))
+        collection, model = self._open_active_index()
+        with self._index_lock:
+            self._collection = collection
+            self._active_model = model
+        self._startup_times.setdefault("initialize_search", time.perf_counter() - started)
+
+        if model != EMBEDDINGS_MODEL and self._services_list and self._migration_status["state"] not in ("running", "failed"):
+            print(f"Warning [_initialize_search]: Index was built with '{model}' but EMBEDDINGS_MODEL is '{EMBEDDINGS_MODEL}'. Building the new index in background, search keeps using the old one.")
+            self.migrate_embeddings_model(EMBEDDINGS_MODEL, background=True)
+
+    def warm_up(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Připraví store k použití: načte katalog služeb, sestaví index klíčových slov, otevře
+        vektorový index a načte souborové cache (části viz WARMUP_CAPABILITIES).
+
+        Na pozadí lze mezitím obsluhovat uživatele – vyhledávání a další dotazy na store samy
+        počkají, až bude potřebná část hotová. Stav lze zjistit přes ready(), wait_ready()
+        a get_warmup_status(). Během zahřívání nevolejte load_services() ani clear_services().
+
+        Args:
+            background: True = běží ve vlákně na pozadí (vrací vlákno), False = čeká na dokončení.
+        """
+        with self._warmup_condition:
+            if self._warmup_running:
+                print("Warning [warm_up]: Warm-up already running.")
+                return self._warmup_thread
+            self._warmup_running = True
+            self._warmup_completed = set()
+            self._warmup_errors = {}
+
+        if not background:
+            self._run_warmup()
+            return None
+        self._warmup_thread = threading.Thread(target=self._run_warmup, name="store-warmup", daemon=True)
+        self._warmup_thread.start()
+        return self._warmup_thread
+
+    def _run_warmup(self) -> None:
+        """Tělo zahřátí: postupně připraví jednotlivé části a po každé z nich probudí čekající."""
+        started = time.perf_counter()
+        steps = (
+            ("catalog", self._warm_up_catalog),
+            ("keywords", self._warm_up_keywords),
+            ("search", self._warm_up_search),
+            ("details", self._warm_up_details),
+        )
+        try:
+            for capability, step in steps:
+                try:
+                    if capability == "keywords" and "catalog" in self._warmup_errors:
+                        raise RuntimeError("catalog is not loaded")
+                    step()
+                except Exception as e:
+                    self._warmup_errors[capability] = str(e)
+                    print(f"Warning [_run_warmup]: Failed to prepare '{capability}': {e}")
+                with self._warmup_condition:
+                    self._warmup_completed.add(capability)
+                    self._warmup_condition.notify_all()
+        finally:
+            with self._warmup_condition:
+                self._warmup_running = False
+                self._warmup_condition.notify_all()
+        self._startup_times.setdefault("warmup", time.perf_counter() - started)
+        ready = [c for c in WARMUP_CAPABILITIES if c not in self._warmup_errors]
+        print(f"Debug [_run_warmup]: Warm-up finished in {time.perf_counter() - started:.2f} s, {len(self._services)} services, ready: {', '.join(ready) or '-'}.")
+        # Tokenizer pro pack_services_context() se může stahovat z Hugging Face Hub, proto se na něj nečeká
+        _get_tokenizer()
+
+    def _warm_up_catalog(self) -> None:
+        if len(self._services) == 0:
+            self.load_services()
+
+    def _warm_up_keywords(self) -> None:
+        if not self._keyword_index_built:
+            self._build_keyword_index()
+
+    def _warm_up_search(self) -> None:
+        if not self._collection:
+            self._initialize_search()
+        with self._query_embeddings_lock:
+            self._get_query_embeddings_cache()
+
+    def _warm_up_details(self) -> None:
+        self._get_details_index()
+        with self._steps_lock:
+            self._get_steps_cache()
+
+    def _capability_ready(self, capability: str) -> bool:
+        if self._warmup_running and capability not in self._warmup_completed:
+            return False  # např. katalog se během studeného načtení plní postupně, ještě není celý
+        if capability == "catalog":
+            return len(self._services) > 0
+        if capability == "keywords":
+            return len(self._services) > 0 and self._keyword_index_built
+        if capability == "search":
+            return self._collection is not None
+        return self._details_index is not None
+
+    @staticmethod
+    def _check_capabilities(capabilities: Optional[Iterable[str]]) -> Tuple[str, ...]:
+        if capabilities is None:
+            return WARMUP_CAPABILITIES
+        if isinstance(capabilities, str):
+            capabilities = (capabilities,)
+        capabilities = tuple(capabilities)
+        unknown = [c for c in capabilities if c not in WARMUP_CAPABILITIES]
+        if unknown:
+            raise ValueError(f"Warning [ready]: Unknown capability {unknown[0]!r}, expected one of {WARMUP_CAPABILITIES}")
+        return capabilities
+
+    def ready(self, capabilities: Optional[Iterable[str]] = None) -> bool:
+        """
+        Vrátí True, pokud jsou dané části store připravené (bez čekání).
+
+        Args:
+            capabilities: Název části nebo jejich seznam (viz WARMUP_CAPABILITIES); None = všechny.
+        """
+        capabilities = self._check_capabilities(capabilities)
+        with self._warmup_condition:
+            return all(self._capability_ready(c) for c in capabilities)
+
+    def wait_ready(self, timeout: Optional[float] = None, capabilities: Optional[Iterable[str]] = None) -> bool:
+        """
+        Počká, až budou dané části store připravené.
+
+        Args:
+            timeout: Nejdelší doba čekání v sekundách (None = bez omezení).
+            capabilities: Název části nebo jejich seznam (viz WARMUP_CAPABILITIES); None = všechny.
+
+        Returns:
+            True = vše připraveno, False = vypršel čas nebo zahřátí neběží a části připravené nejsou.
+
+        Raises:
+            RuntimeError: Pokud se některou z částí nepodařilo při zahřátí připravit.
+        """
+        capabilities = self._check_capabilities(capabilities)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._warmup_condition:
+            while True:
+                if all(self._capability_ready(c) for c in capabilities):
+                    return True
+                failed = [c for c in capabilities if c in self._warmup_errors]
+                if failed:
+                    raise RuntimeError(f"Warning [wait_ready]: Warm-up of '{failed[0]}' failed: {self._warmup_errors[failed[0]]}")
+                if not self._warmup_running:
+                    return False
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._warmup_condition.wait(remaining)
+
+    def _await_capability(self, *capabilities: str) -> None:
+        """
+        Pokud běží zahřátí, počká na potřebné části. Část, kterou se připravit nepodařilo, si
+        volající dotvoří sám (např. _initialize_search() ohlásí vlastní chybu); bez katalogu
+        ale nemá smysl pokračovat.
+        """
+        if not self._warmup_running and "catalog" not in self._warmup_errors:
+            return
+        if threading.current_thread() is self._warmup_thread:
+            return  # volání z vlastního zahřívání by čekalo samo na sebe
+        try:
+            self.wait_ready(capabilities=capabilities)
+        except RuntimeError:
+            if "catalog" in capabilities and not self.ready("catalog"):
+                raise
+
+    def get_warmup_status(self) -> Dict[str, Any]:
+        """Vrátí stav zahřátí (idle/running/done/failed), připravenost jednotlivých částí a chyby."""
+        with self._warmup_condition:
+            if self._warmup_running:
+                state = "running"
+            elif self._warmup_errors:
+                state = "failed"
+            else:
+                state = "done" if self._warmup_completed else "idle"
+            return {
+                "state": state,
+                "ready": {c: self._capability_ready(c) for c in WARMUP_CAPABILITIES},
+                "errors": dict(self._warmup_errors),
+                "seconds": round(self._startup_times["warmup"], 4) if "warmup" in self._startup_times else None
+            }
 
     def _store_services_to_local_cache(self) -> None:
-        """Uloží aktuální seznam služeb do lokální cache (JSON)."""
+        """Uloží aktuální seznam služeb do lokální cache (JSON podle CACHE_CODEC pro výměnu dat + binární snapshot pro rychlý start)."""
+        self._materialize_services()
+        self._catalog_version = catalog_version(self._services_list)
         try:
-            output_dir = SERVICES_CACHE.parent
-            output_dir.mkdir(parents=True, exist_ok=True)
-            with open(SERVICES_CACHE, "w", encoding="utf-8") as f:
-                json.dump([s.__dict__ for s in self._services_list], f, ensure_ascii=False, indent=2)
+            write_cache(SERVICES_CACHE, [service_to_dict(s) for s in self._services_list], catalog=self._catalog_version)
         except Exception as e:
             raise RuntimeError(f"Warning [_store_services_to_local_cache]: Failed to store services to local file: {e}")
+        self._write_services_snapshot()
+
+    def _embed_query(self, query: str, model: str) -> List[float]:
+        """Spočítá embedding jednoho vyhledávacího dotazu (stejným modelem, jakým je spočítán index)."""
+        return self._embed_queries([query], model)[0]
+
+    def _embed_queries(self, queries: List[str], model: str) -> List[List[float]]:
+        """Spočítá embeddingy vyhledávacích dotazů jedním voláním API (stejným modelem, jakým je spočítán index).
+
+        Embeddingy posledních dotazů se drží v souborové cache, takže opakovaný dotaz
+        (i po restartu) API nevolá a API dostane jen dotazy, které v cache chybí. Vektory
+        se ukládají jako float32, tedy v přesnosti, ve které je API vrací.
+        """
+        embeddings: Dict[str, List[float]] = {}
+        unique_queries = list(dict.fromkeys(queries))
+        if QUERY_EMBEDDINGS_CACHE_SIZE > 0:
+            with self._query_embeddings_lock:
+                cache = self._get_query_embeddings_cache()
+                for query in unique_queries:
+                    key = f"{model}\n{query}"
+                    encoded = cache.get(key)
+                    if encoded is not None:
+                        cache.move_to_end(key)
+                        embeddings[query] = array("f", base64.b64decode(encoded)).tolist()
+
+        missing = [query for query in unique_queries if query not in embeddings]
+        if missing:
+            query_embedding_response = self._openai_client.embeddings.create(
+                input=missing,
+                model=model
+            )
+            for query, item in zip(missing, query_embedding_response.data):
+                embeddings[query] = item.embedding
+
+            if QUERY_EMBEDDINGS_CACHE_SIZE > 0:
+                with self._query_embeddings_lock:
+                    cache = self._get_query_embeddings_cache()
+                    for query in missing:
+                        cache[f"{model}\n{query}"] = base64.b64encode(array("f", embeddings[query]).tobytes()).decode("ascii")
+                    while len(cache) > QUERY_EMBEDDINGS_CACHE_SIZE:
+                        cache.popitem(last=False)
+                    try:
+                        write_cache(QUERY_EMBEDDINGS_CACHE, list(cache.items()))
+                    except Exception as e:
+                        print(f"Warning [_embed_queries]: Failed to store query embeddings cache: {e}")
+        return [embeddings[query] for query in queries]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Vrátí embeddingy vyhledávacích dotazů (v pořadí dotazů) modelem aktivního indexu.
+
+        Dotazy chybějící v cache se spočítají jedním voláním API; následné search_services()
+        se stejnými dotazy už embedding vezme z cache.
+        """
+        self._await_capability("catalog", "search")
+        if not self._collection:
+            self._initialize_search()
+        _, model = self._get_active_index()
+        return self._embed_queries(queries, model)
+
+    def _get_query_embeddings_cache(self) -> "OrderedDict[str, str]":
+        """Vrátí cache embeddingů dotazů (při prvním použití ji načte z disku); volá se pod zámkem."""
+        if self._query_embeddings is None:
+            self._query_embeddings = OrderedDict()
+            try:
+                self._query_embeddings.update(read_cache(QUERY_EMBEDDINGS_CACHE))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Warning [_get_query_embeddings_cache]: Ignoring unreadable query embeddings cache: {e}")
+        return self._query_embeddings
+
+    def _get_steps_cache(self) -> Dict[str, List[str]]:
+        """Vrátí cache kroků služeb (při prvním použití ji načte z disku); volá se pod zámkem."""
+        if self._steps_cache is None:
+            self._steps_cache = {}
+            try:
+                # Kroky platí jen pro katalog, ze kterého byly staženy
+                self._steps_cache.update(read_cache(STEPS_CACHE, catalog=self._catalog_version))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Warning [_get_steps_cache]: Discarding steps cache: {e}")
+        return self._steps_cache
+
+    def search_services(
+        self,
+        query: str,
+        k: int = 10,
+        keywords: Optional[List[str]] = None,
+        match_all_keywords: bool = False,
+        digital_only: bool = False,
+        channel: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[GovernmentService]:
+        """
+        Najde služby sémanticky podobné dotazu.
+
+        Args:
+            query: Text dotazu.
+            k: Maximální počet vrácených služeb.
+            keywords: Volitelný filtr klíčových slov; hledá se pouze mezi službami, které je mají.
+            match_all_keywords: True = služba musí mít všechna klíčová slova (AND), jinak alespoň jedno (OR).
+            digital_only: Vracet jen služby s digitálními kroky přes datovou schránku.
+            channel: Vracet jen služby s úkonem realizovaným daným typem kanálu (např. "DATOVA_SCHRANKA").
+            where: Další vlastní `where` filtr nad metadaty v Chroma (např. {"step_count": {"$gte": 2}}).
+        """
+        results = self.search_services_scored(query, k, keywords, match_all_keywords, digital_only, channel, where)
+        return [service for service, _ in results]
+
+    def search_services_scored(
+        self,
+        query: str,
+        k: int = 10,
+        keywords: Optional[List[str]] = None,
+        match_all_keywords: bool = False,
+        digital_only: bool = False,
+        channel: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[GovernmentService, float]]:
+        """
+        Najde služby sémanticky podobné dotazu a ke každé vrátí její kosinovou podobnost s dotazem
+        (1 = shodný směr embeddingů, 0 = nesouvisející); služby jsou seřazené od nejpodobnější.
 
-    def search_services(self, query: str, k: int = 10) -> List[GovernmentService]:
-        """Najde služby sémanticky podobné dotazu."""
-        print(f"Debug [search_services]: called with query='{query}', k={k}")
+        Argumenty jsou stejné jako u search_services().
+        """
+        print(f"Debug [search_services]: called with query='{query}', k={k}, keywords={keywords}, digital_only={digital_only}, channel={channel}, where={where}")
+        started = time.perf_counter()
         if not query.strip():
             print("Warning [search_services]: Empty query provided. Returning empty list.")
             return []
 
+        candidate_ids = None
+        if keywords:
+            candidate_ids = self._get_service_ids_by_keywords(keywords, match_all_keywords)
+            if not candidate_ids:
+                print("Debug [search_services]: No services match the keyword filter. Returning empty list.")
+                return []
+
+        self._await_capability("catalog", "search")
         if not self._collection:
             self._initialize_search()
+        collection, model = self._get_active_index()
 
-        query_embedding_response = self._openai_client.embeddings.create(
-            input=[query],
-            model=EMBEDDINGS_MODEL
+        where_filter = self._build_where_filter(digital_only, channel, where)
+        if where_filter:
+            self._ensure_index_metadata()
+
+        cache_key = (
+            normalize_query(query),
+            k,
+            tuple(sorted(_normalize_keyword(kw) for kw in keywords)) if keywords else (),
+            match_all_keywords,
+            json.dumps(where_filter, sort_keys=True, ensure_ascii=False) if where_filter else "",
+            self._index_generation
         )
-        query_embedding = query_embedding_response.data[0].embedding
+        cached = self._get_cached_search(cache_key)
+        if cached is not None:
+            self._record_first_query(started)
+            return [(self._services[i], similarity) for i, similarity in cached if i in self._services]
+
+        query_embedding = self._embed_query(query, model)
 
-        results = self._collection.query(
+        # Klíčová slova a atributy (pokud jsou zadány) zúží prohledávaný prostor ještě před vektorovým dotazem
+        results = collection.query(
             query_embeddings=[query_embedding],
-            n_results=k
+            ids=sorted(candidate_ids) if candidate_ids is not None else None,
+            where=where_filter,
+            n_results=k,
+            include=["distances"]  # služby hydratujeme z paměti, dokumenty ani metadata nepotřebujeme
         )
-        ids = results['ids'][0]
-        return [self._services[i] for i in ids if i in self._services]
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        scored = [(i, _distance_to_similarity(distance, space)) for i, distance in zip(results['ids'][0], results['distances'][0])]
+        self._put_cached_search(cache_key, scored)
+        self._record_first_query(started)
+        return [(self._services[i], similarity) for i, similarity in scored if i in self._services]
+
+    def _record_first_query(self, started: float) -> None:
+        """Zaznamená dobu prvního vyhledávání a čas od importu modulu; případně vypíše přehled startu."""
+        if "first_query" in self._startup_times:
+            return
+        now = time.perf_counter()
+        self._startup_times["first_query"] = now - started
+        self._startup_times["time_to_first_query"] = now - _MODULE_IMPORT_STARTED
+        report = self.get_startup_report()
+        if STARTUP_REPORT:
+            print(f"Debug [search_services]: Startup report: {json.dumps(report, ensure_ascii=False)}")
+        if report["within_budget"] is False:
+            print(f"Warning [search_services]: First query took {report['time_to_first_query']} s after module import, startup budget is {STARTUP_BUDGET_SECONDS} s")
+
+    def get_startup_report(self) -> Dict[str, Any]:
+        """
+        Vrátí přehled doby startu v sekundách: import modulu, líné importy závislostí,
+        načtení služeb, příprava vyhledávání, první vyhledávání a celkový čas od importu
+        modulu po dokončení prvního vyhledávání (None = fáze ještě neproběhla).
+        """
+        def seconds(value: Optional[float]) -> Optional[float]:
+            return round(value, 4) if value is not None else None
+
+        time_to_first_query = self._startup_times.get("time_to_first_query")
+        return {
+            "module_import": seconds(_MODULE_IMPORT_SECONDS),
+            "dependency_imports": {name: seconds(value) for name, value in _IMPORT_TIMES.items()},
+            "load_services": seconds(self._startup_times.get("load_services")),
+            "initialize_search": seconds(self._startup_times.get("initialize_search")),
+            "first_query": seconds(self._startup_times.get("first_query")),
+            "time_to_first_query": seconds(time_to_first_query),
+            "budget": STARTUP_BUDGET_SECONDS or None,
+            "within_budget": (time_to_first_query <= STARTUP_BUDGET_SECONDS) if STARTUP_BUDGET_SECONDS > 0 and time_to_first_query is not None else None
+        }
+
+    def _get_cached_search(self, cache_key: tuple) -> Optional[List[Tuple[str, float]]]:
+        """Vrátí uložené výsledky [(ID, podobnost)] pro daný klíč (a označí je jako naposledy použité), jinak None."""
+        if SEARCH_CACHE_SIZE <= 0:
+            return None
+        with self._search_cache_lock:
+            results = self._search_cache.get(cache_key)
+            if results is None:
+                self._search_cache_misses += 1
+                return None
+            self._search_cache.move_to_end(cache_key)
+            self._search_cache_hits += 1
+            return results
+
+    def _put_cached_search(self, cache_key: tuple, results: List[Tuple[str, float]]) -> None:
+        """Uloží výsledky [(ID, podobnost)] do LRU cache; nejdéle nepoužitý záznam při překročení limitu vypadne."""
+        if SEARCH_CACHE_SIZE <= 0:
+            return
+        with self._search_cache_lock:
+            if cache_key[-1] != self._index_generation:
+                return  # index se mezitím změnil, výsledek už není aktuální
+            self._search_cache[cache_key] = list(results)
+            self._search_cache.move_to_end(cache_key)
+            while len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+
+    def get_search_cache_statistics(self) -> Dict[str, Any]:
+        """Vrátí metriky cache výsledků vyhledávání (počet zásahů, úspěšnost, velikost)."""
+        with self._search_cache_lock:
+            lookups = self._search_cache_hits + self._search_cache_misses
+            return {
+                "hits": self._search_cache_hits,
+                "misses": self._search_cache_misses,
+                "hit_rate": round(self._search_cache_hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._search_cache),
+                "max_size": SEARCH_CACHE_SIZE,
+                "index_generation": self._index_generation
+            }
 
-    def get_service_detail_by_id(self, service_id: str) -> Optional[str]:
-        """Vrátí rozšířené textové detaily o službě (z details JSON)."""
+    @staticmethod
+    def _build_where_filter(digital_only: bool, channel: Optional[str], where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Poskládá `where` filtr pro Chroma z atributových podmínek vyhledávání."""
+        conditions: List[Dict[str, Any]] = []
+        if digital_only:
+            conditions.append({"has_digital_steps": True})
+        if channel:
+            conditions.append({f"channel_{channel}": True})
+        if where:
+            conditions.append(where)
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def get_service_detail_record(self, service_id: str) -> Optional[ServiceDetail]:
+        """Vrátí strukturovaný detail služby (z details JSON), nebo None, pokud služba detail nemá."""
         if not DETAILS_PATH.exists():
-            print(f"Warning [get_service_detail_by_id {service_id}]: Details file not found at {DETAILS_PATH}")
+            print(f"Warning [get_service_detail_record {service_id}]: Details file not found at {DETAILS_PATH}")
             return None
-        with open(DETAILS_PATH, "r", encoding="utf-8") as f:
-            details_data = json.load(f)
-
-        # Check if data has the expected structure with "položky" key
-        items = details_data.get("položky", details_data) if isinstance(details_data, dict) else details_data
-        
-        for item in items:
-            if isinstance(item, dict):
-                # Extract service ID using consistent logic
-                raw_id = item.get("id", "") or item.get("iri", "")
-                item_id = _extract_id_from_uri(raw_id) if raw_id else ""
-                if item_id == service_id:
-                    return f"<popis>{_safe_get_cs_from_item(item, 'popis')}</popis><benefit>{_safe_get_cs_from_item(item, 'jaký-má-služba-benefit')}</benefit>\n<jak-resit>{_safe_get_cs_from_item(item, 'kde-a-jak-službu-řešit-el')}</jak-resit>\n<kdy-resit>{_safe_get_cs_from_item(item, 'kdy-službu-řešit')}</kdy-resit>\n<resit-pokud>{_safe_get_cs_from_item(item, 'týká-se-vás-to-pokud')}</resit-pokud>\n<zpusob-vyrizeni>{_safe_get_cs_from_item(item, 'způsob-vyřízení-el')}</zpusob-vyrizeni>"
+        item = self._get_details_index().get(service_id)
+        if item is None:
+            return None
+        return ServiceDetail.from_item(service_id, item)
 
-        return None
+    def get_service_detail_by_id(self, service_id: str, output_format: Optional[str] = None) -> Optional[str]:
+        """
+        Vrátí rozšířené detaily o službě (z details JSON) vykreslené v daném formátu.
+        Vykreslený detail si store pamatuje, další dotaz na stejnou službu a formát je jen čtení ze slovníku
+        (pamatují se jen nalezené detaily, pro neznámá ID slovník neroste).
+
+        Args:
+            service_id: ID služby.
+            output_format: Název formátu z DETAIL_RENDERERS ("text", "xml"); None = DETAIL_FORMAT.
+        """
+        output_format = output_format or DETAIL_FORMAT
+        key = (service_id, output_format)
+        with self._details_lock:
+            fragment = self._detail_fragments.get(key)
+        if fragment is not None:
+            return fragment
+        renderer = DETAIL_RENDERERS.get(output_format)
+        if renderer is None:
+            raise ValueError(f"Warning [get_service_detail_by_id]: Unknown detail format {output_format!r}, expected one of {sorted(DETAIL_RENDERERS)}")
+        if not DETAILS_PATH.exists():
+            print(f"Warning [get_service_detail_by_id {service_id}]: Details file not found at {DETAILS_PATH}")
+            return None
+        detail = self.get_service_detail_record(service_id)
+        if detail is None:
+            return None
+        fragment = renderer(detail)
+        with self._details_lock:
+            self._detail_fragments[key] = fragment
+        return fragment
 
-    def get_service_steps_by_id(self, service_id: str) -> List[str]:
+    def get_service_steps_by_id(self, service_id: str, timeout: Optional[float] = None) -> List[str]:
         """
         Vrátí seznam „úkonů/kroků“ vybrané služby pomocí SPARQL dotazu.
         Každá položka je ve formátu: "název_úkonu: popis_úkonu".
         Filtrovány jsou digitální úkony realizované kanálem „DATOVA_SCHRANKA“.
+        Stažené kroky se ukládají do STEPS_CACHE, takže se na službu ptáme jen jednou.
 
         Args:
             service_id: ID služby, pro kterou chceme kroky získat.
+            timeout: Časový limit dotazu v sekundách (None = SPARQL_TIMEOUT).
 
         Returns:
             Seznam textových kroků ve formátu "název: popis". Pokud nic nenajdeme, vrací prázdný seznam.
@@ -354,27 +1549,39 @@ class GovernmentServicesStore:
         if not service_id:
             return []
 
+        # Předpočítané atributy ušetří dotaz na SPARQL u služeb, které žádné digitální kroky nemají
+        self._await_capability("catalog")
+        service = self._services.get(service_id)
+        if service is not None and service.attributes_loaded and not service.has_digital_steps:
+            print(f"Debug [get_service_steps_by_id {service_id}]: Service has no digital steps, skipping SPARQL query")
+            return []
+
+        with self._steps_lock:
+            cached_steps = self._get_steps_cache().get(service_id)
+        if cached_steps is not None:
+            print(f"Debug [get_service_steps_by_id {service_id}]: Returning {len(cached_steps)} cached steps")
+            return list(cached_steps)
+
         sparql_endpoint = "https://rpp-opendata.egon.gov.cz/odrpp/sparql/"
 
+        # Dotaz jde přímo na endpoint bez sdíleného stavu, takže kroky více služeb
+        # lze stahovat souběžně (viz prefetch_service_context()) a s časovým limitem
         sparql_str = f"""
         PREFIX rppl: <https://slovník.gov.cz/legislativní/sbírka/111/2009/pojem/>
         PREFIX rppa: <https://slovník.gov.cz/agendový/104/pojem/>
         SELECT ?step ?name ?description
         WHERE {{
-          SERVICE <{sparql_endpoint}> {{
-            <https://rpp-opendata.egon.gov.cz/odrpp/zdroj/služba/{service_id}> rppa:skládá-se-z-úkonu ?step .
+            <{SERVICE_URI_PREFIX}{service_id}> rppa:skládá-se-z-úkonu ?step .
             ?step rppa:je-digitální true .
             ?step rppa:má-název-úkonu-služby ?name ;
                   rppa:má-popis-úkonu-služby ?description ;
                   rppa:je-realizován-kanálem/rppa:má-typ-obslužného-kanálu <https://rpp-opendata.egon.gov.cz/odrpp/zdroj/typ-obslužného-kanálu/DATOVA_SCHRANKA>
-          }}
         }}
         ORDER BY ?step
         """
 
         try:
-            g = Graph()
-            results = g.query(sparql_str)
+            results = _query_sparql_endpoint(sparql_endpoint, sparql_str, timeout=SPARQL_TIMEOUT if timeout is None else timeout)
 
             steps: List[str] = []
             for row in results:
@@ -395,16 +1602,240 @@ class GovernmentServicesStore:
                     continue
 
             print(f"Debug [get_service_steps_by_id {service_id}]: Successfully retrieved {len(steps)} steps for service {service_id}")
-            return steps
-
         except Exception as e:
             raise RuntimeError(f"Warning [get_service_steps_by_id {service_id}]: Failed to retrieve steps for service {service_id}: {e}")
 
+        with self._steps_lock:
+            steps_cache = self._get_steps_cache()
+            steps_cache[service_id] = steps
+            try:
+                write_cache(STEPS_CACHE, steps_cache, catalog=self._catalog_version)
+            except Exception as cache_error:
+                print(f"Warning [get_service_steps_by_id {service_id}]: Failed to store steps cache: {cache_error}")
+        return list(steps)
+
+    def build_services_context(self, services: Iterable[Union[GovernmentService, str]], detail_format: str = "xml") -> str:
+        """
+        Sestaví XML kontext <sluzby> pro jazykový model: u každé služby ID, název, detail a digitální kroky.
+
+        Fragment každé služby se sestaví jen jednou (detaily a kroky chybějících služeb se načítají
+        souběžně přes prefetch_service_context()) a hotový dokument se pamatuje podle ID služeb, takže
+        opakované sestavení pro stejné služby v jednom kole konverzace nic nenačítá ani neskládá.
+        Služba, jejíž kroky se nepodařilo načíst (chyba nebo CONTEXT_FETCH_TIMEOUT), se do kontextu
+        dostane bez kroků a její fragment se nepamatuje, aby se to příště zkusilo znovu.
+
+        Args:
+            services: Služby (nebo jejich ID) v pořadí, v jakém se mají v kontextu objevit.
+            detail_format: Formát detailu uvnitř <detail> (viz DETAIL_RENDERERS); výchozí "xml" = <popis>, <benefit>…
+        """
+        entries = [(s.id, s.name) if isinstance(s, GovernmentService) else (s, None) for s in services]
+        key = (tuple(service_id for service_id, _ in entries), detail_format)
+        if CONTEXT_CACHE_SIZE > 0:
+            with self._context_lock:
+                document = self._contexts.get(key)
+                if document is not None:
+                    self._contexts.move_to_end(key)
+                    return document
+
+        missing = {service_id: name for service_id, name in entries if (service_id, detail_format) not in self._context_fragments}
+        failed = self.prefetch_service_context(list(missing), detail_format) if missing else {}
+        built = {}
+        for service_id, name in missing.items():
+            if service_id in failed:
+                print(f"Warning [build_services_context]: Steps of service {service_id} not available, using context without steps: {failed[service_id]}")
+            built[service_id] = self._build_service_context_fragment(service_id, name, detail_format, include_steps=service_id not in failed)
+
+        document = "<sluzby>\n" + "".join(built.get(service_id) or self._context_fragments[(service_id, detail_format)] for service_id, _ in entries) + "</sluzby>"
+        if CONTEXT_CACHE_SIZE > 0 and not failed:
+            with self._context_lock:
+                self._contexts[key] = document
+                while len(self._contexts) > CONTEXT_CACHE_SIZE:
+                    self._contexts.popitem(last=False)
+        return document
+
+    def pack_services_context(self, services: Iterable[Union[GovernmentService, str]], token_budget: Optional[int] = None,
+                              detail_format: str = "xml", stable_order: bool = False) -> Tuple[str, Dict[str, Any]]:
+        """
+        Sestaví kontext <sluzby> jako build_services_context(), ale tak, aby se vešel do rozpočtu tokenů.
+
+        Služby se berou v zadaném pořadí (od nejrelevantnější). Když se celý kontext nevejde, zkracují se
+        pole služeb podle CONTEXT_FIELD_PRIORITY – od nejméně důležitého pole a u každého pole od nejméně
+        relevantní služby: nejdřív na CONTEXT_FIELD_TOKENS tokenů, potom se obsah pole vynechá („…“).
+        Nestačí-li ani to, vynechají se nejméně relevantní služby celé.
+
+        Args:
+            services: Služby (nebo jejich ID) seřazené podle relevance.
+            token_budget: Nejvyšší počet tokenů kontextu (None = CONTEXT_TOKEN_BUDGET).
+            detail_format: Formát detailu uvnitř <detail> (viz DETAIL_RENDERERS).
+            stable_order: Služby v kontextu seřadit podle ID (o zkrácení rozhoduje dál relevance), aby
+                stejná sada služeb dala vždy bajtově stejný text – kvůli prompt cachingu u poskytovatele.
+
+        Returns:
+            Dvojice (kontext, přehled) – přehled obsahuje rozpočet, počet použitých tokenů a ID služeb
+            zkrácených a vynechaných.
+        """
+        budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+        if budget <= 0:
+            raise ValueError(f"token_budget must be positive, got {budget}")
+        services = list(services)
+
+        # Dokud se vše vejde, stačí kontext z build_services_context() (fragmenty i dokument si pamatuje)
+        ordered = sorted(services, key=lambda s: s.id if isinstance(s, GovernmentService) else s) if stable_order else services
+        document = self.build_services_context(ordered, detail_format)
+        tokens = count_tokens(document)
+        report = {"token_budget": budget, "tokens": tokens, "services": len(services), "truncated": [], "omitted": [],
+                  "tokenizer": _tokenizer_source if _get_tokenizer() else "estimate"}
+        if tokens <= budget:
+            return document, report
+
+        renderer = DETAIL_RENDERERS[detail_format]
+        rendered_fields = DETAIL_RENDERER_FIELDS.get(detail_format, CONTEXT_FIELD_PRIORITY)
+        items = []
+        for service in services:
+            service_id, name = (service.id, service.name) if isinstance(service, GovernmentService) else (service, None)
+            if name is None:
+                known = self._services.get(service_id)
+                name = known.name if known is not None else ""
+            # Kroky jsou po build_services_context() v cache; bez zapamatovaného fragmentu je načíst nešlo
+            has_steps = (service_id, detail_format) in self._context_fragments
+            fields_values = {"kroky": self.get_service_steps_by_id(service_id) if has_steps else []}
+            record = self.get_service_detail_record(service_id)
+            if record is not None:
+                fields_values.update((field, getattr(record, field)) for field in CONTEXT_FIELD_PRIORITY
+                                     if field != "kroky" and field in rendered_fields)
+            fragment = self._context_fragments.get((service_id, detail_format)) or _render_service_context(
+                service_id, name, self.get_service_detail_by_id(service_id, detail_format), [], detail_format)
+            items.append({"id": service_id, "name": name, "record": record, "fields": fields_values,
+                          "fragment": fragment, "tokens": count_tokens(fragment)})
+
+        overhead = count_tokens("<sluzby>\n</sluzby>")
+        total = overhead + sum(item["tokens"] for item in items)
+        truncated: Set[str] = set()
+        for action in ("truncate", "omit"):
+            for field in reversed(CONTEXT_FIELD_PRIORITY):
+                for item in reversed(items):
+                    if total <= budget:
+                        break
+                    value = item["fields"].get(field)
+                    if not value:
+                        continue
+                    if field == "kroky":
+                        if action == "omit":
+                            shortened = []
+                        else:
+                            shortened, used = [], 0
+                            for step in value:
+                                used += count_tokens(step)
+                                if used > CONTEXT_FIELD_TOKENS:
+                                    break
+                                shortened.append(step)
+                    else:
+                        shortened = "…" if action == "omit" else _truncate_to_tokens(value, CONTEXT_FIELD_TOKENS)
+                    if shortened == value:
+                        continue
+                    item["fields"][field] = shortened
+                    detail = None
+                    if item["record"] is not None:
+                        detail = renderer(replace(item["record"], **{f: v for f, v in item["fields"].items() if f != "kroky"}))
+                    fragment = _render_service_context(item["id"], item["name"], detail, item["fields"]["kroky"], detail_format)
+                    tokens = count_tokens(fragment)
+                    total += tokens - item["tokens"]
+                    item["tokens"] = tokens
+                    item["fragment"] = fragment
+                    truncated.add(item["id"])
+
+        # Součet fragmentů je jen odhad (tokeny na hranicích fragmentů se mohou sloučit), rozhoduje celý dokument
+        omitted = []
+        while True:
+            while total > budget and items:
+                item = items.pop()
+                total -= item["tokens"]
+                omitted.append(item["id"])
+            ordered = sorted(items, key=lambda item: item["id"]) if stable_order else items
+            document = "<sluzby>\n" + "".join(item["fragment"] for item in ordered) + "</sluzby>"
+            tokens = count_tokens(document)
+            if tokens <= budget or not items:
+                break
+            total = tokens
+        if omitted:
+            print(f"Warning [pack_services_context]: {len(omitted)} least relevant services do not fit into {budget} tokens, omitting them")
+
+        report.update(tokens=tokens, truncated=[item["id"] for item in items if item["id"] in truncated], omitted=omitted[::-1])
+        return document, report
+
+    def prefetch_service_context(self, service_ids: Iterable[str], detail_format: Optional[str] = None,
+                                 timeout: Optional[float] = None) -> Dict[str, str]:
+        """
+        Souběžně načte detaily a kroky zadaných služeb do cache, aby je následné sestavení kontextu
+        už jen četlo. Dotazy běží na nejvýše CONTEXT_FETCH_WORKERS vláknech a každý má časový limit,
+        takže celé načtení trvá zhruba jako nejpomalejší jednotlivý dotaz, ne jako jejich součet.
+
+        Args:
+            service_ids: ID služeb, které chceme načíst.
+            detail_format: Formát detailu, který se má předpočítat (None = DETAIL_FORMAT).
+            timeout: Časový limit v sekundách pro jeden dotaz i pro čekání na všechny (None = CONTEXT_FETCH_TIMEOUT).
+
+        Returns:
+            Slovník {service_id: popis chyby} pro služby, jejichž načtení selhalo nebo nestihlo limit;
+            prázdný slovník, pokud se načetlo vše.
+        """
+        timeout = CONTEXT_FETCH_TIMEOUT if timeout is None else timeout
+        service_ids = list(dict.fromkeys(service_id for service_id in service_ids if service_id))
+        if not service_ids:
+            return {}
+        self._await_capability("catalog")
+
+        def fetch(service_id: str) -> None:
+            self.get_service_detail_by_id(service_id, detail_format)
+            self.get_service_steps_by_id(service_id, timeout=timeout)
+
+        errors: Dict[str, str] = {}
+        if len(service_ids) == 1 or CONTEXT_FETCH_WORKERS <= 1:
+            for service_id in service_ids:
+                try:
+                    fetch(service_id)
+                except Exception as e:
+                    errors[service_id] = str(e)
+            return errors
+
+        # Bez "with": na dotazy, které nestihly limit, nečekáme (doběhnou na pozadí a uloží se do cache)
+        pool = ThreadPoolExecutor(max_workers=min(CONTEXT_FETCH_WORKERS, len(service_ids)), thread_name_prefix="services-context")
+        try:
+            futures = {pool.submit(fetch, service_id): service_id for service_id in service_ids}
+            _, pending = _wait_futures(futures, timeout=timeout)
+            for future, service_id in futures.items():
+                if future in pending:
+                    errors[service_id] = f"timed out after {timeout:g} s"
+                elif future.exception() is not None:
+                    errors[service_id] = str(future.exception())
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if errors:
+            print(f"Warning [prefetch_service_context]: Failed to prefetch {len(errors)} of {len(service_ids)} services")
+        return errors
+
+    def _build_service_context_fragment(self, service_id: str, name: Optional[str], detail_format: str,
+                                        include_steps: bool = True) -> str:
+        """Sestaví fragment <sluzba> jedné služby pro build_services_context(); kompletní fragment si zapamatuje."""
+        if name is None:
+            service = self._services.get(service_id)
+            name = service.name if service is not None else ""
+        detail = self.get_service_detail_by_id(service_id, detail_format)
+        steps = self.get_service_steps_by_id(service_id) if include_steps else []
+        fragment = _render_service_context(service_id, name, detail, steps, detail_format)
+        if include_steps:
+            with self._context_lock:
+                self._context_fragments[(service_id, detail_format)] = fragment
+        return fragment
+
     def get_services_embedding_statistics(self) -> Dict[str, Any]:
         """Vrátí základní statistiky o stavu embeddingů."""
+        self._await_capability("catalog")
         if not self._collection:
             try:
-                self._initialize_search()
+                self._await_capability("search")
+                if not self._collection:
+                    self._initialize_search()
             except Exception:
                 return {
                     "embeddings_computed": False,
@@ -421,5 +1852,11 @@ class GovernmentServicesStore:
             "embeddings_computed": self._embeddings_computed,
             "total_embeddings": total_embeddings,
             "total_services": total_services,
-            "coverage_percentage": round(coverage, 2)
-        }
\ No newline at end of file
+            "coverage_percentage": round(coverage, 2),
+            "embeddings_model": self._active_model,
+            "index_migration": self._migration_status["state"]
+        }
+
+
+# Doba importu samotného modulu (bez těžkých závislostí, ty se načítají až při použití)
+_MODULE_IMPORT_SECONDS = time.perf_counter() - _MODULE_IMPORT_STARTED
@@ -1,4 +1,6 @@
 from government_services_store import GovernmentServicesStore
+# prompt_builder.py je ve společné složce shared/ (do sys.path ji přidá import government_services_store)
+from prompt_builder import build_input, record_usage
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
@@ -40,61 +42,35 @@ class Postup(BaseModel):
     kroky: list[KrokPostupu] = Field(description="Uspořádaný seznam kroků, které je potřeba provést")
 
 if results:
-    sluzby_xml = "<sluzby>\n"
-    
-    for service in results:
-        sluzby_xml += f"  <sluzba>\n"
-        sluzby_xml += f"    <id>{service.id}</id>\n"
-        sluzby_xml += f"    <nazev>{service.name}</nazev>\n"
-        
-        detail = store.get_service_detail_by_id(service.id)
-        if detail:
-            sluzby_xml += f"    <detail>{detail}</detail>\n"
-        
-        steps = store.get_service_steps_by_id(service.id)
-        if steps:
-            sluzby_xml += f"    <kroky>\n"
-            for step in steps:
-                sluzby_xml += f"      <krok>{step}</krok>\n"
-            sluzby_xml += f"    </kroky>\n"
-        
-        sluzby_xml += f"  </sluzba>\n"
-    
-    sluzby_xml += "</sluzby>"
+    # Detaily a kroky nalezených služeb načte store souběžně a poskládá z nich XML <sluzby>;
+    # aby se kontext vešel do rozpočtu tokenů, zkrátí méně důležitá pole u méně relevantních služeb.
+    # V kontextu jsou služby seřazené podle ID, aby stejná sada služeb dala vždy stejný prefix promptu.
+    sluzby_xml, kontext = store.pack_services_context(results, stable_order=True)
+    print(f"Kontext služeb: {kontext['tokens']} tokenů z {kontext['token_budget']} (zkráceno {len(kontext['truncated'])}, vynecháno {len(kontext['omitted'])} služeb)")
 else:
     print("Žádné služby nenalezeny, asistent vám bohužel nemůže pomoci")
 
 if results:
     response = client.responses.parse(
         model="gpt-5-mini",
-        input=[
-            {
-                "role": "developer",
-                "content": "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Vždy poradíš, jak danou životní situaci vyřešit z úředního hlediska poskytnutím konkrétního postupu v podobě číslovaných kroků. Uživatel potřebuje srozumitelné ale krátké vysvětlení každého kroku jednoduchou češtinou."
-            },{
-                "role": "developer",
-                "content": "Odpovídej *VÝHRADNĚ* na základě přiloženého XML se seznamem služeb (viz <sluzby> dále). Každá služba je uvedena ve struktuře: <id> (jednoznačný identifikátor služby), <nazev> (krátký název služby), <detail> (detailní informace o službě) a <kroky> (úřední kroky, v rámci kterých je potřeba službu řešit). <detail> se skládá z následujícíh částí: <popis> (Základní vymezení služby a upřesnění názvu, pokud není dost jednoznačný.), <benefit> (Atribut popisuje, jaký přínos má pro klienta využití služby.), <jak-resit> (Jakým způsobem se služba řeší elektronicky včetně případného ID datové schránky, mailové adresy či jiných digitálních kanálů.), <kdy-resit> (Popisuje, v jakou chvíli může nebo musí být iniciováno čerpání služby.), <resit-pokud> (Vymezení toho, kdo může službu využívat a za jakých podmínek se ho týká.), <zpusob-vyrizeni> (Co potřebuje klient, aby mohl službu řešit elektronicky (typicky doklady, žádosti apod.)"
-            },{
-                "role": "developer",
-                "content": "Kroky služeb nemusíš v popisu striktně dodržovat, ale zkombinuj je tak, aby dávaly v kontextu situace uživatele smysl."
-            },{
-                "role": "developer",
-                "content": "*Nikdy nepoužívej žádné znalosti mimo ty uvedené v XML*. Vždy je ale tvým hlavním cílem postup v informacích o službách v přiloženém XML zjistit a uživateli vysvětlit. Může se ale stát, že XML neobsahuje informace o žádných relevantních službách. V takovém případě *NESMÍŠ* poskytnout žádné kroky, tj. seznam kroků bude prázdný, a v úvodu *MUSÍŠ* výslovně napsat, že nemáš potřebné informace a tedy neposkytuješ žádný návod ani postup."
-            },{
-                "role": "developer",
-                "content": "*Nikdy nesmíš v žádném kroku postupu poskytovat radu v oboru, kterého se dotaz uživatele týká, např. lékařské rady, stavební rady, atd.* Uživateli pouze můžeš napsat, aby odborníka vyhledal a navštívil bez jakýchkoliv časových, situačních či jiných podmínek a doporučení."
-            },{
-                "role": "developer",
-                "content": sluzby_xml
-            },{
-                "role": "user",
-                "content": user_query
-            }
-        ],
+        **build_input(
+            shared_instructions=[
+                "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Vždy poradíš, jak danou životní situaci vyřešit z úředního hlediska poskytnutím konkrétního postupu v podobě číslovaných kroků. Uživatel potřebuje srozumitelné ale krátké vysvětlení každého kroku jednoduchou češtinou.",
+                "Odpovídej *VÝHRADNĚ* na základě přiloženého XML se seznamem služeb (viz <sluzby> dále). Každá služba je uvedena ve struktuře: <id> (jednoznačný identifikátor služby), <nazev> (krátký název služby), <detail> (detailní informace o službě) a <kroky> (úřední kroky, v rámci kterých je potřeba službu řešit). <detail> se skládá z následujícíh částí: <popis> (Základní vymezení služby a upřesnění názvu, pokud není dost jednoznačný.), <benefit> (Atribut popisuje, jaký přínos má pro klienta využití služby.), <jak-resit> (Jakým způsobem se služba řeší elektronicky včetně případného ID datové schránky, mailové adresy či jiných digitálních kanálů.), <kdy-resit> (Popisuje, v jakou chvíli může nebo musí být iniciováno čerpání služby.), <resit-pokud> (Vymezení toho, kdo může službu využívat a za jakých podmínek se ho týká.), <zpusob-vyrizeni> (Co potřebuje klient, aby mohl službu řešit elektronicky (typicky doklady, žádosti apod.)",
+                "Kroky služeb nemusíš v popisu striktně dodržovat, ale zkombinuj je tak, aby dávaly v kontextu situace uživatele smysl.",
+                "*Nikdy nepoužívej žádné znalosti mimo ty uvedené v XML*. Vždy je ale tvým hlavním cílem postup v informacích o službách v přiloženém XML zjistit a uživateli vysvětlit. Může se ale stát, že XML neobsahuje informace o žádných relevantních službách. V takovém případě *NESMÍŠ* poskytnout žádné kroky, tj. seznam kroků bude prázdný, a v úvodu *MUSÍŠ* výslovně napsat, že nemáš potřebné informace a tedy neposkytuješ žádný návod ani postup.",
+                "*Nikdy nesmíš v žádném kroku postupu poskytovat radu v oboru, kterého se dotaz uživatele týká, např. lékařské rady, stavební rady, atd.* Uživateli pouze můžeš napsat, aby odborníka vyhledal a navštívil bez jakýchkoliv časových, situačních či jiných podmínek a doporučení."
+            ],
+            context=sluzby_xml,
+            conversation=[
+                {"role": "user", "content": user_query}
+            ]
+        ),
         text={"verbosity": "medium"},
         reasoning={"effort": "minimal"},
         text_format=Postup
     )
+    record_usage("postup", response)
 
     print("AI odpověď:")
     postup = response.output_parsed
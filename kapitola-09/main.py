@@ -1,9 +1,13 @@
+import asyncio
 from typing import List
 from government_services_store import GovernmentServicesStore
-from openai import OpenAI
+# prompt_builder.py je ve společné složce shared/ (do sys.path ji přidá import government_services_store)
+from prompt_builder import build_input, record_usage
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 import os
 from pydantic import BaseModel, Field
+from xml.sax.saxutils import escape
 
 store = GovernmentServicesStore()
 store.load_services()
@@ -40,27 +44,40 @@ class Postup(BaseModel):
 class NavrzenaVyhledavani(BaseModel):
     dotazy: list[str] = Field(description="Seznam fulltextových dotazů pro vyhledání relevantních služeb")
 
+class PosouzeniSluzby(BaseModel):
+    sluzba_id: str = Field(description="ID posuzované služby (hodnota <id> z přiloženého XML)")
+    relevantni: bool = Field(description="True, pokud je služba pro životní situaci uživatele relevantní, jinak False")
+
+class PosouzeniRelevance(BaseModel):
+    posouzeni: list[PosouzeniSluzby] = Field(description="Posouzení relevance každé z přiložených služeb")
+
+
+# Instrukce společné všem voláním, která pracují se seznamem služeb. Jsou na začátku vstupu a za nimi
+# hned XML <sluzby>, takže volání nad stejnými službami sdílejí prefix promptu a poskytovatel ho vezme z cache.
+SPOLECNE_INSTRUKCE = [
+    "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě.",
+    "Služby veřejné správy, se kterými pracuješ, jsou přiloženy jako XML (viz <sluzby> dále, seznam může být i prázdný). Každá služba je uvedena ve struktuře: <id> (jednoznačný identifikátor služby), <nazev> (krátký název služby), <detail> (detailní informace o službě) a <kroky> (úřední kroky, v rámci kterých je potřeba službu řešit). <detail> se skládá z následujícíh částí: <popis> (Základní vymezení služby a upřesnění názvu, pokud není dost jednoznačný.), <benefit> (Atribut popisuje, jaký přínos má pro klienta využití služby.), <jak-resit> (Jakým způsobem se služba řeší elektronicky včetně případného ID datové schránky, mailové adresy či jiných digitálních kanálů.), <kdy-resit> (Popisuje, v jakou chvíli může nebo musí být iniciováno čerpání služby.), <resit-pokud> (Vymezení toho, kdo může službu využívat a za jakých podmínek se ho týká.), <zpusob-vyrizeni> (Co potřebuje klient, aby mohl službu řešit elektronicky (typicky doklady, žádosti apod.)"
+]
+
 
 def generuj_navrhy_vyhledavacich_dotazu(user_query: str) -> List[str]:
 
     response = client.responses.parse(
         model="gpt-5-mini",
-        input=[
-            {
-                "role": "developer",
-                "content": "Jsi odborník na vyhledávání služeb veřejné správy vhodných pro řešení životních situací občanů v jejich občanském životě. Uživatel popíše svojí životní situaci. Na základě popisu navrhni seznam full-textových dotazů, kterými můžeme vhodné služby najít. Dotazů zkonstruuj 5-7, aby si pokryl různé části životní situace. V životních situacích ignoruj žádosti o odborné rady (např. lékařské, stavební) a soustřeď se pouze na úřední pomoc. V dotazech preferuj zobecnění konkrétních doménově specifických pojmů do obecnějších úředních pojmů (např. 'Potřebuji opravit rozbitou brzdu v autě' -> 'porucha vozidla oprava', 'Ztratil jsem občanku a potřebuji si zařídit novou.' -> 'vydání nových dokladů totožnosti.', 'Potřebuji si nechat schválit vystavění zdi kolem mé zahrádky.' -> 'získání stavebního povolení'). Každý výsledný dotaz by měl být krátký, ideálně do 7 slov. Dotazy musí být v češtině."
-            },{
-                "role": "assistant",
-                "content": "Jaká je vaše životní situace?"
-            },{
-                "role": "user",
-                "content": user_query
-            }
-        ],
+        **build_input(
+            shared_instructions=[
+                "Jsi odborník na vyhledávání služeb veřejné správy vhodných pro řešení životních situací občanů v jejich občanském životě. Uživatel popíše svojí životní situaci. Na základě popisu navrhni seznam full-textových dotazů, kterými můžeme vhodné služby najít. Dotazů zkonstruuj 5-7, aby si pokryl různé části životní situace. V životních situacích ignoruj žádosti o odborné rady (např. lékařské, stavební) a soustřeď se pouze na úřední pomoc. V dotazech preferuj zobecnění konkrétních doménově specifických pojmů do obecnějších úředních pojmů (např. 'Potřebuji opravit rozbitou brzdu v autě' -> 'porucha vozidla oprava', 'Ztratil jsem občanku a potřebuji si zařídit novou.' -> 'vydání nových dokladů totožnosti.', 'Potřebuji si nechat schválit vystavění zdi kolem mé zahrádky.' -> 'získání stavebního povolení'). Každý výsledný dotaz by měl být krátký, ideálně do 7 slov. Dotazy musí být v češtině."
+            ],
+            conversation=[
+                {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                {"role": "user", "content": user_query}
+            ]
+        ),
         text={"verbosity": "low"},
         reasoning={"effort": "medium"},
         text_format=NavrzenaVyhledavani
     )
+    record_usage("generuj_navrhy_vyhledavacich_dotazu", response)
 
     navrzena_vyhledavani = response.output_parsed
     return navrzena_vyhledavani.dotazy
@@ -73,48 +90,112 @@ def vyhledej_sluzby(dotazy: List[str]) -> dict:
             sluzby[sluzba.id] = sluzba
     return sluzby
 
+# Kritéria relevance služby pro posouzení modelem (po jedné i po dávkách)
+KRITERIA_RELEVANCE = "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Uživatel popíše svojí životní situaci. Ty srovnáš jeho situaci s danou službou veřejné správy a posoudíš její relevanci. Služba je relevantní, pokud je splněna jedna z následujících podmínek: 1) služba přímo umožní řešit popsanou situaci nebo její část, 2) služba se nějak dotýká potřeb občana, které souvisejí se situací nebo alespoň s její částí, 3) služba by mohla být pro občana v rámci jeho životní situace užitečná, i když ji přímo nevyužije."
+
+# Kolik služeb posoudí model jedním voláním; větší seznamy kandidátů se rozdělí na dávky
+VELIKOST_DAVKY_POSOUZENI = 30
+# True = každou službu posoudit samostatným voláním (model se soustředí na jednu službu, ale volání je N)
+POSUZOVAT_PO_JEDNE = False
+# Při posuzování po jedné: kolik volání běží najednou, časový limit jednoho volání (s) a počet opakování
+# po chybě (timeout, 429, 5xx – s exponenciálním čekáním, viz max_retries v OpenAI SDK)
+SOUBEZNA_POSOUZENI = 8
+TIMEOUT_POSOUZENI = 30.0
+OPAKOVANI_POSOUZENI = 2
+
+
+async def posud_relevanci_sluzby(async_client: AsyncOpenAI, omezeni: asyncio.Semaphore, sluzba, user_query: str) -> bool:
+
+    # Instrukce a dotaz uživatele jsou u všech posuzovaných služeb stejné, mění se až poslední zpráva
+    async with omezeni:
+        response = await async_client.responses.create(
+            model="gpt-5-mini",
+            **build_input(
+                shared_instructions=[
+                    KRITERIA_RELEVANCE,
+                    "Odpověz *VÝHRADNĚ* hodnotou TRUE/FALSE. TRUE znamená, že služba je relevantní, FALSE že není. Jiný výstup než TRUE nebo FALSE není přípustný."
+                ],
+                conversation=[
+                    {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                    {"role": "user", "content": user_query},
+                    {"role": "assistant", "content": "Jakou službu mám posoudit?"},
+                    {"role": "user", "content": f"- název služby: {sluzba.name}\n-popis služby: {sluzba.description}"}
+                ]
+            ),
+            text={"verbosity": "low"},
+            reasoning={"effort": "low"}
+        )
+    record_usage("posud_relevanci_sluzby", response)
+
+    return response.output_text.strip() == "TRUE"
+
+async def posud_relevanci_sluzeb_po_jedne(sluzby: list, user_query: str) -> list:
+
+    # Volání běží souběžně (nejvýše SOUBEZNA_POSOUZENI najednou), celé posouzení tak trvá zhruba
+    # jako nejpomalejší volání, ne jako jejich součet; výsledky jsou ve stejném pořadí jako služby
+    async with AsyncOpenAI(api_key=api_key, timeout=TIMEOUT_POSOUZENI, max_retries=OPAKOVANI_POSOUZENI) as async_client:
+        omezeni = asyncio.Semaphore(SOUBEZNA_POSOUZENI)
+        return await asyncio.gather(
+            *(posud_relevanci_sluzby(async_client, omezeni, sluzba, user_query) for sluzba in sluzby),
+            return_exceptions=True
+        )
+
+def posud_relevanci_sluzeb(sluzby: list, user_query: str) -> dict:
+
+    sluzby_xml = "<sluzby>\n" + "".join(
+        "  <sluzba>\n"
+        f"    <id>{escape(sluzba.id)}</id>\n"
+        f"    <nazev>{escape(sluzba.name)}</nazev>\n"
+        f"    <popis>{escape(sluzba.description)}</popis>\n"
+        "  </sluzba>\n"
+        for sluzba in sluzby
+    ) + "</sluzby>"
+
+    # Všechny služby dávky posoudí model jedním voláním, verdikt vrací strukturovaně ke každému ID
+    response = client.responses.parse(
+        model="gpt-5-mini",
+        **build_input(
+            shared_instructions=[
+                KRITERIA_RELEVANCE,
+                "Posuď *každou* službu z přiloženého XML (viz <sluzby> dále) samostatně a pro každou vrať její <id> a to, zda je relevantní. Nevynechej žádnou službu a nepřidávej žádné jiné."
+            ],
+            context=sluzby_xml,
+            conversation=[
+                {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                {"role": "user", "content": user_query}
+            ]
+        ),
+        text={"verbosity": "low"},
+        reasoning={"effort": "low"},
+        text_format=PosouzeniRelevance
+    )
+    record_usage("posud_relevanci_sluzeb", response)
+
+    return {posouzeni.sluzba_id: posouzeni.relevantni for posouzeni in response.output_parsed.posouzeni}
+
 def filtruj_relevantni_sluzby(sluzby: dict, user_query: str) -> dict:
     
     filtrovany_seznam_sluzeb = {}
     if sluzby not in (None, {}):
-        for sluzba in sluzby.values():
-            sluzby_xml = f"<sluzba>\n"
-            sluzby_xml += f"  <id>{sluzba.id}</id>\n"
-            sluzby_xml += f"  <nazev>{sluzba.name}</nazev>\n"
-            sluzby_xml += f"  <popis>{sluzba.description}</popis>\n"        
-            sluzby_xml += f"</sluzba>\n"
-
-
-            response = client.responses.create(
-                model="gpt-5-mini",
-                input=[
-                    {
-                        "role": "developer",
-                        "content": "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Uživatel popíše svojí životní situaci. Ty srovnáš jeho situaci s danou službou veřejné správy a posoudíš její relevanci. Služba je relevantní, pokud je splněna jedna z následujících podmínek: 1) služba přímo umožní řešit popsanou situaci nebo její část, 2) služba se nějak dotýká potřeb občana, které souvisejí se situací nebo alespoň s její částí, 3) služba by mohla být pro občana v rámci jeho životní situace užitečná, i když ji přímo nevyužije."
-                    },{
-                        "role": "developer",
-                        "content": "Odpověz *VÝHRADNĚ* hodnotou TRUE/FALSE. TRUE znamená, že služba je relevantní, FALSE že není. Jiný výstup než TRUE nebo FALSE není přípustný."
-                    },{
-                        "role": "assistant",
-                        "content": "Jaká je vaše životní situace?"
-                    },{
-                        "role": "user",
-                        "content": user_query
-                    },{
-                        "role": "assistant",
-                        "content": "Jakou službu mám posoudit?"
-                    },{
-                        "role": "user",
-                        "content": f"- název služby: {sluzba.name}\n-popis služby: {sluzba.description}"
-                    }
-                ],
-                text={"verbosity": "low"},
-                reasoning={"effort": "low"}
-            )
-
-            posouzeni_relevance = response.output_text
-            print(f"- {sluzba.name} {sluzba.id}: {posouzeni_relevance}")
-            if posouzeni_relevance == "TRUE":
+        kandidati = list(sluzby.values())
+        if POSUZOVAT_PO_JEDNE:
+            verdikty = {}
+            for sluzba, verdikt in zip(kandidati, asyncio.run(posud_relevanci_sluzeb_po_jedne(kandidati, user_query))):
+                if isinstance(verdikt, Exception):
+                    print(f"- {sluzba.name} {sluzba.id}: posouzení selhalo ({verdikt})")
+                else:
+                    verdikty[sluzba.id] = verdikt
+        else:
+            verdikty = {}
+            for zacatek in range(0, len(kandidati), VELIKOST_DAVKY_POSOUZENI):
+                verdikty.update(posud_relevanci_sluzeb(kandidati[zacatek:zacatek + VELIKOST_DAVKY_POSOUZENI], user_query))
+
+        for sluzba in kandidati:
+            if sluzba.id not in verdikty:
+                print(f"- {sluzba.name} {sluzba.id}: model službu neposoudil, vynechávám ji")
+                continue
+            print(f"- {sluzba.name} {sluzba.id}: {'TRUE' if verdikty[sluzba.id] else 'FALSE'}")
+            if verdikty[sluzba.id]:
                 filtrovany_seznam_sluzeb[sluzba.id] = sluzba
 
     return filtrovany_seznam_sluzeb
@@ -122,64 +203,33 @@ def filtruj_relevantni_sluzby(sluzby: dict, user_query: str) -> dict:
 
 def vygeneruj_finalni_postup(sluzby: dict, user_query: str) -> Postup:
 
-    sluzby_xml = "<sluzby>\n"
-
-    for sluzba in sluzby.values():
-        sluzby_xml += f"  <sluzba>\n"
-        sluzby_xml += f"    <id>{sluzba.id}</id>\n"
-        sluzby_xml += f"    <nazev>{sluzba.name}</nazev>\n"
-        
-        detail = store.get_service_detail_by_id(sluzba.id)
-        if detail:
-            sluzby_xml += f"    <detail>{detail}</detail>\n"
-        
-        steps = store.get_service_steps_by_id(sluzba.id)
-        if steps:
-            sluzby_xml += f"    <kroky>\n"
-            for step in steps:
-                sluzby_xml += f"      <krok>{step}</krok>\n"
-            sluzby_xml += f"    </kroky>\n"
-        
-        sluzby_xml += f"  </sluzba>\n"
-    
-    sluzby_xml += "</sluzby>"
+    # Služby seřazené podle relevance rozhodují o zkracování při překročení rozpočtu tokenů, v kontextu
+    # jsou ale seřazené podle ID, aby stejná sada služeb dala vždy stejný prefix promptu
+    sluzby_xml, kontext = store.pack_services_context(sluzby.values(), stable_order=True)
+    print(f"Kontext služeb: {kontext['tokens']} tokenů z {kontext['token_budget']}")
 
     response = client.responses.parse(
         model="gpt-5-mini",
-        input=[
-            {
-                "role": "developer",
-                "content": "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Vždy poradíš, jak danou životní situaci vyřešit z úředního hlediska poskytnutím konkrétního postupu v podobě číslovaných kroků na základě popisů služeb veřejné správy, které lze pro řešení životní situace použít. Uživatel potřebuje srozumitelné ale krátké vysvětlení každého kroku jednoduchou češtinou."
-            },{
-                "role": "developer",
-                "content": "Odpovídej *VÝHRADNĚ* na základě strukturovaného seznamemu služeb dodaného uživatelem. Každá služba je uvedena ve struktuře: <id> (jednoznačný identifikátor služby), <nazev> (krátký název služby), <detail> (detailní informace o službě) a <kroky> (úřední kroky, v rámci kterých je potřeba službu řešit). <detail> se skládá z následujícíh částí: <popis> (Základní vymezení služby a upřesnění názvu, pokud není dost jednoznačný.), <benefit> (Atribut popisuje, jaký přínos má pro klienta využití služby.), <jak-resit> (Jakým způsobem se služba řeší elektronicky včetně případného ID datové schránky, mailové adresy či jiných digitálních kanálů.), <kdy-resit> (Popisuje, v jakou chvíli může nebo musí být iniciováno čerpání služby.), <resit-pokud> (Vymezení toho, kdo může službu využívat a za jakých podmínek se ho týká.), <zpusob-vyrizeni> (Co potřebuje klient, aby mohl službu řešit elektronicky (typicky doklady, žádosti apod.)"
-            },{
-                "role": "developer",
-                "content": "Kroky služeb nemusíš ve výsledném postupu striktně dodržovat, ale zkombinuj je tak, aby dávaly v kontextu situace uživatele smysl."
-            },{
-                "role": "developer",
-                "content": "*Nikdy nepoužívej žádné znalosti mimo ty uvedené v seznamu*. Vždy je ale tvým hlavním cílem postup v uvedných informacích o službách zjistit a uživateli vysvětlit. Může se ale stát, že nejsou přiloženy informace o žádných relevantních službách. V takovém případě *NESMÍŠ* poskytnout žádné kroky, tj. seznam kroků bude prázdný, a v úvodu *MUSÍŠ* výslovně napsat, že nemáš potřebné informace a tedy neposkytuješ žádný návod ani postup."
-            },{
-                "role": "developer",
-                "content": "*Nikdy nesmíš v žádném kroku výsledného postupu poskytovat radu v oboru, kterého se životní situace uživatele týká, např. lékařské rady, stavební rady, atd.* Uživateli pouze můžeš napsat, aby odborníka vyhledal a navštívil bez jakýchkoliv časových, situačních či jiných podmínek a doporučení."
-            },{
-                "role": "assistant",
-                "content": "Jaká je vaše životní situace?"
-            },{
-                "role": "user",
-                "content": user_query
-            },{
-                "role": "assistant",
-                "content": "Jaké služby mám při přípravě postupu použít?"
-            },{
-                "role": "user",
-                "content": sluzby_xml
-            }
-        ],
+        **build_input(
+            shared_instructions=SPOLECNE_INSTRUKCE,
+            context=sluzby_xml,
+            task_instructions=[
+                "Vždy poradíš, jak danou životní situaci vyřešit z úředního hlediska poskytnutím konkrétního postupu v podobě číslovaných kroků na základě popisů služeb veřejné správy, které lze pro řešení životní situace použít. Uživatel potřebuje srozumitelné ale krátké vysvětlení každého kroku jednoduchou češtinou.",
+                "Odpovídej *VÝHRADNĚ* na základě přiloženého seznamu služeb.",
+                "Kroky služeb nemusíš ve výsledném postupu striktně dodržovat, ale zkombinuj je tak, aby dávaly v kontextu situace uživatele smysl.",
+                "*Nikdy nepoužívej žádné znalosti mimo ty uvedené v seznamu*. Vždy je ale tvým hlavním cílem postup v uvedných informacích o službách zjistit a uživateli vysvětlit. Může se ale stát, že nejsou přiloženy informace o žádných relevantních službách. V takovém případě *NESMÍŠ* poskytnout žádné kroky, tj. seznam kroků bude prázdný, a v úvodu *MUSÍŠ* výslovně napsat, že nemáš potřebné informace a tedy neposkytuješ žádný návod ani postup.",
+                "*Nikdy nesmíš v žádném kroku výsledného postupu poskytovat radu v oboru, kterého se životní situace uživatele týká, např. lékařské rady, stavební rady, atd.* Uživateli pouze můžeš napsat, aby odborníka vyhledal a navštívil bez jakýchkoliv časových, situačních či jiných podmínek a doporučení."
+            ],
+            conversation=[
+                {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                {"role": "user", "content": user_query}
+            ]
+        ),
         text={"verbosity": "medium"},
         reasoning={"effort": "medium"},
         text_format=Postup
     )
+    record_usage("vygeneruj_finalni_postup", response)
 
     return response.output_parsed
 
@@ -217,5 +267,6 @@ def main():
         for krok in postup.kroky:
             print(f"{krok.poradi}. {krok.nazev} ({krok.sluzba_id})\n   {krok.popis}\n")
 
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,16 +1,16 @@
+import asyncio
 from typing import List
 from government_services_store import GovernmentServicesStore
-from openai import OpenAI
+# prompt_builder.py je ve společné složce shared/ (do sys.path ji přidá import government_services_store)
+from prompt_builder import build_input, record_usage
+from relevance_cache import RelevanceCache, prompt_version
+from relevance_gate import gate, load_thresholds, log_verdicts
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
+import json
 import os
 from pydantic import BaseModel, Field
-
-store = GovernmentServicesStore()
-store.load_services()
-
-stats = store.get_services_embedding_statistics()
-print(f"Načteno {stats['total_services']} služeb.")
-print(f"Embeddings v ChromaDB: {stats['total_embeddings']} (coverage: {stats['coverage_percentage']}%)")
+from xml.sax.saxutils import escape
 
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
@@ -18,6 +18,11 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("API klíč není nastaven v .env souboru.")
 
+store = GovernmentServicesStore()
+# Služby, vektorový index a cache se načítají na pozadí, program tak může hned pokračovat;
+# dotazy na store (vyhledávání, detaily, kroky) samy počkají, až bude potřebná část připravená.
+store.warm_up()
+
 client = OpenAI(api_key=api_key)
 
 # Definice datových struktur pro parsování odpovědí
@@ -34,81 +39,225 @@ class Postup(BaseModel):
 class NavrzenaVyhledavani(BaseModel):
     dotazy: list[str] = Field(description="Seznam fulltextových dotazů pro vyhledání relevantních služeb")
 
+class PosouzeniSluzby(BaseModel):
+    sluzba_id: str = Field(description="ID posuzované služby (hodnota <id> z přiloženého XML)")
+    relevantni: bool = Field(description="True, pokud je služba pro životní situaci uživatele relevantní, jinak False")
+
+class PosouzeniRelevance(BaseModel):
+    posouzeni: list[PosouzeniSluzby] = Field(description="Posouzení relevance každé z přiložených služeb")
+
+
+# Instrukce společné všem voláním, která pracují se seznamem služeb. Jsou na začátku vstupu a za nimi
+# hned XML <sluzby>, takže volání nad stejnými službami sdílejí prefix promptu a poskytovatel ho vezme z cache.
+SPOLECNE_INSTRUKCE = [
+    "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě.",
+    "Služby veřejné správy, se kterými pracuješ, jsou přiloženy jako XML (viz <sluzby> dále, seznam může být i prázdný). Každá služba je uvedena ve struktuře: <id> (jednoznačný identifikátor služby), <nazev> (krátký název služby), <detail> (detailní informace o službě) a <kroky> (úřední kroky, v rámci kterých je potřeba službu řešit). <detail> se skládá z následujícíh částí: <popis> (Základní vymezení služby a upřesnění názvu, pokud není dost jednoznačný.), <benefit> (Atribut popisuje, jaký přínos má pro klienta využití služby.), <jak-resit> (Jakým způsobem se služba řeší elektronicky včetně případného ID datové schránky, mailové adresy či jiných digitálních kanálů.), <kdy-resit> (Popisuje, v jakou chvíli může nebo musí být iniciováno čerpání služby.), <resit-pokud> (Vymezení toho, kdo může službu využívat a za jakých podmínek se ho týká.), <zpusob-vyrizeni> (Co potřebuje klient, aby mohl službu řešit elektronicky (typicky doklady, žádosti apod.)"
+]
+
 
 def generuj_navrhy_vyhledavacich_dotazu(user_query: str) -> List[str]:
 
     response = client.responses.parse(
         model="gpt-5-mini",
-        input=[
-            {
-                "role": "developer",
-                "content": "Jsi odborník na vyhledávání služeb veřejné správy vhodných pro řešení životních situací občanů v jejich občanském životě. Uživatel popíše svojí životní situaci. Na základě popisu navrhni seznam full-textových dotazů, kterými můžeme vhodné služby najít. Dotazů zkonstruuj 5-7, aby si pokryl různé části životní situace. V životních situacích ignoruj žádosti o odborné rady (např. lékařské, stavební) a soustřeď se pouze na úřední pomoc. V dotazech preferuj zobecnění konkrétních doménově specifických pojmů do obecnějších úředních pojmů (např. 'Potřebuji opravit rozbitou brzdu v autě' -> 'porucha vozidla oprava', 'Ztratil jsem občanku a potřebuji si zařídit novou.' -> 'vydání nových dokladů totožnosti.', 'Potřebuji si nechat schválit vystavění zdi kolem mé zahrádky.' -> 'získání stavebního povolení'). Každý výsledný dotaz by měl být krátký, ideálně do 7 slov. Dotazy musí být v češtině."
-            },{
-                "role": "assistant",
-                "content": "Jaká je vaše životní situace?"
-            },{
-                "role": "user",
-                "content": user_query
-            }
-        ],
+        **build_input(
+            shared_instructions=[
+                "Jsi odborník na vyhledávání služeb veřejné správy vhodných pro řešení životních situací občanů v jejich občanském životě. Uživatel popíše svojí životní situaci. Na základě popisu navrhni seznam full-textových dotazů, kterými můžeme vhodné služby najít. Dotazů zkonstruuj 5-7, aby si pokryl různé části životní situace. V životních situacích ignoruj žádosti o odborné rady (např. lékařské, stavební) a soustřeď se pouze na úřední pomoc. V dotazech preferuj zobecnění konkrétních doménově specifických pojmů do obecnějších úředních pojmů (např. 'Potřebuji opravit rozbitou brzdu v autě' -> 'porucha vozidla oprava', 'Ztratil jsem občanku a potřebuji si zařídit novou.' -> 'vydání nových dokladů totožnosti.', 'Potřebuji si nechat schválit vystavění zdi kolem mé zahrádky.' -> 'získání stavebního povolení'). Každý výsledný dotaz by měl být krátký, ideálně do 7 slov. Dotazy musí být v češtině."
+            ],
+            conversation=[
+                {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                {"role": "user", "content": user_query}
+            ]
+        ),
         text={"verbosity": "low"},
         reasoning={"effort": "medium"},
         text_format=NavrzenaVyhledavani
     )
+    record_usage("generuj_navrhy_vyhledavacich_dotazu", response)
 
     navrzena_vyhledavani = response.output_parsed
     return navrzena_vyhledavani.dotazy
 
-def vyhledej_sluzby(dotazy: List[str]) -> dict:  
+# Dotazy s kosinovou podobností embeddingů aspoň takovou jsou jen přeformulováním stejného dotazu
+PRAH_DUPLICITY_DOTAZU = 0.9
+
+def deduplikuj_dotazy(dotazy: List[str]) -> List[str]:
+
+    # Embeddingy všech dotazů jedním voláním; vyhledávání je pak vezme z cache store
+    dotazy = [dotaz.strip() for dotaz in dotazy if dotaz.strip()]
+    embeddingy = store.embed_queries(dotazy)
+    normy = [sum(x * x for x in embedding) ** 0.5 or 1.0 for embedding in embeddingy]
+
+    # Dotaz se přidá k prvnímu ponechanému dotazu, kterému je dost podobný, jinak je ponechán sám;
+    # ponechává se tak vždy dřívější dotaz ze skupiny (model je řadí od nejdůležitějšího)
+    ponechane = []
+    for i, dotaz in enumerate(dotazy):
+        podobnosti = [(sum(a * b for a, b in zip(embeddingy[i], embeddingy[j])) / (normy[i] * normy[j]), j) for j in ponechane]
+        podobnost, j = max(podobnosti, default=(0.0, None))
+        if podobnost >= PRAH_DUPLICITY_DOTAZU:
+            print(f"- vynechán dotaz '{dotaz}' (podobný dotazu '{dotazy[j]}', podobnost {podobnost:.3f})")
+        else:
+            ponechane.append(i)
+
+    return [dotazy[i] for i in ponechane]
+
+def vyhledej_sluzby(dotazy: List[str]) -> tuple[dict, dict]:
     sluzby = {}
+    # Služba nalezená více dotazy má podobnost toho dotazu, kterému odpovídá nejlépe
+    podobnosti = {}
     for dotaz in dotazy:
-        results = store.search_services(dotaz, k=3)
-        for sluzba in results:
+        results = store.search_services_scored(dotaz, k=3)
+        for sluzba, podobnost in results:
             sluzby[sluzba.id] = sluzba
-    return sluzby
+            podobnosti[sluzba.id] = max(podobnost, podobnosti.get(sluzba.id, podobnost))
+    return sluzby, podobnosti
+
+# Kritéria relevance služby pro posouzení modelem (po jedné i po dávkách)
+KRITERIA_RELEVANCE = "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Uživatel popíše svojí životní situaci. Ty srovnáš jeho situaci s danou službou veřejné správy a posoudíš její relevanci. Služba je relevantní, pokud je splněna jedna z následujících podmínek: 1) služba přímo umožní řešit popsanou situaci nebo její část, 2) služba se nějak dotýká potřeb občana, které souvisejí se situací nebo alespoň s její částí, 3) služba by mohla být pro občana v rámci jeho životní situace užitečná, i když ji přímo nevyužije."
+# Instrukce k odpovědi podle režimu posuzování (po jedné služby TRUE/FALSE, po dávkách verdikt ke každému ID)
+INSTRUKCE_POSOUZENI_PO_JEDNE = "Odpověz *VÝHRADNĚ* hodnotou TRUE/FALSE. TRUE znamená, že služba je relevantní, FALSE že není. Jiný výstup než TRUE nebo FALSE není přípustný."
+INSTRUKCE_POSOUZENI_PO_DAVKACH = "Posuď *každou* službu z přiloženého XML (viz <sluzby> dále) samostatně a pro každou vrať její <id> a to, zda je relevantní. Nevynechej žádnou službu a nepřidávej žádné jiné."
+
+# Kolik služeb posoudí model jedním voláním; větší seznamy kandidátů se rozdělí na dávky
+VELIKOST_DAVKY_POSOUZENI = 30
+# True = každou službu posoudit samostatným voláním (model se soustředí na jednu službu, ale volání je N)
+POSUZOVAT_PO_JEDNE = False
+# Při posuzování po jedné: kolik volání běží najednou, časový limit jednoho volání (s) a počet opakování
+# po chybě (timeout, 429, 5xx – s exponenciálním čekáním, viz max_retries v OpenAI SDK)
+SOUBEZNA_POSOUZENI = 8
+TIMEOUT_POSOUZENI = 30.0
+OPAKOVANI_POSOUZENI = 2
+MODEL_POSOUZENI = "gpt-5-mini"
+# Verze promptu je otisk celého textu instrukcí použitého režimu (po dávkách i schématu odpovědi); jejich změna
+# zneplatní uložené verdikty i kalibraci brány
+if POSUZOVAT_PO_JEDNE:
+    VERZE_POSOUZENI = prompt_version(KRITERIA_RELEVANCE, INSTRUKCE_POSOUZENI_PO_JEDNE)
+else:
+    VERZE_POSOUZENI = prompt_version(KRITERIA_RELEVANCE, INSTRUKCE_POSOUZENI_PO_DAVKACH,
+                                     json.dumps(PosouzeniRelevance.model_json_schema(), ensure_ascii=False, sort_keys=True))
+
+# Verdikty se pamatují na disku (viz relevance_cache.py): při zpřesňování dotazu se znovu posuzují jen
+# služby, které model pro stejný dotaz ještě neposoudil.
+cache_posouzeni = RelevanceCache(model=MODEL_POSOUZENI, prompt_version=VERZE_POSOUZENI)
+
+# Prahy podobnosti pro předfiltrování kandidátů bez modelu (viz relevance_gate.py). Kalibrují se z verdiktů
+# modelu příkazem `python relevance_gate.py`; dokud kalibrace neproběhla, jsou None a model posoudí všechny kandidáty.
+PRAH_ZAMITNUTI, PRAH_PRIJETI = load_thresholds(MODEL_POSOUZENI, VERZE_POSOUZENI)
+
+
+async def posud_relevanci_sluzby(async_client: AsyncOpenAI, omezeni: asyncio.Semaphore, sluzba, user_query: str) -> bool:
+
+    # Instrukce a dotaz uživatele jsou u všech posuzovaných služeb stejné, mění se až poslední zpráva
+    async with omezeni:
+        response = await async_client.responses.create(
+            model=MODEL_POSOUZENI,
+            **build_input(
+                shared_instructions=[
+                    KRITERIA_RELEVANCE,
+                    INSTRUKCE_POSOUZENI_PO_JEDNE
+                ],
+                conversation=[
+                    {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                    {"role": "user", "content": user_query},
+                    {"role": "assistant", "content": "Jakou službu mám posoudit?"},
+                    {"role": "user", "content": f"- název služby: {sluzba.name}\n-popis služby: {sluzba.description}"}
+                ]
+            ),
+            text={"verbosity": "low"},
+            reasoning={"effort": "low"}
+        )
+    record_usage("posud_relevanci_sluzby", response)
+
+    return response.output_text.strip() == "TRUE"
+
+async def posud_relevanci_sluzeb_po_jedne(sluzby: list, user_query: str) -> list:
+
+    # Volání běží souběžně (nejvýše SOUBEZNA_POSOUZENI najednou), celé posouzení tak trvá zhruba
+    # jako nejpomalejší volání, ne jako jejich součet; výsledky jsou ve stejném pořadí jako služby
+    async with AsyncOpenAI(api_key=api_key, timeout=TIMEOUT_POSOUZENI, max_retries=OPAKOVANI_POSOUZENI) as async_client:
+        omezeni = asyncio.Semaphore(SOUBEZNA_POSOUZENI)
+        return await asyncio.gather(
+            *(posud_relevanci_sluzby(async_client, omezeni, sluzba, user_query) for sluzba in sluzby),
+            return_exceptions=True
+        )
+
+def posud_relevanci_sluzeb(sluzby: list, user_query: str) -> dict:
+
+    sluzby_xml = "<sluzby>\n" + "".join(
+        "  <sluzba>\n"
+        f"    <id>{escape(sluzba.id)}</id>\n"
+        f"    <nazev>{escape(sluzba.name)}</nazev>\n"
+        f"    <popis>{escape(sluzba.description)}</popis>\n"
+        "  </sluzba>\n"
+        for sluzba in sluzby
+    ) + "</sluzby>"
+
+    # Všechny služby dávky posoudí model jedním voláním, verdikt vrací strukturovaně ke každému ID
+    response = client.responses.parse(
+        model=MODEL_POSOUZENI,
+        **build_input(
+            shared_instructions=[
+                KRITERIA_RELEVANCE,
+                INSTRUKCE_POSOUZENI_PO_DAVKACH
+            ],
+            context=sluzby_xml,
+            conversation=[
+                {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                {"role": "user", "content": user_query}
+            ]
+        ),
+        text={"verbosity": "low"},
+        reasoning={"effort": "low"},
+        text_format=PosouzeniRelevance
+    )
+    record_usage("posud_relevanci_sluzeb", response)
+
+    return {posouzeni.sluzba_id: posouzeni.relevantni for posouzeni in response.output_parsed.posouzeni}
+
+def predfiltruj_podle_podobnosti(sluzby: dict, podobnosti: dict) -> tuple[dict, dict, set]:
 
-def filtruj_relevantni_sluzby(sluzby: dict, user_query: str) -> dict:
+    # Kontrolní služby rozhodla brána, ale model je posoudí i tak – jejich verdikty slouží další kalibraci
+    rozhodnute, nejiste_id, kontrolni = gate({sluzba_id: podobnosti[sluzba_id] for sluzba_id in sluzby}, PRAH_ZAMITNUTI, PRAH_PRIJETI)
+    prijate = {sluzba_id: sluzby[sluzba_id] for sluzba_id, relevantni in rozhodnute.items() if relevantni}
+    nejiste = {sluzba_id: sluzby[sluzba_id] for sluzba_id in nejiste_id}
+    if rozhodnute:
+        print(f"Předfiltrování podle podobnosti: přijato {len(prijate)}, zamítnuto {len(rozhodnute) - len(prijate)}, modelem se posoudí {len(nejiste)} (z toho {len(kontrolni)} kontrolně)")
+        for sluzba_id, relevantni in rozhodnute.items():
+            print(f"- {sluzby[sluzba_id].name} {sluzba_id}: {'TRUE' if relevantni else 'FALSE'} (podobnost {podobnosti[sluzba_id]:.3f})")
+    return prijate, nejiste, kontrolni
+
+def filtruj_relevantni_sluzby(sluzby: dict, user_query: str, podobnosti: dict = None, kontrolni: set = frozenset()) -> dict:
     
     filtrovany_seznam_sluzeb = {}
     if sluzby not in (None, {}):
-        for sluzba in sluzby.values():
-            sluzby_xml = f"<sluzba>\n"
-            sluzby_xml += f"  <id>{sluzba.id}</id>\n"
-            sluzby_xml += f"  <nazev>{sluzba.name}</nazev>\n"
-            sluzby_xml += f"  <popis>{sluzba.description}</popis>\n"        
-            sluzby_xml += f"</sluzba>\n"
-
-
-            response = client.responses.create(
-                model="gpt-5-mini",
-                input=[
-                    {
-                        "role": "developer",
-                        "content": "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Uživatel popíše svojí životní situaci. Ty srovnáš jeho situaci s danou službou veřejné správy a posoudíš její relevanci. Služba je relevantní, pokud je splněna jedna z následujících podmínek: 1) služba přímo umožní řešit popsanou situaci nebo její část, 2) služba se nějak dotýká potřeb občana, které souvisejí se situací nebo alespoň s její částí, 3) služba by mohla být pro občana v rámci jeho životní situace užitečná, i když ji přímo nevyužije."
-                    },{
-                        "role": "developer",
-                        "content": "Odpověz *VÝHRADNĚ* hodnotou TRUE/FALSE. TRUE znamená, že služba je relevantní, FALSE že není. Jiný výstup než TRUE nebo FALSE není přípustný."
-                    },{
-                        "role": "assistant",
-                        "content": "Jaká je vaše životní situace?"
-                    },{
-                        "role": "user",
-                        "content": user_query
-                    },{
-                        "role": "assistant",
-                        "content": "Jakou službu mám posoudit?"
-                    },{
-                        "role": "user",
-                        "content": f"- název služby: {sluzba.name}\n-popis služby: {sluzba.description}"
-                    }
-                ],
-                text={"verbosity": "low"},
-                reasoning={"effort": "low"}
-            )
-
-            posouzeni_relevance = response.output_text
-            print(f"- {sluzba.name} {sluzba.id}: {posouzeni_relevance}")
-            if posouzeni_relevance == "TRUE":
+        kandidati = list(sluzby.values())
+        verdikty = cache_posouzeni.get_many(user_query, sluzby.keys())
+        neposouzene = [sluzba for sluzba in kandidati if sluzba.id not in verdikty]
+        print(f"Posouzení z cache: {len(verdikty)} z {len(kandidati)}, modelem se posoudí {len(neposouzene)}")
+
+        nove_verdikty = {}
+        if POSUZOVAT_PO_JEDNE and neposouzene:
+            for sluzba, verdikt in zip(neposouzene, asyncio.run(posud_relevanci_sluzeb_po_jedne(neposouzene, user_query))):
+                if isinstance(verdikt, Exception):
+                    print(f"- {sluzba.name} {sluzba.id}: posouzení selhalo ({verdikt})")
+                else:
+                    nove_verdikty[sluzba.id] = verdikt
+        else:
+            for zacatek in range(0, len(neposouzene), VELIKOST_DAVKY_POSOUZENI):
+                nove_verdikty.update(posud_relevanci_sluzeb(neposouzene[zacatek:zacatek + VELIKOST_DAVKY_POSOUZENI], user_query))
+        # Do cache jen verdikty pro služby, které model opravdu dostal k posouzení
+        nove_verdikty = {sluzba.id: nove_verdikty[sluzba.id] for sluzba in neposouzene if sluzba.id in nove_verdikty}
+        cache_posouzeni.put_many(user_query, nove_verdikty)
+        # Verdikty modelu s podobností z vyhledávání jsou podkladem pro kalibraci prahů předfiltrování
+        if podobnosti:
+            log_verdicts(podobnosti, nove_verdikty, MODEL_POSOUZENI, VERZE_POSOUZENI, audited=kontrolni)
+        verdikty.update(nove_verdikty)
+
+        for sluzba in kandidati:
+            if sluzba.id not in verdikty:
+                print(f"- {sluzba.name} {sluzba.id}: model službu neposoudil, vynechávám ji")
+                continue
+            print(f"- {sluzba.name} {sluzba.id}: {'TRUE' if verdikty[sluzba.id] else 'FALSE'}")
+            if verdikty[sluzba.id]:
                 filtrovany_seznam_sluzeb[sluzba.id] = sluzba
 
     return filtrovany_seznam_sluzeb
@@ -116,182 +265,95 @@ def filtruj_relevantni_sluzby(sluzby: dict, user_query: str) -> dict:
 
 def vygeneruj_finalni_postup(sluzby: dict, user_query: str) -> Postup:
 
-    sluzby_xml = "<sluzby>\n"
-
-    for sluzba in sluzby.values():
-        sluzby_xml += f"  <sluzba>\n"
-        sluzby_xml += f"    <id>{sluzba.id}</id>\n"
-        sluzby_xml += f"    <nazev>{sluzba.name}</nazev>\n"
-        
-        detail = store.get_service_detail_by_id(sluzba.id)
-        if detail:
-            sluzby_xml += f"    <detail>{detail}</detail>\n"
-        
-        steps = store.get_service_steps_by_id(sluzba.id)
-        if steps:
-            sluzby_xml += f"    <kroky>\n"
-            for step in steps:
-                sluzby_xml += f"      <krok>{step}</krok>\n"
-            sluzby_xml += f"    </kroky>\n"
-        
-        sluzby_xml += f"  </sluzba>\n"
-    
-    sluzby_xml += "</sluzby>"
+    # Služby seřazené podle relevance rozhodují o zkracování při překročení rozpočtu tokenů, v kontextu
+    # jsou ale seřazené podle ID, aby stejná sada služeb dala vždy stejný prefix promptu
+    sluzby_xml, kontext = store.pack_services_context(sluzby.values(), stable_order=True)
+    print(f"Kontext služeb: {kontext['tokens']} tokenů z {kontext['token_budget']}")
 
     response = client.responses.parse(
         model="gpt-5-mini",
-        input=[
-            {
-                "role": "developer",
-                "content": "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Vždy poradíš, jak danou životní situaci vyřešit z úředního hlediska poskytnutím konkrétního postupu v podobě číslovaných kroků na základě popisů služeb veřejné správy, které lze pro řešení životní situace použít. Uživatel potřebuje srozumitelné ale krátké vysvětlení každého kroku jednoduchou češtinou."
-            },{
-                "role": "developer",
-                "content": "Odpovídej *VÝHRADNĚ* na základě strukturovaného seznamemu služeb dodaného uživatelem. Každá služba je uvedena ve struktuře: <id> (jednoznačný identifikátor služby), <nazev> (krátký název služby), <detail> (detailní informace o službě) a <kroky> (úřední kroky, v rámci kterých je potřeba službu řešit). <detail> se skládá z následujícíh částí: <popis> (Základní vymezení služby a upřesnění názvu, pokud není dost jednoznačný.), <benefit> (Atribut popisuje, jaký přínos má pro klienta využití služby.), <jak-resit> (Jakým způsobem se služba řeší elektronicky včetně případného ID datové schránky, mailové adresy či jiných digitálních kanálů.), <kdy-resit> (Popisuje, v jakou chvíli může nebo musí být iniciováno čerpání služby.), <resit-pokud> (Vymezení toho, kdo může službu využívat a za jakých podmínek se ho týká.), <zpusob-vyrizeni> (Co potřebuje klient, aby mohl službu řešit elektronicky (typicky doklady, žádosti apod.)"
-            },{
-                "role": "developer",
-                "content": "Kroky služeb nemusíš ve výsledném postupu striktně dodržovat, ale zkombinuj je tak, aby dávaly v kontextu situace uživatele smysl."
-            },{
-                "role": "developer",
-                "content": "*Nikdy nepoužívej žádné znalosti mimo ty uvedené v seznamu*. Vždy je ale tvým hlavním cílem postup v uvedných informacích o službách zjistit a uživateli vysvětlit. Může se ale stát, že nejsou přiloženy informace o žádných relevantních službách. V takovém případě *NESMÍŠ* poskytnout žádné kroky, tj. seznam kroků bude prázdný, a v úvodu *MUSÍŠ* výslovně napsat, že nemáš potřebné informace a tedy neposkytuješ žádný návod ani postup."
-            },{
-                "role": "developer",
-                "content": "*Nikdy nesmíš v žádném kroku výsledného postupu poskytovat radu v oboru, kterého se životní situace uživatele týká, např. lékařské rady, stavební rady, atd.* Uživateli pouze můžeš napsat, aby odborníka vyhledal a navštívil bez jakýchkoliv časových, situačních či jiných podmínek a doporučení."
-            },{
-                "role": "assistant",
-                "content": "Jaká je vaše životní situace?"
-            },{
-                "role": "user",
-                "content": user_query
-            },{
-                "role": "assistant",
-                "content": "Jaké služby mám při přípravě postupu použít?"
-            },{
-                "role": "user",
-                "content": sluzby_xml
-            }
-        ],
+        **build_input(
+            shared_instructions=SPOLECNE_INSTRUKCE,
+            context=sluzby_xml,
+            task_instructions=[
+                "Vždy poradíš, jak danou životní situaci vyřešit z úředního hlediska poskytnutím konkrétního postupu v podobě číslovaných kroků na základě popisů služeb veřejné správy, které lze pro řešení životní situace použít. Uživatel potřebuje srozumitelné ale krátké vysvětlení každého kroku jednoduchou češtinou.",
+                "Odpovídej *VÝHRADNĚ* na základě přiloženého seznamu služeb.",
+                "Kroky služeb nemusíš ve výsledném postupu striktně dodržovat, ale zkombinuj je tak, aby dávaly v kontextu situace uživatele smysl.",
+                "*Nikdy nepoužívej žádné znalosti mimo ty uvedené v seznamu*. Vždy je ale tvým hlavním cílem postup v uvedných informacích o službách zjistit a uživateli vysvětlit. Může se ale stát, že nejsou přiloženy informace o žádných relevantních službách. V takovém případě *NESMÍŠ* poskytnout žádné kroky, tj. seznam kroků bude prázdný, a v úvodu *MUSÍŠ* výslovně napsat, že nemáš potřebné informace a tedy neposkytuješ žádný návod ani postup.",
+                "*Nikdy nesmíš v žádném kroku výsledného postupu poskytovat radu v oboru, kterého se životní situace uživatele týká, např. lékařské rady, stavební rady, atd.* Uživateli pouze můžeš napsat, aby odborníka vyhledal a navštívil bez jakýchkoliv časových, situačních či jiných podmínek a doporučení."
+            ],
+            conversation=[
+                {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                {"role": "user", "content": user_query}
+            ]
+        ),
         text={"verbosity": "medium"},
         reasoning={"effort": "medium"},
         text_format=Postup
     )
+    record_usage("vygeneruj_finalni_postup", response)
 
     return response.output_parsed
 
 def vysvetli_sluzby(sluzby: dict, user_query: str) -> Postup:
 
-    sluzby_xml = "<sluzby>\n"
-
-    for sluzba in sluzby.values():
-        sluzby_xml += f"  <sluzba>\n"
-        sluzby_xml += f"    <id>{sluzba.id}</id>\n"
-        sluzby_xml += f"    <nazev>{sluzba.name}</nazev>\n"
-        
-        detail = store.get_service_detail_by_id(sluzba.id)
-        if detail:
-            sluzby_xml += f"    <detail>{detail}</detail>\n"
-        
-        steps = store.get_service_steps_by_id(sluzba.id)
-        if steps:
-            sluzby_xml += f"    <kroky>\n"
-            for step in steps:
-                sluzby_xml += f"      <krok>{step}</krok>\n"
-            sluzby_xml += f"    </kroky>\n"
-        
-        sluzby_xml += f"  </sluzba>\n"
-    
-    sluzby_xml += "</sluzby>"
+    # Služby seřazené podle relevance rozhodují o zkracování při překročení rozpočtu tokenů, v kontextu
+    # jsou ale seřazené podle ID, aby stejná sada služeb dala vždy stejný prefix promptu
+    sluzby_xml, kontext = store.pack_services_context(sluzby.values(), stable_order=True)
+    print(f"Kontext služeb: {kontext['tokens']} tokenů z {kontext['token_budget']}")
 
     response = client.responses.create(
         model="gpt-5-mini",
-        input=[
-            {
-                "role": "developer",
-                "content": "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Uživatel popsal svoji situaci. Našel jsi několik služeb, které by mu mohly pomoci s vyřešením jeho situace. Shrň uživateli, jak by mu mohly tyto služby pomoci."
-            },{
-                "role": "developer",
-                "content": "Odpovídej *VÝHRADNĚ* na základě přiloženého XML se seznamem služeb (viz <sluzby> dále). Každá služba je uvedena ve struktuře: <id> (jednoznačný identifikátor služby), <nazev> (krátký název služby), <detail> (detailní informace o službě) a <kroky> (úřední kroky, v rámci kterých je potřeba službu řešit). <detail> se skládá z následujícíh částí: <popis> (Základní vymezení služby a upřesnění názvu, pokud není dost jednoznačný.), <benefit> (Atribut popisuje, jaký přínos má pro klienta využití služby.), <jak-resit> (Jakým způsobem se služba řeší elektronicky včetně případného ID datové schránky, mailové adresy či jiných digitálních kanálů.), <kdy-resit> (Popisuje, v jakou chvíli může nebo musí být iniciováno čerpání služby.), <resit-pokud> (Vymezení toho, kdo může službu využívat a za jakých podmínek se ho týká.), <zpusob-vyrizeni> (Co potřebuje klient, aby mohl službu řešit elektronicky (typicky doklady, žádosti apod.)"
-            },{
-                "role": "developer",
-                "content": "*Nikdy nesmíš ve shrnutí poskytovat radu ani informace v oboru, kterého se životní situace uživatele týká, např. lékařské rady, stavební rady, atd.* Uživateli pouze můžeš napsat, aby odborníka vyhledal a navštívil bez jakýchkoliv časových, situačních či jiných podmínek a doporučení."
-            },{
-                "role": "assistant",
-                "content": "Jaká je vaše životní situace?"
-            },{
-                "role": "user",
-                "content": user_query
-            },{
-                "role": "assistant",
-                "content": "Zde jsou služby, které by vám mohly pomoci:"
-            },{
-                "role": "assistant",
-                "content": sluzby_xml
-            },{
-                "role": "user",
-                "content": "Shrň mi, jak by mi tyto služby mohly pomoci vyřešit mou situaci."
-            }
-        ],
+        **build_input(
+            shared_instructions=SPOLECNE_INSTRUKCE,
+            context=sluzby_xml,
+            task_instructions=[
+                "Uživatel popsal svoji situaci. Našel jsi několik služeb, které by mu mohly pomoci s vyřešením jeho situace. Shrň uživateli, jak by mu mohly tyto služby pomoci.",
+                "Odpovídej *VÝHRADNĚ* na základě přiloženého seznamu služeb.",
+                "*Nikdy nesmíš ve shrnutí poskytovat radu ani informace v oboru, kterého se životní situace uživatele týká, např. lékařské rady, stavební rady, atd.* Uživateli pouze můžeš napsat, aby odborníka vyhledal a navštívil bez jakýchkoliv časových, situačních či jiných podmínek a doporučení."
+            ],
+            conversation=[
+                {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                {"role": "user", "content": user_query},
+                {"role": "assistant", "content": "Zde jsou služby, které by vám mohly pomoci (viz <sluzby>)."},
+                {"role": "user", "content": "Shrň mi, jak by mi tyto služby mohly pomoci vyřešit mou situaci."}
+            ]
+        ),
         text={"verbosity": "medium"},
         reasoning={"effort": "medium"}
     )
+    record_usage("vysvetli_sluzby", response)
 
     return response.output_text
 
 def pomoz_zlepsit_dotaz(sluzby: dict, user_query: str) -> Postup:
 
-    sluzby_xml = "<sluzby>\n"
-
-    for sluzba in sluzby.values():
-        sluzby_xml += f"  <sluzba>\n"
-        sluzby_xml += f"    <id>{sluzba.id}</id>\n"
-        sluzby_xml += f"    <nazev>{sluzba.name}</nazev>\n"
-        
-        detail = store.get_service_detail_by_id(sluzba.id)
-        if detail:
-            sluzby_xml += f"    <detail>{detail}</detail>\n"
-        
-        steps = store.get_service_steps_by_id(sluzba.id)
-        if steps:
-            sluzby_xml += f"    <kroky>\n"
-            for step in steps:
-                sluzby_xml += f"      <krok>{step}</krok>\n"
-            sluzby_xml += f"    </kroky>\n"
-        
-        sluzby_xml += f"  </sluzba>\n"
-    
-    sluzby_xml += "</sluzby>"
+    # Služby seřazené podle relevance rozhodují o zkracování při překročení rozpočtu tokenů, v kontextu
+    # jsou ale seřazené podle ID, aby stejná sada služeb dala vždy stejný prefix promptu
+    sluzby_xml, kontext = store.pack_services_context(sluzby.values(), stable_order=True)
+    print(f"Kontext služeb: {kontext['tokens']} tokenů z {kontext['token_budget']}")
 
     response = client.responses.create(
         model="gpt-5-mini",
-        input=[
-            {
-                "role": "developer",
-                "content": "Jsi odborník na pomoc uživateli při řešení jeho různých životních situací v občanském životě. Uživatel popsal svoji situaci. Bohužel se ti nepodařilo najít služby, se kterými by uživatel souhlasil, že mu pomohou situaci vyřešit. Pomoz mu popsat jeho situaci lépe, aby byla větší šance, že najdeme pro něj relevantní služby."
-            },{
-                "role": "developer",
-                "content": "Odpovídej *VÝHRADNĚ* na základě následujícího popisu životní situace od uživatele, na základě kterého jsme ale nenalezli vhodné služby a také na základě přiloženého XML se seznamem služeb, které jsme nalezli ale uživatel s nimi nebyl spokojený (viz <sluzby> dále, seznam může být i prázdný). Každá služba je uvedena ve struktuře: <id> (jednoznačný identifikátor služby), <nazev> (krátký název služby), <detail> (detailní informace o službě) a <kroky> (úřední kroky, v rámci kterých je potřeba službu řešit). <detail> se skládá z následujícíh částí: <popis> (Základní vymezení služby a upřesnění názvu, pokud není dost jednoznačný.), <benefit> (Atribut popisuje, jaký přínos má pro klienta využití služby.), <jak-resit> (Jakým způsobem se služba řeší elektronicky včetně případného ID datové schránky, mailové adresy či jiných digitálních kanálů.), <kdy-resit> (Popisuje, v jakou chvíli může nebo musí být iniciováno čerpání služby.), <resit-pokud> (Vymezení toho, kdo může službu využívat a za jakých podmínek se ho týká.), <zpusob-vyrizeni> (Co potřebuje klient, aby mohl službu řešit elektronicky (typicky doklady, žádosti apod.)"
-            },{
-                "role": "developer",
-                "content": "*Nikdy nesmíš uživatele navádět k vylepšení dotazu směrem do oboru, kterého se životní situace uživatele týká, např. popis zdravotního stavu, odborného stavu stavby, atd.* Uživateli můžeš doporučit, aby lépe popsal svoji situaci v tomto kontextu, ale ne konkrétními odbornými ukazateli."
-            },{
-                "role": "assistant",
-                "content": "Jaká je vaše životní situace?"
-            },{
-                "role": "user",
-                "content": user_query
-            },{
-                "role": "assistant",
-                "content": "Zde jsou služby, které by vám mohly pomoci:"
-            },{
-                "role": "assistant",
-                "content": sluzby_xml
-            },{
-                "role": "user",
-                "content": "Nejsem spokojen s navrženými službami. Pomoz mi lépe popsat mou situaci, abychom měli větší šanci najít relevantní služby."
-            }
-        ],
+        **build_input(
+            shared_instructions=SPOLECNE_INSTRUKCE,
+            context=sluzby_xml,
+            task_instructions=[
+                "Uživatel popsal svoji situaci. Bohužel se ti nepodařilo najít služby, se kterými by uživatel souhlasil, že mu pomohou situaci vyřešit. Pomoz mu popsat jeho situaci lépe, aby byla větší šance, že najdeme pro něj relevantní služby.",
+                "Odpovídej *VÝHRADNĚ* na základě následujícího popisu životní situace od uživatele, na základě kterého jsme ale nenalezli vhodné služby a také na základě přiloženého XML se seznamem služeb, které jsme nalezli ale uživatel s nimi nebyl spokojený.",
+                "*Nikdy nesmíš uživatele navádět k vylepšení dotazu směrem do oboru, kterého se životní situace uživatele týká, např. popis zdravotního stavu, odborného stavu stavby, atd.* Uživateli můžeš doporučit, aby lépe popsal svoji situaci v tomto kontextu, ale ne konkrétními odbornými ukazateli."
+            ],
+            conversation=[
+                {"role": "assistant", "content": "Jaká je vaše životní situace?"},
+                {"role": "user", "content": user_query},
+                {"role": "assistant", "content": "Zde jsou služby, které by vám mohly pomoci (viz <sluzby>)."},
+                {"role": "user", "content": "Nejsem spokojen s navrženými službami. Pomoz mi lépe popsat mou situaci, abychom měli větší šanci najít relevantní služby."}
+            ]
+        ),
         text={"verbosity": "medium"},
         reasoning={"effort": "medium"}
     )
+    record_usage("pomoz_zlepsit_dotaz", response)
 
     return response.output_text
 
@@ -314,14 +376,22 @@ def main():
         for dotaz in navrh_dotazy:
             print(f"- {dotaz}")
 
-        sluzby = vyhledej_sluzby(navrh_dotazy)
+        pocet_navrzenych = len(navrh_dotazy)
+        navrh_dotazy = deduplikuj_dotazy(navrh_dotazy)
+        if len(navrh_dotazy) < pocet_navrzenych:
+            print(f"Po sloučení podobných dotazů zbývá {len(navrh_dotazy)} z {pocet_navrzenych}")
+
+        sluzby, podobnosti = vyhledej_sluzby(navrh_dotazy)
         filtrovane_sluzby = {}
         
         if sluzby and len(sluzby) > 0:
             
             print(f"Nalezeno služeb: {len(sluzby)}")
 
-            filtrovane_sluzby = filtruj_relevantni_sluzby(sluzby, user_query)
+            prijate, nejiste, kontrolni = predfiltruj_podle_podobnosti(sluzby, podobnosti)
+            posouzene = filtruj_relevantni_sluzby(nejiste, user_query, podobnosti, kontrolni)
+            # Relevantní služby zůstávají v pořadí z vyhledávání
+            filtrovane_sluzby = {sluzba_id: sluzba for sluzba_id, sluzba in sluzby.items() if sluzba_id in prijate or sluzba_id in posouzene}
             
             if len(filtrovane_sluzby) > 0:
                 
@@ -349,5 +419,8 @@ def main():
         for krok in postup.kroky:
             print(f"{krok.poradi}. {krok.nazev} ({krok.sluzba_id})\n   {krok.popis}\n")
 
+    souhrn_cache = cache_posouzeni.get_stats()
+    print(f"Posouzení relevance z cache: {souhrn_cache['hits']} z {souhrn_cache['hits'] + souhrn_cache['misses']} ({souhrn_cache['hit_ratio']:.0%})")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+Relevance Cache - souborová cache verdiktů relevance služeb (TRUE/FALSE) z filtruj_relevantni_sluzby().
+
+Uživatel v hlavní smyčce svůj dotaz postupně zpřesňuje a vyhledávání vrací z velké části stejné
+kandidáty. Jejich posouzení se nemění, dokud se nezmění dotaz, model ani instrukce, takže se
+verdikt pamatuje pod klíčem:
+
+  hash(normalizovaný dotaz) + ID služby + model + verze promptu
+
+Normalizace dotazu je stejná jako u cache vyhledávání ve store (sjednocuje jen mezery a velikost
+písmen); jinak přeformulovaný dotaz je nový dotaz a služby se posoudí znovu. Verze promptu je hash
+instrukcí (viz prompt_version()), změna instrukcí tak staré verdikty sama zneplatní. Verdikty starší než RELEVANCE_CACHE_TTL se
+nepoužijí a při dalším zápisu se ze souboru odstraní.
+
+Konfigurace (proměnné prostředí):
+- RELEVANCE_CACHE_TTL: platnost verdiktu v sekundách (0 = cache vypnuta)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from government_services_store import normalize_query, write_json_atomic
+
+RELEVANCE_CACHE = Path("data/relevance_verdicts.json")
+RELEVANCE_CACHE_TTL = int(os.getenv("RELEVANCE_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def prompt_version(*instructions: str) -> str:
+    """Vrátí verzi promptu odvozenou z textu instrukcí, které o verdiktu rozhodují."""
+    digest = hashlib.sha256()
+    for text in instructions:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:12]
+
+
+class RelevanceCache:
+    """
+    Cache verdiktů relevance pro jeden model a jednu verzi promptu.
+
+    Používání:
+        cache = RelevanceCache(model="gpt-5-mini", prompt_version=prompt_version(KRITERIA_RELEVANCE, INSTRUKCE_POSOUZENI_PO_DAVKACH))
+        verdikty = cache.get_many(user_query, ids)      # jen platné verdikty
+        ...posoudit zbylé služby modelem...
+        cache.put_many(user_query, nove_verdikty)
+        cache.get_stats()                                # zásahy a podíl zásahů
+    """
+
+    def __init__(self, model: str, prompt_version: str, path: Path = RELEVANCE_CACHE, ttl: Optional[int] = None):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.path = Path(path)
+        self.ttl = RELEVANCE_CACHE_TTL if ttl is None else ttl
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _key(self, query_hash: str, service_id: str) -> str:
+        return f"{self.model}|{self.prompt_version}|{query_hash}|{service_id}"
+
+    @staticmethod
+    def _query_hash(user_query: str) -> str:
+        return hashlib.sha256(normalize_query(user_query).encode("utf-8")).hexdigest()[:32]
+
+    def _get_entries(self) -> Dict[str, Dict[str, Any]]:
+        """Vrátí záznamy cache (při prvním použití je načte z disku); volá se pod zámkem."""
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Warning [RelevanceCache]: Ignoring unreadable relevance cache: {e}")
+        return self._entries
+
+    def _is_fresh(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry.get("created", 0) < self.ttl
+
+    def get_many(self, user_query: str, service_ids: Iterable[str]) -> Dict[str, bool]:
+        """
+        Vrátí platné verdikty pro zadané služby.
+
+        Args:
+            user_query: Dotaz uživatele, vůči kterému se relevance posuzovala.
+            service_ids: ID posuzovaných služeb.
+
+        Returns:
+            Slovník {ID služby: relevantní}; služby bez platného verdiktu v něm chybí.
+        """
+        service_ids = list(service_ids)
+        if self.ttl <= 0:
+            self._misses += len(service_ids)
+            return {}
+        query_hash = self._query_hash(user_query)
+        now = time.time()
+        verdicts = {}
+        with self._lock:
+            entries = self._get_entries()
+            for service_id in service_ids:
+                entry = entries.get(self._key(query_hash, service_id))
+                if entry is not None and self._is_fresh(entry, now):
+                    verdicts[service_id] = bool(entry["verdict"])
+            self._hits += len(verdicts)
+            self._misses += len(service_ids) - len(verdicts)
+        return verdicts
+
+    def put_many(self, user_query: str, verdicts: Dict[str, bool]) -> None:
+        """Uloží nové verdikty {ID služby: relevantní} a cache zapíše na disk (bez prošlých záznamů)."""
+        if self.ttl <= 0 or not verdicts:
+            return
+        query_hash = self._query_hash(user_query)
+        now = time.time()
+        with self._lock:
+            entries = self._get_entries()
+            for service_id, verdict in verdicts.items():
+                entries[self._key(query_hash, service_id)] = {"verdict": bool(verdict), "created": now}
+            for key in [key for key, entry in entries.items() if not self._is_fresh(entry, now)]:
+                del entries[key]
+            try:
+                write_json_atomic(self.path, entries)
+            except Exception as e:
+                print(f"Warning [RelevanceCache]: Failed to store relevance cache: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Vrátí počet zásahů a nezásahů cache od spuštění a podíl zásahů."""
+        total = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,260 @@
+"""
+Relevance Gate - předfiltrování kandidátů podle podobnosti z vyhledávání, než je posoudí model.
+
+Kandidáti s velmi vysokou podobností dotazu jsou téměř vždy relevantní a kandidáti s velmi nízkou
+téměř nikdy; posuzovat je modelem stojí čas i tokeny a výsledek skoro nemění. Brána proto:
+
+  podobnost >= upper  → přijmout bez modelu
+  podobnost <= lower  → zamítnout bez modelu
+  mezi tím            → nejisté pásmo, posoudí model
+
+Prahy se nenastavují od oka, ale kalibrují z verdiktů modelu zaznamenaných při běhu aplikace
+(log_verdicts() → RELEVANCE_LOG). Kalibrace (calibrate(), spuštění tohoto souboru) hledá co nejširší
+pásma, ve kterých se brána shoduje s modelem aspoň v požadovaném podílu případů, a prahy uloží
+do RELEVANCE_THRESHOLDS pro daný model a verzi promptu. Dokud kalibrace neproběhla, brána nic
+nerozhoduje a model posuzuje všechny kandidáty.
+
+Aby šlo kalibraci opakovat i s bránou zapnutou, pošle se malý náhodný podíl jinak rozhodnutých
+kandidátů modelu i tak (RELEVANCE_GATE_AUDIT); bez toho by se verdikty mimo nejisté pásmo už nikdy
+nezaznamenaly. Takové kontrolní verdikty jsou v logu označené („audited“) a kalibrace je váží
+převrácenou hodnotou podílu, se kterým byly vybrány – zastupují i kandidáty, které rozhodla brána.
+
+Konfigurace (proměnné prostředí):
+- RELEVANCE_GATE_AUDIT: podíl kandidátů rozhodnutých bránou, které se přesto pošlou modelu
+- RELEVANCE_GATE_PRECISION: požadovaná shoda brány s modelem v pásmu přijetí i zamítnutí
+- RELEVANCE_GATE_MIN_SAMPLES: nejmenší počet zaznamenaných verdiktů, ze kterého se kalibruje
+
+Kalibrace:
+    python relevance_gate.py
+"""
+
+import json
+import os
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+RELEVANCE_LOG = Path("data/relevance_log.jsonl")
+RELEVANCE_THRESHOLDS = Path("data/relevance_thresholds.json")
+RELEVANCE_GATE_AUDIT = float(os.getenv("RELEVANCE_GATE_AUDIT", "0.05"))
+RELEVANCE_GATE_PRECISION = float(os.getenv("RELEVANCE_GATE_PRECISION", "0.95"))
+RELEVANCE_GATE_MIN_SAMPLES = int(os.getenv("RELEVANCE_GATE_MIN_SAMPLES", "100"))
+
+
+def log_verdicts(similarities: Dict[str, float], verdicts: Dict[str, bool], model: str, prompt_version: str,
+                 audited: Iterable[str] = (), audit_ratio: float = RELEVANCE_GATE_AUDIT, path: Path = RELEVANCE_LOG) -> None:
+    """
+    Připíše verdikty modelu spolu s podobností služby z vyhledávání do logu pro kalibraci.
+
+    Args:
+        similarities: {ID služby: podobnost s dotazem}; služby bez podobnosti se nezaznamenají.
+        verdicts: {ID služby: relevantní} – jen verdikty, které opravdu vrátil model.
+        model: Model, který verdikty vydal.
+        prompt_version: Verze promptu posouzení (viz relevance_cache.prompt_version()).
+        audited: ID služeb, které rozhodla brána a modelu šly jen ke kontrole (viz gate()).
+        audit_ratio: Podíl, se kterým brána kontrolní služby vybírala (uloží se u kontrolních verdiktů).
+    """
+    audited = set(audited)
+    now = time.time()
+    lines = []
+    for service_id, verdict in verdicts.items():
+        if service_id not in similarities:
+            continue
+        record = {"service_id": service_id, "similarity": round(similarities[service_id], 6), "verdict": bool(verdict),
+                  "audited": service_id in audited, "model": model, "prompt_version": prompt_version, "created": now}
+        if record["audited"]:
+            record["audit_ratio"] = audit_ratio
+        lines.append(json.dumps(record, ensure_ascii=False))
+    if not lines:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    except Exception as e:
+        print(f"Warning [log_verdicts]: Failed to append to relevance log: {e}")
+
+
+def read_log(path: Path = RELEVANCE_LOG) -> List[Dict[str, Any]]:
+    """Načte zaznamenané verdikty; poškozené řádky (např. po pádu během zápisu) přeskočí."""
+    records = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def _thresholds_key(model: str, prompt_version: str) -> str:
+    return f"{model}|{prompt_version}"
+
+
+def load_thresholds(model: str, prompt_version: str, path: Path = RELEVANCE_THRESHOLDS) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Vrátí kalibrované prahy (lower, upper) pro daný model a verzi promptu.
+
+    Prahy kalibrované pro jiný model nebo jiné instrukce neplatí, v tom případě (stejně jako
+    bez kalibrace) vrátí (None, None) a brána nic nerozhoduje.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            calibration = json.load(f).get(_thresholds_key(model, prompt_version))
+    except FileNotFoundError:
+        return None, None
+    except Exception as e:
+        print(f"Warning [load_thresholds]: Ignoring unreadable thresholds file: {e}")
+        return None, None
+    if not calibration:
+        return None, None
+    return calibration.get("lower"), calibration.get("upper")
+
+
+def gate(similarities: Dict[str, float], lower: Optional[float], upper: Optional[float],
+         audit_ratio: float = RELEVANCE_GATE_AUDIT) -> Tuple[Dict[str, bool], List[str], Set[str]]:
+    """
+    Rozdělí kandidáty podle podobnosti na rozhodnuté bránou a nejisté.
+
+    Args:
+        similarities: {ID služby: podobnost s dotazem} v pořadí kandidátů.
+        lower: Práh zamítnutí (podobnost <= lower → nerelevantní); None = nezamítat.
+        upper: Práh přijetí (podobnost >= upper → relevantní); None = nepřijímat.
+        audit_ratio: Podíl rozhodnutých kandidátů, které se náhodně pošlou do nejistého pásma.
+
+    Returns:
+        ({ID služby: relevantní} pro rozhodnuté, [ID služeb pro posouzení modelem], {ID kontrolních služeb}) –
+        kontrolní služby jsou ty z posuzovaných, které by jinak rozhodla brána (viz log_verdicts()).
+    """
+    decided: Dict[str, bool] = {}
+    uncertain: List[str] = []
+    audited: Set[str] = set()
+    for service_id, similarity in similarities.items():
+        if upper is not None and similarity >= upper:
+            verdict = True
+        elif lower is not None and similarity <= lower:
+            verdict = False
+        else:
+            uncertain.append(service_id)
+            continue
+        if random.random() < audit_ratio:
+            uncertain.append(service_id)
+            audited.add(service_id)
+        else:
+            decided[service_id] = verdict
+    return decided, uncertain, audited
+
+
+def calibrate(records: List[Dict[str, Any]], precision: float = RELEVANCE_GATE_PRECISION,
+              min_samples: int = RELEVANCE_GATE_MIN_SAMPLES) -> Optional[Dict[str, Any]]:
+    """
+    Najde prahy brány z verdiktů modelu (jednoho modelu a jedné verze promptu).
+
+    Práh přijetí je nejnižší podobnost, nad kterou je aspoň `precision` verdiktů TRUE, práh
+    zamítnutí nejvyšší podobnost (pod prahem přijetí), pod kterou je aspoň `precision` verdiktů
+    FALSE. Prahy leží vždy na hranici mezi různými hodnotami podobnosti, takže shodné podobnosti
+    skončí ve stejném pásmu.
+
+    Kontrolní verdikty (audited) mají váhu 1 / audit_ratio: za každý z nich brána rozhodla
+    zhruba tolik kandidátů, kteří se do logu nedostali. Bez vážení by je kalibrace podceňovala
+    a pásma brány by se s každou další kalibrací zužovala.
+
+    Returns:
+        Prahy a přehled, jak by brána na zaznamenaných datech rozhodla (podíly pásem, shoda
+        s modelem), nebo None, pokud záznamů není aspoň `min_samples`.
+    """
+    if len(records) < min_samples:
+        return None
+    points = sorted((float(r["similarity"]), bool(r["verdict"]), _record_weight(r)) for r in records)
+    n = len(points)
+    total = sum(w for _, _, w in points)
+
+    upper = None
+    relevant = weight = 0.0
+    for idx in range(n - 1, -1, -1):
+        relevant += points[idx][2] * points[idx][1]
+        weight += points[idx][2]
+        at_boundary = idx == 0 or points[idx - 1][0] < points[idx][0]
+        if at_boundary and relevant / weight >= precision:
+            upper = points[idx][0]
+
+    lower = None
+    irrelevant = weight = 0.0
+    for idx in range(n):
+        if upper is not None and points[idx][0] >= upper:
+            break
+        irrelevant += points[idx][2] * (not points[idx][1])
+        weight += points[idx][2]
+        at_boundary = idx == n - 1 or points[idx + 1][0] > points[idx][0]
+        if at_boundary and irrelevant / weight >= precision:
+            lower = points[idx][0]
+
+    # Vážené součty: (váha všech, váha verdiktů TRUE) v pásmu přijetí a zamítnutí
+    accepted = [(w, w * v) for s, v, w in points if upper is not None and s >= upper]
+    rejected = [(w, w * v) for s, v, w in points if lower is not None and s <= lower]
+    accepted_weight, accepted_relevant = sum(w for w, _ in accepted), sum(r for _, r in accepted)
+    rejected_weight, rejected_relevant = sum(w for w, _ in rejected), sum(r for _, r in rejected)
+    errors = (accepted_weight - accepted_relevant) + rejected_relevant
+    return {
+        "lower": lower,
+        "upper": upper,
+        "samples": n,
+        "audited_samples": sum(1 for r in records if r.get("audited")),
+        "target_precision": precision,
+        "accepted_share": round(accepted_weight / total, 3),
+        "rejected_share": round(rejected_weight / total, 3),
+        "uncertain_share": round(1 - (accepted_weight + rejected_weight) / total, 3),
+        "accept_precision": round(accepted_relevant / accepted_weight, 3) if accepted else None,
+        "reject_precision": round(1 - rejected_relevant / rejected_weight, 3) if rejected else None,
+        "agreement": round(1 - errors / total, 3),
+    }
+
+
+def _record_weight(record: Dict[str, Any]) -> float:
+    """Váha verdiktu při kalibraci: kontrolní verdikt zastupuje 1 / audit_ratio kandidátů, ostatní 1."""
+    audit_ratio = record.get("audit_ratio") or 0
+    return 1 / audit_ratio if record.get("audited") and audit_ratio > 0 else 1.0
+
+
+def main() -> None:
+    """Zkalibruje prahy pro každou kombinaci model + verze promptu v logu a uloží je."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in read_log():
+        groups.setdefault(_thresholds_key(record["model"], record["prompt_version"]), []).append(record)
+    if not groups:
+        print(f"V {RELEVANCE_LOG} nejsou žádné zaznamenané verdikty, není z čeho kalibrovat.")
+        return
+
+    thresholds = {}
+    try:
+        with open(RELEVANCE_THRESHOLDS, "r", encoding="utf-8") as f:
+            thresholds = json.load(f)  # prahy ostatních modelů a verzí promptu zůstanou zachované
+    except FileNotFoundError:
+        pass
+    calibrated = 0
+    for key, records in groups.items():
+        calibration = calibrate(records)
+        if calibration is None:
+            print(f"{key}: jen {len(records)} verdiktů, ke kalibraci je potřeba aspoň {RELEVANCE_GATE_MIN_SAMPLES}")
+            continue
+        thresholds[key] = calibration
+        calibrated += 1
+        print(f"{key}: zamítnout <= {calibration['lower']}, přijmout >= {calibration['upper']}; "
+              f"model posoudí {calibration['uncertain_share']:.0%} kandidátů, shoda s modelem {calibration['agreement']:.1%} "
+              f"({calibration['samples']} verdiktů, z toho {calibration['audited_samples']} kontrolních)")
+
+    if calibrated:
+        RELEVANCE_THRESHOLDS.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = RELEVANCE_THRESHOLDS.with_name(f"{RELEVANCE_THRESHOLDS.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(thresholds, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, RELEVANCE_THRESHOLDS)
+        print(f"Prahy uloženy do {RELEVANCE_THRESHOLDS}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,14 +13,12 @@ load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 
 store = GovernmentServicesStore()
-store.load_services()
-
-stats = store.get_services_embedding_statistics()
-print(f"Načteno {stats['total_services']} služeb.")
-print(f"Embeddings v ChromaDB: {stats['total_embeddings']} (coverage: {stats['coverage_percentage']}%)")
+# Služby, vektorový index a cache se načítají na pozadí, program tak může hned pokračovat;
+# dotazy na store (vyhledávání, detaily, kroky) samy počkají, až bude potřebná část připravená.
+store.warm_up()
 
 @function_tool
-def nastroj_pro_vyhledani_sluzeb(charakteristika_zivotni_situace: str, k: int) -> List[GovernmentService]:
+def nastroj_pro_vyhledani_sluzeb(charakteristika_zivotni_situace: str, k: int, pouze_digitalni: bool = False) -> List[GovernmentService]:
     """Vyhledá služby veřejné správy podle klíčových slov charakterizujících životní situaci uživatele.
     Využívá vektorové vyhledávání v databázi textových popisů všech služeb.
     Pro efektivní využití se doporučuje, aby popis životní situace obsahoval konkrétní klíčová slova.
@@ -30,8 +28,9 @@ def nastroj_pro_vyhledani_sluzeb(charakteristika_zivotni_situace: str, k: int) -
     Args:
         charakteristika_zivotni_situace (str): Charakteristika životní situace pomocí klíčových slov.
         k (int): Počet služeb k vrácení.
+        pouze_digitalni (bool): Vrátit pouze služby, které lze vyřídit digitálně přes datovou schránku.
     """
-    sluzby = store.search_services(charakteristika_zivotni_situace, k=k)
+    sluzby = store.search_services(charakteristika_zivotni_situace, k=k, digital_only=pouze_digitalni)
     print("[DEBUG] TOOL nastroj_pro_vyhledani_sluzeb: Nalezeny služby:", [sluzba.name for sluzba in sluzby])
     return sluzby
 
@@ -119,6 +118,11 @@ async def main():
             elif isinstance(polozka, ToolCallOutputItem):
                 print("[AGENTIC AI]: Výstup z nástroje.")
 
+        # Instrukce agenta jsou vždy na začátku vstupu a historie se jen prodlužuje, takže se prefix
+        # promptu mezi koly opakuje a poskytovatel ho může vzít z prompt cache
+        usage = vystup_agenta.context_wrapper.usage
+        print(f"[AGENTIC AI] Tokeny: {usage.input_tokens} vstupních (z toho {usage.input_tokens_details.cached_tokens} z prompt cache), {usage.output_tokens} výstupních")
+
         historie_komunikace = vystup_agenta.to_input_list()
 
 if __name__ == "__main__":
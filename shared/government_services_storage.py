@@ -0,0 +1,1078 @@
+"""
+Government Services Storage - úložná vrstva GovernmentServicesStore společná pro kapitoly 7–12.
+
+Tyto části úložiště se mezi kapitolami nemění a pro pochopení RAGu je není potřeba číst:
+1) Datový model služby (GovernmentService) a otisk katalogu, pro který platí odvozené cache.
+2) Souborové cache: atomický zápis, kodeky (json / orjson / orjson-gzip) a hlavička s kontrolním součtem.
+3) Binární snapshot katalogu otevíraný přes mmap (pole služeb se dekódují až při přístupu).
+4) GovernmentServicesStorage – metody store, které:
+   - přepínají služby mezi snapshotem a pamětí,
+   - provádějí první (studené) načtení jako proudovou pipeline s žurnálem, po přerušení pokračují,
+   - spravují vektorové indexy v Chroma po embedding modelech a přechod na jiný model bez výpadku.
+
+Modul importuje government_services_store.py každé kapitoly (složku shared/ si přidá do sys.path).
+"""
+
+from typing import List, Dict, Optional, Tuple, Any, Iterable, Iterator, Set, Callable
+from dataclasses import dataclass, fields
+from array import array
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import json
+import mmap
+import os
+import queue
+import re
+import shutil
+import struct
+import sys
+import threading
+import zlib
+from pathlib import Path
+from urllib.parse import urlparse
+
+try:
+    import orjson
+except ImportError:  # orjson je v requirements, ale bez něj cache fungují přes standardní json
+    orjson = None
+
+# Konfigurace úložné vrstvy:
+# - SERVICES_CACHE: JSON cache se seznamem služeb (výměnný formát; čte se, jen když chybí nebo je starší snapshot)
+# - SERVICES_SNAPSHOT: binární snapshot služeb otevíraný přes mmap (pole služeb se dekódují až při přístupu)
+# - CACHE_CODEC: formát souborových cache – "json" (čitelný), "orjson" (rychlý zápis), "orjson-gzip" (menší soubory)
+# - CACHE_VERIFY_CHECKSUMS: ověřovat při načtení kontrolní součet obsahu cache (hlavička a délka se kontrolují vždy)
+# - BOOTSTRAP_DIR: rozpracované první načtení (mezivýsledky + žurnál), aby šlo po přerušení pokračovat
+# - PIPELINE_QUEUE_SIZE: kapacita front mezi etapami prvního načtení (omezuje paměť, brzdí rychlejší etapy)
+# - EMBEDDING_BATCH_SIZE: kolik textů jde do jednoho volání embedding API
+# - EMBEDDINGS_MODEL: název embedding modelu pro výpočet vektorů (při změně se nový index postaví na pozadí)
+# - CHROMA_PATH: složka s lokálním úložištěm Chroma (vektorová DB)
+# - ACTIVE_INDEX_PATH: ukazatel na kolekci v Chroma, ze které se právě vyhledává
+SERVICES_CACHE = Path("data/government_services_data.json")
+SERVICES_SNAPSHOT = Path("data/government_services.snapshot")
+CACHE_CODEC = os.getenv("CACHE_CODEC", "orjson")
+CACHE_VERIFY_CHECKSUMS = os.getenv("CACHE_VERIFY_CHECKSUMS", "1") == "1"
+BOOTSTRAP_DIR = Path("data/bootstrap")
+BOOTSTRAP_JOURNAL = BOOTSTRAP_DIR / "journal.json"
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))
+EMBEDDING_BATCH_SIZE = 500
+EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
+CHROMA_PATH = Path("data/chromadb")
+ACTIVE_INDEX_PATH = CHROMA_PATH / "active_index.json"
+
+# Společný začátek URI služeb v otevřených datech (za ním následuje ID služby)
+SERVICE_URI_PREFIX = "https://rpp-opendata.egon.gov.cz/odrpp/zdroj/služba/"
+
+# Původní (nejmenná) kolekce z dob, kdy index nebyl rozlišený podle modelu
+LEGACY_COLLECTION_NAME = "government_services"
+# Známé dimenze embedding modelů; u ostatních se dimenze zjistí zkušebním voláním API
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Žurnál prvního načtení zapisují souběžně etapy pipeline (čtení + úprava + zápis musí proběhnout naráz)
+_BOOTSTRAP_JOURNAL_LOCK = threading.Lock()
+
+# Značka konce proudu v frontách prvního načtení
+_PIPELINE_DONE = object()
+
+# Binární snapshot služeb: hlavička (magic, verze formátu, příznaky, počet sloupců, počet služeb,
+# verze katalogu, délka a CRC32 zbytku souboru), adresář pozic sekcí a sloupce. Textový sloupec =
+# tabulka offsetů (n + 1 × uint64) + UTF-8 data, číselný sloupec = n × int64 (-1 = None), nakonec
+# pořadí řádků seřazených podle ID (n × uint32). Při změně formátu je nutné zvýšit verzi – starší
+# snapshot se pak znovu vytvoří z JSON cache.
+_SNAPSHOT_MAGIC = b"GSSNAP\x00\x00"
+_SNAPSHOT_VERSION = 2
+_SNAPSHOT_HEADER = struct.Struct("<8sHHII16sQI")
+_SNAPSHOT_FLAG_ATTRIBUTES = 1  # všechny služby mají načtené atributy úkonů
+_SNAPSHOT_TEXT_COLUMNS = ("uri", "id", "name", "description", "keywords", "channel_types")
+_SNAPSHOT_INT_COLUMNS = ("step_count", "digital_step_count")
+_SNAPSHOT_LIST_COLUMNS = ("keywords", "channel_types")  # seznamy řetězců spojené oddělovačem
+_SNAPSHOT_LIST_SEPARATOR = "\x1f"
+
+# Souborové cache začínají řádkem "GSCACHE {hlavička v JSON}" s verzí schématu, kodekem, verzí
+# katalogu, délkou a CRC32 obsahu – poškozený nebo zastaralý soubor se tak pozná bez parsování
+_CACHE_MAGIC = b"GSCACHE "
+_CACHE_SCHEMA_VERSION = 1
+
+
+@dataclass(slots=True)
+class GovernmentService:
+    """Reprezentuje jednu službu veřejné správy.
+
+    Instance nemají `__dict__` (sloty) a klíčová slova i typy kanálů jsou internované řetězce,
+    takže se opakující se hodnoty v paměti drží jen jednou.
+    """
+    uri: str
+    id: str
+    name: str
+    description: str
+    keywords: List[str] = None
+    # Předpočítané atributy úkonů služby (None = zatím nenačteno ze SPARQL)
+    step_count: Optional[int] = None
+    digital_step_count: Optional[int] = None
+    channel_types: List[str] = None
+
+    def __post_init__(self):
+        """Po vytvoření objektu:
+        - normalizuje pole `keywords` a `channel_types` na prázdný seznam (jinak internuje jejich hodnoty),
+        - pokud chybí `id`, odvodí jej z `uri` (fragment nebo poslední segment cesty).
+        """
+        self.keywords = intern_strings(self.keywords) if self.keywords else []
+        self.channel_types = intern_strings(self.channel_types) if self.channel_types else []
+
+        if not self.id and self.uri:
+            self.id = extract_id_from_uri(self.uri)
+
+        if not self.id:
+            raise ValueError("Service ID could not be determined from URI")
+
+    @property
+    def has_digital_steps(self) -> bool:
+        """True, pokud lze službu vyřídit alespoň jedním digitálním úkonem přes datovou schránku."""
+        return bool(self.digital_step_count)
+
+    @property
+    def attributes_loaded(self) -> bool:
+        """True, pokud už byly atributy úkonů služby načteny."""
+        return self.step_count is not None
+
+
+def intern_strings(values: Iterable[str]) -> List[str]:
+    """Vrátí seznam internovaných řetězců (stejné klíčové slovo u tisíců služeb je v paměti jednou)."""
+    return [sys.intern(v) for v in values]
+
+
+def extract_id_from_uri(uri: str) -> str:
+    """Vrátí ID extrahované z URI (nejdříve fragment, jinak poslední segment cesty).
+
+    Funguje jak s absolutními URI, tak s relativními cestami jako 'detailní-popis-služby-vs/S6192'.
+    """
+    if not uri:
+        return ""
+
+    parsed = urlparse(uri)
+    if parsed.fragment:
+        return parsed.fragment
+
+    # Pro absolutní URI použij parsed.path, pro relativní URI použij celý string
+    path_to_parse = parsed.path if parsed.scheme or parsed.netloc else uri
+
+    if path_to_parse:
+        parts = [p for p in path_to_parse.split("/") if p]
+        if parts:
+            return parts[-1]
+    return ""
+
+
+def service_to_dict(service: GovernmentService) -> Dict[str, Any]:
+    """Vrátí datová pole služby jako slovník (pro zápis do JSON)."""
+    return {f.name: getattr(service, f.name) for f in fields(GovernmentService)}
+
+
+def catalog_version(services: Iterable[GovernmentService]) -> str:
+    """Vrátí verzi katalogu – otisk ID a názvů služeb (stejný katalog má vždy stejnou verzi)."""
+    crc, count = 0, 0
+    for service_id, name in sorted((s.id, s.name) for s in services):
+        crc = zlib.crc32(f"{service_id}\t{name}\n".encode("utf-8"), crc)
+        count += 1
+    return f"{count:08x}{crc:08x}"
+
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    """Zapíše data do dočasného souboru, vynutí zápis na disk a soubor atomicky přejmenuje na cílový.
+
+    Po pádu (i výpadku napájení) tak na místě cílového souboru zůstane buď stará, nebo nová
+    úplná verze, nikdy rozepsaný soubor.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Dočasný soubor je pro každé vlákno vlastní, souběžné zápisy do stejného cíle si ho nepřepíšou
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_json_atomic(path: Path, data: Any, indent: Optional[int] = None) -> None:
+    """Zapíše JSON atomicky (viz write_bytes_atomic())."""
+    write_bytes_atomic(path, json.dumps(data, ensure_ascii=False, indent=indent).encode("utf-8"))
+
+
+def _orjson_dumps(data: Any) -> bytes:
+    """Serializuje data přes orjson (bez něj kompaktně přes standardní json)."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# Kodeky souborových cache: název → (serializace do bajtů, přípona přidaná k názvu souboru).
+# Kodek obsahu se čte z hlavičky souboru, takže po změně CACHE_CODEC se stávající cache dál načtou.
+_CACHE_CODECS: Dict[str, Tuple[Callable[[Any], bytes], str]] = {
+    "json": (lambda data: json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"), ""),
+    "orjson": (_orjson_dumps, ""),
+    "orjson-gzip": (lambda data: gzip.compress(_orjson_dumps(data), compresslevel=1, mtime=0), ".gz"),
+}
+_CACHE_SUFFIXES = ("", ".gz")
+
+
+def _cache_codec() -> str:
+    """Vrátí název kodeku pro zápis (neznámá hodnota CACHE_CODEC → "orjson")."""
+    return CACHE_CODEC if CACHE_CODEC in _CACHE_CODECS else "orjson"
+
+
+def cache_file(path: Path) -> Optional[Path]:
+    """Vrátí existující soubor cache – přednostně ve formátu podle CACHE_CODEC, jinak v jiném."""
+    preferred = _CACHE_CODECS[_cache_codec()][1]
+    for suffix in (preferred,) + _CACHE_SUFFIXES:
+        candidate = path.with_name(path.name + suffix)
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def _check_cache_header(path: Path, catalog: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Rychle ověří hlavičku souboru cache (bez čtení obsahu) a vrátí ji spolu s pozicí začátku obsahu.
+
+    Soubor bez hlavičky (starší formát) vrací (None, 0). Zastaralé schéma, cache postavená pro jinou
+    verzi katalogu nebo zkrácený soubor vyvolají ValueError.
+    """
+    with open(path, "rb") as f:
+        first_line = f.readline(4096)
+    if not first_line.startswith(_CACHE_MAGIC):
+        return None, 0
+    header = json.loads(first_line[len(_CACHE_MAGIC):])
+    if header.get("schema") != _CACHE_SCHEMA_VERSION:
+        raise ValueError(f"{path} has outdated schema {header.get('schema')}")
+    if catalog is not None and header.get("catalog") != catalog:
+        raise ValueError(f"{path} was built for catalog version {header.get('catalog')}, current is {catalog}")
+    if path.stat().st_size != len(first_line) + header["length"]:
+        raise ValueError(f"{path} is truncated")
+    return header, len(first_line)
+
+
+def cache_is_valid(path: Path, catalog: Optional[str] = None) -> bool:
+    """True, pokud cache existuje a její hlavička odpovídá (rychlá kontrola bez čtení obsahu)."""
+    existing = cache_file(path)
+    if existing is None:
+        return False
+    try:
+        header, _ = _check_cache_header(existing, catalog)
+    except Exception:
+        return False
+    return header is not None
+
+
+def read_cache(path: Path, catalog: Optional[str] = None) -> Any:
+    """Načte a ověří souborovou cache.
+
+    Raises:
+        FileNotFoundError: Cache neexistuje.
+        ValueError: Cache je poškozená (délka, kontrolní součet) nebo zastaralá (schéma, verze katalogu).
+    """
+    existing = cache_file(path)
+    if existing is None:
+        raise FileNotFoundError(f"Cache not found: {path}")
+    header, offset = _check_cache_header(existing, catalog)
+    with open(existing, "rb") as f:
+        f.seek(offset)  # obsah za hlavičkou čteme rovnou, bez kopie celého souboru
+        raw = f.read()
+    if header is None:
+        compressed = existing.name.endswith(".gz")
+    else:
+        if CACHE_VERIFY_CHECKSUMS and zlib.crc32(raw) != header["crc32"]:
+            raise ValueError(f"{existing} checksum mismatch")
+        compressed = header["codec"].endswith("gzip")
+    if compressed:
+        raw = gzip.decompress(raw)
+    # Všechny kodeky zapisují JSON; standardní parser je na českých textech stejně rychlý jako orjson
+    # a na rozdíl od něj si nestaví celý dokument předem, takže čtení potřebuje zhruba třetinu paměti
+    return json.loads(raw)
+
+
+def write_cache(path: Path, data: Any, catalog: Optional[str] = None) -> Path:
+    """Atomicky zapíše cache kodekem CACHE_CODEC (s hlavičkou) a smaže její kopie v jiném formátu."""
+    codec = _cache_codec()
+    dumps, suffix = _CACHE_CODECS[codec]
+    payload = dumps(data)
+    header = {"schema": _CACHE_SCHEMA_VERSION, "codec": codec, "catalog": catalog, "length": len(payload), "crc32": zlib.crc32(payload)}
+    target = path.with_name(path.name + suffix)
+    write_bytes_atomic(target, _CACHE_MAGIC + json.dumps(header).encode("ascii") + b"\n" + payload)
+    for other in _CACHE_SUFFIXES:
+        if other != suffix:
+            path.with_name(path.name + other).unlink(missing_ok=True)
+    return target
+
+
+def _index_collection_name(model: str, dimension: int) -> str:
+    """Vrátí název kolekce v Chroma rozlišený podle embedding modelu a dimenze."""
+    model_slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", model).strip("-._")
+    return f"{LEGACY_COLLECTION_NAME}__{model_slug}__{dimension}"
+
+
+
+class _SnapshotField:
+    """Pole služby ze snapshotu: při prvním čtení se dekóduje a dál se drží v instanci."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, service, owner=None):
+        if service is None:
+            return self
+        value = service._snapshot.read(self.name, service._row)
+        service.__dict__[self.name] = value
+        return value
+
+
+class _SnapshotService(GovernmentService):
+    """Služba, jejíž pole se čtou líně z namapovaného snapshotu (zápis do pole funguje jako obvykle)."""
+
+    def __init__(self, snapshot: "ServiceSnapshot", row: int):
+        self.__dict__["_snapshot"] = snapshot
+        self.__dict__["_row"] = row
+
+    def load_all(self) -> None:
+        """Dekóduje všechna pole, takže služba přestane snapshot potřebovat."""
+        for f in fields(GovernmentService):
+            getattr(self, f.name)
+
+    # Navenek (výpisy v nástrojích agenta, porovnání) se služba ze snapshotu chová jako GovernmentService
+    def __repr__(self) -> str:
+        values = ", ".join(f"{f.name}={getattr(self, f.name)!r}" for f in fields(GovernmentService) if f.repr)
+        return f"GovernmentService({values})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, GovernmentService):
+            return NotImplemented
+        return all(getattr(self, f.name) == getattr(other, f.name) for f in fields(GovernmentService))
+
+    __hash__ = None  # stejně jako GovernmentService (měnitelná dataclass)
+
+
+for _field in fields(GovernmentService):
+    setattr(_SnapshotService, _field.name, _SnapshotField(_field.name))
+
+
+class ServiceSnapshot:
+    """Binární snapshot služeb otevřený přes mmap (formát viz _SNAPSHOT_HEADER).
+
+    Otevření přečte jen hlavičku a adresář sekcí, takže trvá stejně dlouho pro jakkoli
+    velký katalog. Služby se vytvářejí až při přístupu a každému řádku odpovídá stále
+    tentýž objekt, takže změny provedené na službě se neztratí.
+    """
+
+    def __init__(self, path: Path):
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._view = memoryview(self._mmap)
+        self._columns: Dict[str, Tuple[memoryview, int]] = {}
+        try:
+            magic, version, flags, column_count, count, catalog, length, checksum = _SNAPSHOT_HEADER.unpack_from(self._mmap, 0)
+            if magic != _SNAPSHOT_MAGIC or sys.byteorder != "little":
+                raise ValueError("Not a services snapshot")
+            if version != _SNAPSHOT_VERSION or column_count != len(_SNAPSHOT_TEXT_COLUMNS) + len(_SNAPSHOT_INT_COLUMNS):
+                raise ValueError(f"Unsupported snapshot version {version}")
+            if len(self._view) != _SNAPSHOT_HEADER.size + length:
+                raise ValueError("Truncated services snapshot")
+            if CACHE_VERIFY_CHECKSUMS and zlib.crc32(self._view[_SNAPSHOT_HEADER.size:]) != checksum:
+                raise ValueError("Services snapshot checksum mismatch")
+            self.count = count
+            self.catalog = catalog.rstrip(b"\x00").decode("ascii")
+            self.attributes_complete = bool(flags & _SNAPSHOT_FLAG_ATTRIBUTES)
+
+            directory = self._cast(_SNAPSHOT_HEADER.size, "Q", 2 * len(_SNAPSHOT_TEXT_COLUMNS) + len(_SNAPSHOT_INT_COLUMNS) + 1)
+            positions = iter(directory.tolist())
+            directory.release()
+            for name in _SNAPSHOT_TEXT_COLUMNS:
+                offsets_pos, data_pos = next(positions), next(positions)
+                self._columns[name] = (self._cast(offsets_pos, "Q", count + 1), data_pos)
+            for name in _SNAPSHOT_INT_COLUMNS:
+                self._columns[name] = (self._cast(next(positions), "q", count), 0)
+            self._id_order = self._cast(next(positions), "I", count)
+        except Exception:
+            self.close()
+            raise
+        self._services: List[Optional[_SnapshotService]] = [None] * count
+
+    def _cast(self, pos: int, typecode: str, length: int) -> memoryview:
+        """Vrátí pohled na sekci snapshotu jako pole čísel daného typu."""
+        size = struct.calcsize(typecode) * length
+        if pos + size > len(self._view):
+            raise ValueError("Truncated services snapshot")
+        return self._view[pos:pos + size].cast(typecode)
+
+    def read(self, name: str, row: int) -> Any:
+        """Dekóduje hodnotu jednoho pole pro daný řádek."""
+        values, data_pos = self._columns[name]
+        if name in _SNAPSHOT_INT_COLUMNS:
+            value = values[row]
+            return None if value < 0 else value
+        text = self._mmap[data_pos + values[row]:data_pos + values[row + 1]].decode("utf-8")
+        if name in _SNAPSHOT_LIST_COLUMNS:
+            return intern_strings(text.split(_SNAPSHOT_LIST_SEPARATOR)) if text else []
+        return text
+
+    def field(self, name: str, row: int) -> Any:
+        """Vrátí hodnotu pole – z už vytvořené služby (mohla se změnit), jinak rovnou ze souboru bez vytváření objektu."""
+        service = self._services[row]
+        return getattr(service, name) if service is not None else self.read(name, row)
+
+    def service(self, row: int) -> _SnapshotService:
+        """Vrátí (líně dekódovanou) službu na daném řádku."""
+        service = self._services[row]
+        if service is None:
+            service = self._services[row] = _SnapshotService(self, row)
+        return service
+
+    def find(self, service_id: str) -> Optional[int]:
+        """Najde řádek služby podle ID binárním vyhledáváním v pořadí seřazeném podle ID."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            current = self.read("id", self._id_order[middle])
+            if current < service_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.read("id", self._id_order[low]) == service_id:
+            return self._id_order[low]
+        return None
+
+    def close(self) -> None:
+        """Uvolní mapování souboru (služby, které se ještě nedekódovaly celé, pak už číst nejde)."""
+        for values, _ in self._columns.values():
+            values.release()
+        self._columns = {}
+        if getattr(self, "_id_order", None) is not None:
+            self._id_order.release()
+            self._id_order = None
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def write(path: Path, services: List[GovernmentService], catalog: str) -> None:
+        """Zapíše služby do nového snapshotu (atomicky přes dočasný soubor)."""
+        count = len(services)
+        sections: List[bytes] = []
+        for name in _SNAPSHOT_TEXT_COLUMNS:
+            offsets, data = array("Q", [0]), bytearray()
+            for service in services:
+                value = getattr(service, name)
+                if name in _SNAPSHOT_LIST_COLUMNS:
+                    value = _SNAPSHOT_LIST_SEPARATOR.join(v.replace(_SNAPSHOT_LIST_SEPARATOR, " ") for v in value)
+                data += value.encode("utf-8")
+                offsets.append(len(data))
+            sections += [offsets.tobytes(), bytes(data)]
+        for name in _SNAPSHOT_INT_COLUMNS:
+            values = [getattr(service, name) for service in services]
+            sections.append(array("q", [-1 if v is None else v for v in values]).tobytes())
+        id_order = sorted(range(count), key=lambda row: services[row].id)
+        sections.append(array("I", id_order).tobytes())
+
+        def padded(size: int) -> int:
+            return (size + 7) // 8 * 8
+
+        # Textové sloupce mají v adresáři dvě pozice (offsety, data), ostatní sekce jednu
+        position = padded(_SNAPSHOT_HEADER.size + 8 * len(sections))
+        directory = array("Q")
+        for section in sections:
+            directory.append(position)
+            position = padded(position + len(section))
+        content = bytearray(_SNAPSHOT_HEADER.size)
+        for chunk in [directory.tobytes()] + sections:
+            content += chunk
+            content += b"\x00" * (padded(len(content)) - len(content))
+
+        flags = _SNAPSHOT_FLAG_ATTRIBUTES if all(s.attributes_loaded for s in services) else 0
+        payload = memoryview(content)[_SNAPSHOT_HEADER.size:]
+        _SNAPSHOT_HEADER.pack_into(
+            content, 0, _SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, flags, len(_SNAPSHOT_TEXT_COLUMNS) + len(_SNAPSHOT_INT_COLUMNS),
+            count, catalog.encode("ascii"), len(payload), zlib.crc32(payload)
+        )
+        payload.release()
+        write_bytes_atomic(path, content)
+
+
+class _SnapshotServiceList(Sequence):
+    """Seznam služeb nad snapshotem (náhrada `_services_list` bez dekódování předem)."""
+
+    def __init__(self, snapshot: ServiceSnapshot):
+        self._snapshot = snapshot
+
+    def __len__(self) -> int:
+        return self._snapshot.count
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self._snapshot.service(i) for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return self._snapshot.service(row)
+
+
+class _SnapshotServiceMap(Mapping):
+    """Slovník ID → služba nad snapshotem (náhrada `_services`, vyhledává se v seřazených ID)."""
+
+    def __init__(self, snapshot: ServiceSnapshot):
+        self._snapshot = snapshot
+
+    def __len__(self) -> int:
+        return self._snapshot.count
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._snapshot.read("id", row) for row in range(self._snapshot.count))
+
+    def __getitem__(self, service_id: str) -> GovernmentService:
+        row = self._snapshot.find(service_id)
+        if row is None:
+            raise KeyError(service_id)
+        return self._snapshot.service(row)
+
+
+class GovernmentServicesStorage:
+    """
+    Úložná část GovernmentServicesStore (store z ní dědí):
+      - obsluha služeb ze snapshotu (_open_services_snapshot(), _compact_services(), _materialize_services()),
+      - první načtení (_bootstrap_services(), _run_bootstrap_pipeline()) a jeho žurnál,
+      - obnova katalogu z vektorového indexu (_restore_services_from_index()),
+      - vektorové indexy po modelech (_open_active_index()) a jejich migrace (migrate_embeddings_model()).
+
+    Pracuje se stavem a metodami store: slovníkem `_services` a seznamem `_services_list`
+    (při otevřeném snapshotu jsou jen pohledy do něj), vyhledávacími komponentami `_chroma_client`,
+    `_openai_client`, `_collection`, `_active_model` a `_index_lock` a s kroky načítání, které
+    definuje store (_iter_services_from_external_store(), _apply_service_details(), _upsert_embeddings()…).
+    """
+
+    def __init__(self):
+        # Otevřený snapshot; dokud je nastaven, jsou `_services` a `_services_list` jen pohledy do něj
+        self._snapshot: Optional[ServiceSnapshot] = None
+        self._snapshot_lock = threading.RLock()  # výměna a zavření snapshotu vs. čtení služeb z jiného vlákna
+        self._catalog_version: Optional[str] = None  # otisk katalogu, pro který platí odvozené cache
+        self._migration_thread: Optional[threading.Thread] = None
+        self._migration_status: Dict[str, Any] = {"state": "idle"}
+
+    def _materialize_services(self) -> None:
+        """Dekóduje všechny služby ze snapshotu do běžného slovníku a seznamu a snapshot zavře.
+
+        Volá se před změnou seznamu služeb a před přepsáním souboru snapshotu
+        (na Windows nelze nahradit soubor, který je namapovaný do paměti).
+        """
+        with self._snapshot_lock:
+            if self._snapshot is None:
+                return
+            services = list(self._services_list)
+            for service in services:
+                service.load_all()
+            self._services = {s.id: s for s in services}
+            self._services_list = services
+            self._snapshot.close()
+            self._snapshot = None
+
+    def _close_snapshot(self) -> None:
+        """Zavře otevřený snapshot bez dekódování služeb (volá se při vyprázdnění store)."""
+        with self._snapshot_lock:
+            if self._snapshot is not None:
+                self._snapshot.close()
+                self._snapshot = None
+
+    def _decoded_services(self) -> List[GovernmentService]:
+        """Vrátí kopii seznamu služeb s dekódovanými poli, kterou lze procházet i z jiného vlákna.
+
+        Snapshot se přitom nezavírá, ale po návratu už na něm kopie nezávisí, takže ji
+        _materialize_services() (nebo nové načtení služeb) nemůže rozbít.
+        """
+        with self._snapshot_lock:
+            services = list(self._services_list)
+            if self._snapshot is not None:
+                for service in services:
+                    service.load_all()
+        return services
+
+    def _open_services_snapshot(self) -> bool:
+        """
+        Otevře binární snapshot služeb; vrací False, pokud chybí, je neplatný nebo je k dispozici
+        novější platná JSON cache. Novější, ale poškozená JSON cache (např. rozepsaná) snapshot
+        nevyřadí – JSON se pak přepíše ze snapshotu.
+        """
+        if not SERVICES_SNAPSHOT.exists():
+            return False
+        json_cache = cache_file(SERVICES_CACHE)
+        if json_cache is not None and json_cache.stat().st_mtime > SERVICES_SNAPSHOT.stat().st_mtime:
+            if cache_is_valid(SERVICES_CACHE):
+                print("Debug [_open_services_snapshot]: JSON cache is newer than the snapshot, importing it.")
+                return False
+            print("Warning [_open_services_snapshot]: JSON cache is newer than the snapshot but damaged, keeping the snapshot.")
+        try:
+            snapshot = ServiceSnapshot(SERVICES_SNAPSHOT)
+        except Exception as e:
+            print(f"Warning [_open_services_snapshot]: Failed to open services snapshot, falling back to JSON: {e}")
+            return False
+        self._attach_snapshot(snapshot)
+        self._keyword_index_built = False
+        return True
+
+    def _attach_snapshot(self, snapshot: ServiceSnapshot) -> None:
+        """Začne obsluhovat služby z daného snapshotu (slovník i seznam služeb jsou jen pohledy na něj)."""
+        with self._snapshot_lock:
+            self._snapshot = snapshot
+            self._catalog_version = snapshot.catalog
+            self._services = _SnapshotServiceMap(snapshot)
+            self._services_list = _SnapshotServiceList(snapshot)
+
+    def _compact_services(self) -> None:
+        """
+        Po importu JSON cache nebo po studeném načtení nahradí dekódované služby právě uloženým
+        snapshotem. Texty všech služeb pak leží v jednom namapovaném souboru (UTF-8) a objekty
+        vznikají až pro služby, na které se někdo ptá. Snapshot jiného katalogu se nepoužije.
+        """
+        if self._snapshot is not None or not self._services_list or not SERVICES_SNAPSHOT.exists():
+            return
+        try:
+            snapshot = ServiceSnapshot(SERVICES_SNAPSHOT)
+        except Exception as e:
+            print(f"Warning [_compact_services]: Keeping decoded services, snapshot cannot be opened: {e}")
+            return
+        if snapshot.catalog != (self._catalog_version or catalog_version(self._services_list)) or snapshot.count != len(self._services_list):
+            snapshot.close()
+            return
+        self._attach_snapshot(snapshot)  # index klíčových slov zůstává, katalog je tentýž
+
+    def _write_services_snapshot(self) -> None:
+        """Zapíše aktuální služby do binárního snapshotu (chyba zápisu není fatální, zbývá JSON cache)."""
+        try:
+            ServiceSnapshot.write(SERVICES_SNAPSHOT, list(self._services_list), self._catalog_version or catalog_version(self._services_list))
+        except Exception as e:
+            print(f"Warning [_write_services_snapshot]: Failed to write services snapshot: {e}")
+
+    def _bootstrap_services(self) -> None:
+        """
+        První (studené) načtení služeb rozdělené do etap s kontrolními body na disku:
+          1) enriched – seznam služeb ze SPARQL doplněný o detaily, klíčová slova a atributy úkonů,
+          2) embedded – embeddingy v Chroma (po dávkách, zapisované přes upsert).
+        Etapy neběží po sobě, ale překrývají se (viz _run_bootstrap_pipeline()); stažení
+        a doplnění probíhají zároveň, a proto mají jeden společný kontrolní bod.
+        Po každé etapě se zapíše mezivýsledek a žurnál, takže po pádu (kvóta, síť, Ctrl-C)
+        další start pokračuje od poslední dokončené etapy.
+        """
+        stage = self._read_bootstrap_journal().get("stage")
+        # Bez platného mezivýsledku doplnění se začíná znovu od stažení
+        if stage not in ("enriched", "embedded") or not cache_is_valid(BOOTSTRAP_DIR / "enriched.json"):
+            stage = None
+        if stage:
+            print(f"Debug [_bootstrap_services]: Resuming bootstrap from stage '{stage}'.")
+
+        collection, model = None, None
+        try:
+            self._initialize_search()
+            collection, model = self._get_active_index()
+        except Exception as search_error:
+            print(f"Warning [_bootstrap_services]: Semantic search unavailable, embeddings will be skipped: {search_error}")
+
+        embeddings_complete = self._run_bootstrap_pipeline(stage, collection, model)
+        self._store_services_to_local_cache()
+        if embeddings_complete:
+            self._embeddings_computed = True
+            self._update_bootstrap_journal(stage="embedded")
+            shutil.rmtree(BOOTSTRAP_DIR, ignore_errors=True)
+        else:
+            print("Warning [load_services]: Semantic search will not be available until embeddings are computed manually.")
+            print("Warning [load_services]: Next start will resume computing the missing embeddings.")
+
+    def _run_bootstrap_pipeline(self, stage: Optional[str], collection, model: Optional[str]) -> bool:
+        """
+        Proudové první načtení: služby tečou přes etapy stažení → doplnění → embedding → zápis
+        současně, etapy si je předávají přes omezené fronty (PIPELINE_QUEUE_SIZE).
+
+          - vlákno „fetch“: čte služby ze SPARQL (nebo z mezivýsledku rozpracovaného načtení),
+          - hlavní vlákno: doplňuje detaily a atributy, které se mezitím načítají souběžně na pozadí
+            (služby odebírá z fronty hned; než jsou detaily připravené, drží jen ty, které na ně čekají,
+            a atributy, které dorazí až po službě, doplní dodatečně i do metadat v Chroma),
+          - vlákno „embed“: skládá dávky a volá embedding API,
+          - vlákno „persist“: zapisuje hotové dávky do Chroma a do žurnálu.
+
+        Síťové čekání, parsování detailů a volání API se tak překrývají. Chyba embeddingů
+        není fatální – služby se načtou a chybějící embeddingy se dopočítají při dalším startu.
+
+        Returns:
+            True, pokud jsou v Chroma embeddingy všech služeb.
+        """
+        enrich = stage is None
+
+        stop = threading.Event()
+        errors: Dict[str, Exception] = {}
+        fetched_queue: "queue.Queue" = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        embed_queue: "queue.Queue" = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        persist_queue: "queue.Queue" = queue.Queue(maxsize=max(1, PIPELINE_QUEUE_SIZE // EMBEDDING_BATCH_SIZE))
+
+        def put(q: "queue.Queue", item: Any) -> None:
+            # Blokující vložení, které se vzdá, pokud jiná etapa selhala
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def get(q: "queue.Queue") -> Any:
+            # Blokující čtení, které vrátí konec proudu, pokud jiná etapa selhala
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _PIPELINE_DONE
+
+        def fetch_stage() -> None:
+            try:
+                for service in (self._iter_services_from_external_store() if enrich else self._iter_bootstrap_checkpoint("enriched")):
+                    put(fetched_queue, service)
+            except Exception as e:
+                errors["fetch"] = e
+            finally:
+                put(fetched_queue, _PIPELINE_DONE)
+
+        existing_ids: Set[str] = set()
+        if collection is not None:
+            existing_ids = set(collection.get(include=[])['ids'])
+
+        def embed_stage() -> None:
+            batch: List[GovernmentService] = []
+
+            def flush() -> None:
+                texts = [self._service_embedding_text(s) for s in batch]
+                response = self._openai_client.embeddings.create(input=texts, model=model)
+                put(persist_queue, (list(batch), [e.embedding for e in response.data], texts))
+                batch.clear()
+
+            try:
+                while True:
+                    service = get(embed_queue)
+                    if service is _PIPELINE_DONE:
+                        break
+                    if "embed" in errors or service.id in existing_ids:
+                        continue  # po chybě jen vyprázdníme frontu, aby doplňování doběhlo
+                    batch.append(service)
+                    if len(batch) >= EMBEDDING_BATCH_SIZE:
+                        try:
+                            flush()
+                        except Exception as e:
+                            errors["embed"] = e
+                if batch and "embed" not in errors:
+                    flush()
+            except Exception as e:
+                errors["embed"] = e
+            except BaseException as e:
+                errors["embed"] = e
+                stop.set()  # přerušení (např. Ctrl-C) ukončí celé načítání
+            finally:
+                put(persist_queue, _PIPELINE_DONE)
+
+        def persist_stage() -> None:
+            embedded = len(existing_ids)
+            while True:
+                item = get(persist_queue)
+                if item is _PIPELINE_DONE:
+                    break
+                if "persist" in errors:
+                    continue
+                batch, embeddings, texts = item
+                try:
+                    self._upsert_embeddings(collection, batch, embeddings, texts)
+                    embedded += len(batch)
+                    self._update_bootstrap_journal(embedded=embedded)
+                    print(f"Debug [_run_bootstrap_pipeline]: Persisted embeddings for {embedded} services.")
+                except Exception as e:
+                    errors["persist"] = e
+
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="bootstrap-enrich") as enrich_pool:
+            details_future = enrich_pool.submit(self._get_details_index) if enrich else None
+            attributes_future = enrich_pool.submit(self._fetch_services_attributes) if enrich else None
+
+            workers = [threading.Thread(target=fetch_stage, name="bootstrap-fetch", daemon=True)]
+            if collection is not None:
+                workers.append(threading.Thread(target=embed_stage, name="bootstrap-embed", daemon=True))
+                workers.append(threading.Thread(target=persist_stage, name="bootstrap-persist", daemon=True))
+            for worker in workers:
+                worker.start()
+
+            try:
+                details_index: Optional[Dict[str, dict]] = None if enrich else {}
+                attributes: Optional[Dict[str, Tuple[int, int, List[str]]]] = None
+                attributes_pending = enrich
+                # Služby čekající na detaily (ty jsou potřeba už pro text embeddingu)
+                waiting: List[GovernmentService] = []
+
+                def forward(service: GovernmentService) -> None:
+                    if service.id in details_index:
+                        self._apply_service_details(service, details_index[service.id])
+                    if attributes is not None:
+                        self._apply_service_attributes(service, attributes)
+                    self.add_service(service)
+                    if collection is not None:
+                        put(embed_queue, service)
+
+                def take_attributes(block: bool) -> None:
+                    nonlocal attributes, attributes_pending
+                    if not attributes_pending or not (block or attributes_future.done()):
+                        return
+                    attributes_pending = False
+                    try:
+                        attributes = attributes_future.result()
+                    except Exception as attributes_error:
+                        print(f"Warning [_run_bootstrap_pipeline]: Failed to load service attributes: {attributes_error}")
+
+                while True:
+                    service = get(fetched_queue)
+                    if service is _PIPELINE_DONE:
+                        break
+                    take_attributes(block=False)
+                    if details_index is None and details_future.done():
+                        details_index = details_future.result()
+                        for waiting_service in waiting:
+                            forward(waiting_service)
+                        waiting.clear()
+                    if details_index is None:
+                        waiting.append(service)
+                    else:
+                        forward(service)
+
+                if details_index is None:
+                    details_index = details_future.result()
+                take_attributes(block=True)
+                for waiting_service in waiting:
+                    forward(waiting_service)
+                waiting.clear()
+
+                late_attributes = False
+                if enrich and "fetch" not in errors and not stop.is_set():
+                    # Atributy, které dorazily až po službách, se doplní dodatečně
+                    if attributes is not None:
+                        for service in self._services_list:
+                            if not service.attributes_loaded:
+                                self._apply_service_attributes(service, attributes)
+                                late_attributes = True
+                    # Mezivýsledek je hotový dřív než embeddingy, které se mezitím dál počítají
+                    self._write_bootstrap_checkpoint("enriched")
+            except BaseException:
+                stop.set()
+                raise
+            finally:
+                if collection is not None:
+                    put(embed_queue, _PIPELINE_DONE)
+                for worker in workers:
+                    worker.join()
+
+        for error in errors.values():
+            if not isinstance(error, Exception):
+                raise error
+        if "fetch" in errors:
+            raise errors["fetch"]
+        if late_attributes and collection is not None:
+            self._sync_index_metadata()
+
+        for stage_name in ("embed", "persist"):
+            if stage_name in errors:
+                print(f"Warning [_run_bootstrap_pipeline]: Failed to compute embeddings ({stage_name}): {errors[stage_name]}")
+        if collection is not None:
+            self._bump_index_generation()
+        return collection is not None and not errors
+
+    def _resume_bootstrap_embeddings(self) -> None:
+        """Dopočítá chybějící embeddingy; po úspěchu uzavře žurnál a smaže mezivýsledky."""
+        try:
+            print("Debug [load_services]: Computing embeddings for semantic search...")
+            self._compute_services_embeddings()
+        except Exception as embedding_error:
+            print(f"Warning [load_services]: Failed to compute embeddings: {embedding_error}")
+            print("Warning [load_services]: Semantic search will not be available until embeddings are computed manually.")
+            print("Warning [load_services]: Next start will resume computing the missing embeddings.")
+            return
+        self._update_bootstrap_journal(stage="embedded")
+        shutil.rmtree(BOOTSTRAP_DIR, ignore_errors=True)
+
+    @staticmethod
+    def _read_bootstrap_journal() -> Dict[str, Any]:
+        """Vrátí obsah žurnálu rozpracovaného načtení (nebo prázdný slovník)."""
+        if not BOOTSTRAP_JOURNAL.exists():
+            return {}
+        try:
+            with open(BOOTSTRAP_JOURNAL, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Warning [_read_bootstrap_journal]: Ignoring unreadable journal: {e}")
+            return {}
+
+    def _update_bootstrap_journal(self, **changes: Any) -> None:
+        """Doplní do žurnálu změněné položky (zápis je atomický)."""
+        with _BOOTSTRAP_JOURNAL_LOCK:
+            journal = self._read_bootstrap_journal()
+            journal.update(changes)
+            write_json_atomic(BOOTSTRAP_JOURNAL, journal)
+
+    def _write_bootstrap_checkpoint(self, stage: str, services: Optional[List[GovernmentService]] = None) -> None:
+        """Uloží služby (výchozí: všechny načtené) jako mezivýsledek dané etapy a zapíše ji do žurnálu."""
+        services = self._services_list if services is None else services
+        write_cache(BOOTSTRAP_DIR / f"{stage}.json", [service_to_dict(s) for s in services])
+        self._update_bootstrap_journal(stage=stage, services=len(services))
+        print(f"Debug [_write_bootstrap_checkpoint]: Stage '{stage}' checkpointed ({len(services)} services).")
+
+    @staticmethod
+    def _iter_bootstrap_checkpoint(stage: str) -> Iterator[GovernmentService]:
+        """Postupně vrací služby z mezivýsledku dané etapy."""
+        for item in read_cache(BOOTSTRAP_DIR / f"{stage}.json"):
+            yield GovernmentService(**item)
+
+    def _restore_services_from_index(self) -> bool:
+        """
+        Obnoví katalog z metadat uložených v Chroma – bez SPARQL a bez přepočtu embeddingů.
+        Klíčová slova doplní z projekce detailů. V režimu CHROMA_LEAN_INDEX to nejde (chybí popisy).
+
+        Returns:
+            True, pokud se katalog podařilo obnovit.
+        """
+        try:
+            self._initialize_search()
+            collection, _ = self._get_active_index()
+            data = collection.get(include=["metadatas"])
+        except Exception as e:
+            print(f"Warning [_restore_services_from_index]: Vector index unavailable: {e}")
+            return False
+        if not data['ids'] or any(not m or "description" not in m for m in data['metadatas']):
+            print("Debug [_restore_services_from_index]: Vector index does not hold full service metadata, cannot restore from it.")
+            return False
+
+        details_index = self._get_details_index()
+        for service_id, metadata in zip(data['ids'], data['metadatas']):
+            keywords = [kw['cs'] for kw in details_index.get(service_id, {}).get('klíčová-slova', [])]
+            service = GovernmentService(
+                uri=SERVICE_URI_PREFIX + service_id,
+                id=service_id,
+                name=metadata.get("name", ""),
+                description=metadata["description"],
+                keywords=keywords
+            )
+            if "step_count" in metadata:
+                service.step_count = metadata["step_count"]
+                service.digital_step_count = metadata["digital_step_count"]
+                service.channel_types = sorted(key[len("channel_"):] for key, value in metadata.items() if key.startswith("channel_") and value)
+            self.add_service(service)
+        self._embeddings_computed = True
+        print(f"Debug [_restore_services_from_index]: Restored {len(self._services_list)} services from the vector index.")
+        return True
+
+    def _get_active_index(self) -> Tuple[Any, str]:
+        """Vrátí konzistentní dvojici (aktivní kolekce, její embedding model)."""
+        with self._index_lock:
+            return self._collection, self._active_model
+
+    def _open_active_index(self) -> Tuple[Any, str]:
+        """Otevře kolekci podle ukazatele; bez ukazatele převezme starou kolekci nebo založí novou."""
+        if ACTIVE_INDEX_PATH.exists():
+            try:
+                with open(ACTIVE_INDEX_PATH, "r", encoding="utf-8") as f:
+                    pointer = json.load(f)
+                return self._chroma_client.get_collection(pointer["collection"]), pointer["model"]
+            except Exception as e:
+                print(f"Warning [_open_active_index]: Invalid active index pointer, recreating it: {e}")
+
+        try:
+            legacy = self._chroma_client.get_collection(LEGACY_COLLECTION_NAME)
+        except Exception:
+            legacy = None
+        if legacy is not None and legacy.count() > 0:
+            # Stará kolekce nemá model zaznamenaný – předpokládáme aktuálně nastavený model
+            sample = legacy.get(limit=1, include=["embeddings"])
+            dimension = len(sample['embeddings'][0])
+            model = (legacy.metadata or {}).get("embeddings_model", EMBEDDINGS_MODEL)
+            self._write_active_index_pointer(LEGACY_COLLECTION_NAME, model, dimension)
+            return legacy, model
+
+        dimension = self._embedding_dimension(EMBEDDINGS_MODEL)
+        collection = self._get_or_create_index_collection(EMBEDDINGS_MODEL, dimension)
+        self._write_active_index_pointer(collection.name, EMBEDDINGS_MODEL, dimension)
+        return collection, EMBEDDINGS_MODEL
+
+    def _embedding_dimension(self, model: str) -> int:
+        """Vrátí dimenzi embeddingů daného modelu (u neznámých modelů zkušebním voláním API)."""
+        if model in EMBEDDING_DIMENSIONS:
+            return EMBEDDING_DIMENSIONS[model]
+        probe = self._openai_client.embeddings.create(input=["dimension probe"], model=model)
+        return len(probe.data[0].embedding)
+
+    def _get_or_create_index_collection(self, model: str, dimension: int):
+        """Vrátí kolekci pro daný model a dimenzi; model a dimenzi zaznamená do metadat kolekce."""
+        return self._chroma_client.get_or_create_collection(
+            _index_collection_name(model, dimension),
+            metadata={"embeddings_model": model, "dimension": dimension}
+        )
+
+    @staticmethod
+    def _write_active_index_pointer(collection_name: str, model: str, dimension: int) -> None:
+        """Atomicky přepíše ukazatel na aktivní kolekci."""
+        write_json_atomic(ACTIVE_INDEX_PATH, {"collection": collection_name, "model": model, "dimension": dimension})
+
+    def migrate_embeddings_model(self, model: str = EMBEDDINGS_MODEL, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Postaví index pro nový embedding model a po jeho dokončení na něj atomicky přepne vyhledávání.
+
+        Během stavby se vyhledává ze stávajícího indexu. Stará kolekce zůstává v Chroma
+        (lze se na ni vrátit), přerušenou migraci stačí spustit znovu – hotové dávky se přeskočí.
+
+        Args:
+            model: Cílový embedding model.
+            background: True = běží ve vlákně na pozadí (vrací vlákno), False = čeká na dokončení.
+        """
+        if not self._services_list:
+            raise RuntimeError("Warning [migrate_embeddings_model]: No services loaded, nothing to index.")
+        if not self._collection:
+            self._initialize_search()
+
+        with self._index_lock:
+            if self._migration_status["state"] == "running":
+                print("Warning [migrate_embeddings_model]: Migration already running.")
+                return self._migration_thread
+            self._migration_status = {"state": "running", "target_model": model, "embedded": 0, "total": len(self._services_list), "error": None}
+
+        if not background:
+            self._run_index_migration(model)
+            return None
+        self._migration_thread = threading.Thread(target=self._run_index_migration, args=(model,), name="embeddings-migration", daemon=True)
+        self._migration_thread.start()
+        return self._migration_thread
+
+    def _run_index_migration(self, model: str) -> None:
+        """Tělo migrace: spočítá embeddingy do nové kolekce a přepne na ni ukazatel i vyhledávání."""
+        try:
+            dimension = self._embedding_dimension(model)
+            target = self._get_or_create_index_collection(model, dimension)
+            self._embed_services_into(target, model, progress=self._migration_status)
+            with self._index_lock:
+                self._write_active_index_pointer(target.name, model, dimension)
+                self._collection = target
+                self._active_model = model
+            self._index_metadata_checked = False
+            self._bump_index_generation()
+            self._migration_status["state"] = "done"
+            print(f"Debug [_run_index_migration]: Search switched to index '{target.name}'.")
+        except Exception as e:
+            self._migration_status.update(state="failed", error=str(e))
+            print(f"Warning [_run_index_migration]: Migration to '{model}' failed, search stays on the old index: {e}")
+
+    def get_index_migration_status(self) -> Dict[str, Any]:
+        """Vrátí stav migrace indexu (idle/running/done/failed) a její průběh."""
+        return dict(self._migration_status)
@@ -0,0 +1,84 @@
+"""
+Prompt Builder - skládání vstupu pro Responses API tak, aby fungoval prompt caching u poskytovatele.
+
+Poskytovatel (OpenAI) si pamatuje začátek promptu a při dalším volání se stejným začátkem ho
+nepočítá znovu: odpověď začne chodit dřív a tokeny z cache jsou levnější. Musí ale jít o shodu
+bajt po bajtu od úplného začátku a prefix musí mít aspoň 1024 tokenů. Proto se vstup vždy skládá
+ve stejném pořadí od nejstabilnějších částí po nejproměnlivější:
+
+  1) společné instrukce  – stejné pro všechna volání aplikace
+  2) kontext             – XML <sluzby> (služby seřazené podle ID, viz pack_services_context(stable_order=True))
+  3) instrukce úlohy     – co má model v tomto konkrétním volání udělat
+  4) konverzace          – dotaz uživatele a další zprávy, které se mění s každým kolem
+
+Volání nad stejnými službami (např. vysvětlení služeb a pak návrh postupu) tak sdílejí prefix
+1) + 2), i když se liší úlohou i dotazem. Kolik tokenů se opravdu vzalo z cache, vypíše
+record_usage() z odpovědi (usage.input_tokens_details.cached_tokens).
+
+Modul sdílejí kapitoly 8–10; leží ve složce shared/, kterou do sys.path přidá import government_services_store.
+"""
+
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+Message = Dict[str, str]
+
+
+def build_input(shared_instructions: Sequence[str], context: Optional[str] = None, task_instructions: Sequence[str] = (),
+                conversation: Iterable[Message] = ()) -> Dict[str, Any]:
+    """
+    Sestaví argumenty `input` a `prompt_cache_key` pro client.responses.create()/parse().
+
+    Args:
+        shared_instructions: Instrukce společné všem voláním (developer zprávy); musí být pokaždé stejné.
+        context: Kontext pro model (typicky XML <sluzby>); None = bez kontextu.
+        task_instructions: Instrukce konkrétní úlohy (developer zprávy).
+        conversation: Zprávy konverzace (role + content) v pořadí, v jakém proběhly.
+
+    Returns:
+        Slovník pro rozbalení do volání: client.responses.parse(model=..., **build_input(...), ...).
+    """
+    messages: List[Message] = [{"role": "developer", "content": text} for text in shared_instructions]
+    if context is not None:
+        messages.append({"role": "developer", "content": context})
+    messages.extend({"role": "developer", "content": text} for text in task_instructions)
+    messages.extend(conversation)
+    return {"input": messages, "prompt_cache_key": prompt_cache_key(shared_instructions, context)}
+
+
+def prompt_cache_key(shared_instructions: Sequence[str], context: Optional[str] = None) -> str:
+    """
+    Klíč, podle kterého poskytovatel směruje požadavky se stejným začátkem promptu na stejný cache server.
+
+    Odvozuje se jen ze stabilního prefixu (společné instrukce + kontext), takže ho sdílejí všechna
+    volání, která mají šanci na zásah do cache.
+    """
+    digest = hashlib.sha256()
+    for part in (*shared_instructions, context or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return f"sluzby-{digest.hexdigest()[:16]}"
+
+
+def record_usage(call_name: str, response: Any) -> Dict[str, Any]:
+    """
+    Vypíše využití tokenů jednoho volání Responses API včetně tokenů z prompt cache.
+
+    Args:
+        call_name: Název volání pro výpis (např. název funkce v main.py).
+        response: Odpověď z client.responses.create()/parse().
+
+    Returns:
+        Záznam {call, input_tokens, cached_tokens, output_tokens}.
+    """
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "input_tokens_details", None)
+    record = {
+        "call": call_name,
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+    }
+    print(f"Debug [{call_name}]: {record['input_tokens']} input tokens ({record['cached_tokens']} cached), {record['output_tokens']} output tokens")
+    return record
+